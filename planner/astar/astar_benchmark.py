@@ -0,0 +1,227 @@
+import datetime
+import tracemalloc
+
+import numpy as np
+
+from planner.astar import astar_grid48con, base
+from planner.astar.base import NoPathException
+
+
+def rand_coords(x, y, rand):
+    return (rand.randint(0, x),
+            rand.randint(0, y))
+
+
+def get_problem(size, t_factor=2, fill=.3, seed=0):
+    """A random space-time grid with start and goal in free cells"""
+    rand = np.random.RandomState(seed)
+    _grid = np.zeros([size, size, size * t_factor])
+    for i in range(int(np.round(pow(size, 2) * fill))):
+        _grid[rand_coords(size, size, rand)] = -1
+
+    start = (rand_coords(size, size, rand) + (0,))
+    while _grid[start] == -1:
+        start = (rand_coords(size, size, rand) + (0,))
+
+    goal = (rand_coords(size, size, rand) + (size * t_factor - 1,))
+    while _grid[goal] == -1:
+        goal = (rand_coords(size, size, rand) + (size * t_factor - 1,))
+    return start, goal, _grid
+
+
+def astar_base_list(start, goal, map, heuristic, reconstruct_path, get_children, cost):
+    """The original `base.astar_base` with list based open and closed sets, to compare against"""
+    start_int = (int(start[0]),
+                 int(start[1]),
+                 int(start[2]))
+
+    start = start_int
+
+    have_map = np.max(map) > 0  # having a costmap
+    # The set of nodes already evaluated.
+    closed = []
+    # The set of currently discovered nodes still to be evaluated.
+    # Initially, only the start node is known.
+    open = [start]
+    # For each node, which node it can most efficiently be reached from.
+    # If a node can be reached from many nodes, cameFrom will eventually contain the
+    # most efficient previous step.
+    came_from = {}
+
+    # For each node, the cost of getting from the start node to that node.
+    g_score = np.full(map.shape, np.Inf)
+    # The cost of going from start to start is zero.
+    g_score[start] = 0
+    # For each node, the total cost of getting from the start node to the goal
+    # by passing by that node. That value is partly known, partly heuristic.
+    f_score = np.full(map.shape, np.Inf)
+    # For the first node, that value is completely heuristic.
+    f_score[start] = heuristic(start, goal, map if have_map else False)
+
+    f_score_open = np.array([])
+    f_score_open = np.append(f_score_open, f_score[start])
+
+    while len(open) > 0:
+        current = argmin_f_open(open, f_score_open)  # the node in openSet having the lowest fScore[] value
+
+        if current[0:2] == goal[0:2]:  # waiting at the goal for free
+            return reconstruct_path(came_from, current)
+
+        i_rm = open.index(current)
+        open.remove(current)
+        f_score_open = np.delete(f_score_open, i_rm)
+
+        closed.append(current)
+        children = get_children(current, map)
+        for neighbor in children:
+            if neighbor in closed:
+                continue  # Ignore the neighbor which is already evaluated.
+            # The distance from start to a neighbor
+            tentative_g_score = g_score[current] + cost(current, neighbor, map if have_map else False)
+
+            append = True
+            if neighbor not in open:  # Discover a new node
+                open.append(neighbor)
+            elif tentative_g_score >= g_score[neighbor]:
+                continue  # This is not a better path.
+            else:
+                append = False
+
+            # This path is the best until now. Record it!
+            came_from[neighbor] = current
+            g_score[neighbor] = tentative_g_score
+            f_score[neighbor] = g_score[neighbor] + heuristic(neighbor, goal, map if have_map else False)
+
+            if append:
+                f_score_open = np.append(f_score_open, f_score[neighbor])
+    raise NoPathException("Can not find a path")
+
+
+def argmin_f_open(open, f_score_open):
+    assert len(open) == len(f_score_open), "Lenghts must be equal"
+    return open[np.argmin(f_score_open)]
+
+
+def astar_list(start, goal, _grid):
+    return astar_base_list(start, goal, _grid,
+                           astar_grid48con.heuristic,
+                           astar_grid48con.reconstruct_path,
+                           astar_grid48con.get_children,
+                           astar_grid48con.cost)
+
+
+def astar_heap(start, goal, _grid):
+    """astar_base with the euclidean heuristic, to compare the open sets only"""
+    return base.astar_base(start, goal, _grid,
+                           astar_grid48con.heuristic,
+                           astar_grid48con.reconstruct_path,
+                           astar_grid48con.get_children,
+                           astar_grid48con.cost)
+
+
+def run_memory(fun, start, goal, _grid):
+    """Peak of memory allocated while running one query [bytes]"""
+    tracemalloc.start()
+    try:
+        fun(start, goal, _grid)
+    except NoPathException:
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(fun, start, goal, _grid):
+    startt = datetime.datetime.now()
+    try:
+        path = fun(start, goal, _grid)
+    except NoPathException:
+        path = []
+    return path, (datetime.datetime.now() - startt).total_seconds()
+
+
+def compare_open_sets(sizes=(25, 50, 100), samples=3):
+    """Compare the heap based astar_base against the list based original on random space-time grids
+
+    Returns:
+      durations as array [sizes, samples, (list, heap)]
+    """
+    ts = np.zeros([len(sizes), samples, 2])
+    for i_size, size in enumerate(sizes):
+        for i_s in range(samples):
+            start, goal, _grid = get_problem(size, seed=i_s)
+            path_list, ts[i_size, i_s, 0] = run(astar_list, start, goal, _grid)
+            path_heap, ts[i_size, i_s, 1] = run(astar_heap, start, goal, _grid)
+            assert path_list == path_heap, "Paths differ for size %d, seed %d" % (size, i_s)
+        print("size %4d: list %8.4fs | heap %8.4fs" % (
+            size, np.mean(ts[i_size, :, 0]), np.mean(ts[i_size, :, 1])))
+    return ts
+
+
+def compare_heuristics(sizes=(25, 50, 100), samples=3):
+    """Compare the euclidean heuristic against the cached distance field of astar_grid4con
+
+    Returns:
+      durations as array [sizes, samples, (euclidean, distance field)]
+    """
+    ts = np.zeros([len(sizes), samples, 2])
+    for i_size, size in enumerate(sizes):
+        for i_s in range(samples):
+            start, goal, _grid = get_problem(size, seed=i_s)
+            path_euclid, ts[i_size, i_s, 0] = run(astar_heap, start, goal, _grid)
+            path_field, ts[i_size, i_s, 1] = run(astar_grid48con.astar_grid4con, start, goal, _grid)
+            assert len(path_euclid) == len(path_field), "Path lengths differ for size %d, seed %d" % (size, i_s)
+        print("size %4d: euclidean %8.4fs | distance field %8.4fs" % (
+            size, np.mean(ts[i_size, :, 0]), np.mean(ts[i_size, :, 1])))
+    return ts
+
+
+def compare_children(size=100, n=100000, seed=0):
+    """Expansions per second of the neighbor generation: get_children against NeighborTable
+
+    Returns:
+      expansions per second as (get_children, NeighborTable)
+    """
+    start, goal, _grid = get_problem(size, seed=seed)
+    rand = np.random.RandomState(seed)
+    nodes = list(zip(rand.randint(0, size, n).tolist(),
+                     rand.randint(0, size, n).tolist(),
+                     rand.randint(0, _grid.shape[2], n).tolist()))
+    table = astar_grid48con.neighbor_table(_grid)
+    res = []
+    for get_children in [astar_grid48con.get_children, table]:
+        startt = datetime.datetime.now()
+        for node in nodes:
+            get_children(node, _grid)
+        res.append(n / (datetime.datetime.now() - startt).total_seconds())
+    for node in nodes[:1000]:
+        assert astar_grid48con.get_children(node, _grid) == table(node, _grid), "Children differ for " + str(node)
+    print("size %4d: get_children %10.0f/s | NeighborTable %10.0f/s expansions" % (size, res[0], res[1]))
+    return tuple(res)
+
+
+def compare_memory(sizes=(50, 100, 200), t_factor=2, samples=3):
+    """Memory per query of astar_base against the dense score arrays of the list based original
+
+    Returns:
+      peak memory in bytes as array [sizes, samples, (list, heap)]
+    """
+    mem = np.zeros([len(sizes), samples, 2])
+    for i_size, size in enumerate(sizes):
+        for i_s in range(samples):
+            start, goal, _grid = get_problem(size, t_factor=t_factor, seed=i_s)
+            # the list based version is too slow on long paths, we only care for its allocations here
+            goal = (min(start[0] + 3, size - 1), start[1], goal[2])
+            _grid[goal[0], goal[1], :] = 0
+            mem[i_size, i_s, 0] = run_memory(astar_list, start, goal, _grid)
+            mem[i_size, i_s, 1] = run_memory(astar_grid48con.astar_grid4con, start, goal, _grid)
+        print("size %4d (grid %8.1fMB): list %8.3fMB | sparse %8.3fMB per query" % (
+            size, _grid.nbytes / 1E6, np.mean(mem[i_size, :, 0]) / 1E6, np.mean(mem[i_size, :, 1]) / 1E6))
+    return mem
+
+
+if __name__ == "__main__":
+    compare_open_sets()
+    compare_heuristics()
+    compare_children()
+    compare_memory()
@@ -1,7 +1,27 @@
+import hashlib
+import weakref
+from heapq import heappush, heappop
+from itertools import count
+
 import numpy as np
 
 from planner.astar import base
 
+MAX_HEURISTIC_FIELDS = 1000
+MAX_GRIDS = 8
+
+_heuristic_fields = {}  # distance fields per (static layer, goal)
+_per_grid = {}  # precomputed data per grid in memory, see per_grid()
+_grid_copies = {}  # id -> (grid, private copy of its content, version), see grid_version()
+_versions = count(1)
+
+
+def clear_caches():
+    """Forget the distance fields and the data precomputed per grid (i.e. for cold benchmarks)"""
+    _heuristic_fields.clear()
+    _per_grid.clear()
+    _grid_copies.clear()
+
 
 def reconstruct_path(came_from, current):
     total_path = [current]
@@ -35,8 +55,243 @@ def get_children(current, grid):
     return _children
 
 
+def per_grid(name: str, grid: np.array, build):
+    """
+    Precomputed data for a grid that is reused as long as the very same grid memory is alive and unchanged.
+    Views on the same memory (i.e. `swapaxes`) share their entries, changing the grid in place makes
+    them stale (see `grid_version`).
+
+    Args:
+      name: what is stored
+      grid: the map (2D-space + time)
+      build: function to make the data from the grid
+
+    Returns:
+      the data
+    """
+    owner = grid if grid.base is None else grid.base
+    content = owner if isinstance(owner, np.ndarray) else grid
+    key = (name, grid.__array_interface__['data'][0], grid.shape, grid.strides)
+    version = grid_version(content)
+    if key in _per_grid:
+        ref, data_version, data = _per_grid[key]
+        if ref() is owner and data_version == version:
+            return data
+        del _per_grid[key]  # the memory was reused by another grid or changed
+    data = build(grid)
+    try:
+        ref = weakref.ref(owner)
+    except TypeError:  # can not make sure this is the same grid next time
+        return data
+    if len(_per_grid) >= MAX_GRIDS:
+        del _per_grid[next(iter(_per_grid))]  # the oldest one
+    _per_grid[key] = (ref, version, data)
+    return data
+
+
+def grid_version(grid: np.array) -> int:
+    """
+    Version of the content of a grid, that changes when the grid is changed in place.
+    A private copy of the grid is compared to its content on every call, except for grids that can not be
+    written (like the shared grids of the workers, see `planner.shared_grid`).
+
+    Args:
+      grid: the map (2D-space + time)
+
+    Returns:
+      the version (0 for grids that can not be written)
+    """
+    if not grid.flags.writeable:
+        return 0
+    ref, copy, version = _grid_copies.get(id(grid), (None, None, None))
+    if ref is not None and ref() is grid and equal_content(grid, copy):
+        return version
+    version = next(_versions)
+    _grid_copies.pop(id(grid), None)
+    if len(_grid_copies) >= MAX_GRIDS:
+        del _grid_copies[next(iter(_grid_copies))]  # the oldest one
+    _grid_copies[id(grid)] = (weakref.ref(grid), grid.copy(order='K'), version)
+    return version
+
+
+def equal_content(a: np.array, b: np.array, chunk: int = 1 << 16) -> bool:
+    """Whether two arrays of the same shape are equal, compared chunk by chunk to not allocate a grid sized mask"""
+    a = a.ravel(order='K')
+    b = b.ravel(order='K')
+    for i in range(0, a.size, chunk):
+        if not np.array_equal(a[i:i + chunk], b[i:i + chunk]):
+            return False
+    return True
+
+
+class NeighborTable(object):
+    """
+    Children of nodes in a 4-connected space-time grid, can be used as `get_children(current, grid)`.
+    The obstacles are precomputed as flat mask that is padded by one blocked cell around the space and
+    one blocked time step at the end. So the children are found by adding integer offsets to the index
+    of the current node without any border checks.
+    """
+    DS = ((-1, 0), (0, -1), (0, 1), (1, 0), (0, 0))  # same order as get_children
+
+    def __init__(self, grid: np.array):
+        size_x, size_y, size_t = grid.shape
+        free = np.zeros([size_x + 2, size_y + 2, size_t + 1], dtype=np.uint8)
+        for t in range(size_t):  # slice by slice to not copy the whole grid
+            free[1:-1, 1:-1, t] = grid[:, :, t] >= 0
+        self.free = free.tobytes()
+        self.stride_x = (size_y + 2) * (size_t + 1)
+        self.stride_y = size_t + 1
+        self.offsets = tuple((dx, dy, dx * self.stride_x + dy * self.stride_y + 1) for dx, dy in self.DS)
+
+    def __call__(self, current, grid=None):
+        x, y, t = current
+        i = (x + 1) * self.stride_x + (y + 1) * self.stride_y + t
+        free = self.free
+        return [(x + dx, y + dy, t + 1) for dx, dy, o in self.offsets if free[i + o]]
+
+
+def neighbor_table(grid: np.array) -> NeighborTable:
+    return per_grid('neighbor_table', grid, NeighborTable)
+
+
+class ReservationTable(object):
+    """
+    Vertices and edges of a space-time grid reserved for others, consulted by the search at expansion time.
+    This way the grid itself does not have to be changed for constraints.
+    """
+
+    def __init__(self, vertices=(), edges=()):
+        """
+        Args:
+          vertices: blocked vertices (x, y, t)
+          edges: blocked edges ((x, y), (x, y), t) for traveling between the two cells from t to t + 1
+            (in either direction)
+        """
+        self.vertices = set(vertices)
+        self.edges = set()
+        for a, b, t in edges:
+            self.edges.add((a, b, t))
+            self.edges.add((b, a, t))
+
+    def __len__(self):
+        return len(self.vertices) + len(self.edges)
+
+    def constrain(self, get_children):
+        """A get_children function that only returns children not reserved"""
+        vertices = self.vertices
+        edges = self.edges
+
+        def get_children_constrained(current, grid):
+            return [c for c in get_children(current, grid)
+                    if c not in vertices and (current[0:2], c[0:2], current[2]) not in edges]
+
+        return get_children_constrained
+
+
+def static_layer(grid: np.array) -> np.array:
+    """
+    The time invariant part of a space-time grid
+
+    Args:
+      grid: the map (2D-space + time)
+
+    Returns:
+      cost of leaving each cell that holds for all times, np.Inf where a cell is blocked all the time
+    """
+    if np.max(grid) > 0:  # costmap values
+        layer = np.full(grid.shape[0:2], np.Inf)
+        for t in range(grid.shape[2]):  # slice by slice to not copy the whole grid
+            np.minimum(layer, np.where(grid[:, :, t] >= 0, grid[:, :, t], np.Inf), out=layer)
+        return layer
+    else:
+        return step_layer(grid)
+
+
+def step_layer(grid: np.array) -> np.array:
+    """Like `static_layer` but leaving a cell is one step, also on costmaps"""
+    return np.where(np.max(grid, axis=2) >= 0, 1., np.Inf)
+
+
+def static_layers(grid: np.array) -> dict:
+    """
+    The `static_layer` (in costs, 'costs') and the `step_layer` ('steps') of a grid (the same one without costs),
+    each with the hash of its content to share the distance fields of equal layers
+    """
+    layer = static_layer(grid)
+    hashed = (layer, hashlib.md5(layer.tobytes()).hexdigest())
+    if np.max(grid) > 0:  # costmap values
+        steps = step_layer(grid)
+        return {'costs': hashed, 'steps': (steps, hashlib.md5(steps.tobytes()).hexdigest())}
+    return {'costs': hashed, 'steps': hashed}
+
+
+def reverse_dijkstra(layer: np.array, goal: tuple) -> np.array:
+    """
+    Distances of all cells to the goal on a 4-connected 2D layer
+
+    Args:
+      layer: cost of leaving each cell (np.Inf for obstacles)
+      goal: spatial goal coordinates
+
+    Returns:
+      the distance field (np.Inf where the goal can not be reached)
+    """
+    size_x, size_y = layer.shape
+    costs = layer.tolist()
+    dist = np.full(layer.shape, np.Inf).tolist()
+    dist[goal[0]][goal[1]] = 0
+    open = [(0, goal[0], goal[1])]
+    while len(open) > 0:
+        d, x, y = heappop(open)
+        if d > dist[x][y]:
+            continue  # outdated entry
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= nx < size_x and 0 <= ny < size_y:
+                nd = d + costs[nx][ny]
+                if nd < dist[nx][ny]:
+                    dist[nx][ny] = nd
+                    heappush(open, (nd, nx, ny))
+    return np.array(dist)
+
+
+def heuristic_field(grid: np.array, goal: tuple, steps: bool = False) -> np.array:
+    """
+    True distance to the goal on the time invariant layer of the grid.
+    This is cached per (layer, goal) to be reused for all space-time queries to this goal.
+
+    Args:
+      grid: the map (2D-space + time)
+      goal: the goal to plan to
+      steps: distance in steps instead of the costs of a costmap (the same on maps without costs)
+
+    Returns:
+      the distance field
+    """
+    return cached_field(grid, goal, steps)[0]
+
+
+def heuristic_lookup(grid: np.array, goal: tuple) -> list:
+    """The `heuristic_field` as nested lists, which are faster to index per node"""
+    return cached_field(grid, goal)[1]
+
+
+def cached_field(grid: np.array, goal: tuple, steps: bool = False) -> tuple:
+    """The distance field of `heuristic_field` and its nested lists, both made once per (layer, goal)"""
+    layer, layer_hash = per_grid('static_layers', grid, static_layers)['steps' if steps else 'costs']
+    key = (layer_hash, layer.shape, (int(goal[0]), int(goal[1])))
+    if key not in _heuristic_fields:
+        if len(_heuristic_fields) >= MAX_HEURISTIC_FIELDS:
+            del _heuristic_fields[next(iter(_heuristic_fields))]  # the oldest one
+        if layer[key[2]] == np.Inf:  # the goal is blocked all the time
+            field = np.full(layer.shape, np.Inf)
+        else:
+            field = reverse_dijkstra(layer, key[2])
+        _heuristic_fields[key] = (field, field.tolist())
+    return _heuristic_fields[key]
+
+
 def heuristic(a, b, grid: np.array = False):
-    if grid:  # costmap values
+    if grid is not False:  # costmap values
         h = np.mean(grid[grid >= 0]) * distance(a, b)
     else:
         h = distance(a, b)
@@ -45,7 +300,7 @@ def heuristic(a, b, grid: np.array = False):
 
 
 def cost(a, b, grid=False):
-    if grid:  # costmap values
+    if grid is not False:  # costmap values
         return grid[a] * distance_manhattan(a, b)
     else:
         return distance_manhattan(a, b)
@@ -76,8 +331,19 @@ def path_length(path: list) -> int:
     return l
 
 
-def astar_grid4con(start, goal, map):
-    return base.astar_base(start, goal, map, heuristic, reconstruct_path, get_children, cost)
+def astar_grid4con(start, goal, map, reservations: ReservationTable = None):
+    field = heuristic_lookup(map, goal)
+    if field[start[0]][start[1]] == np.Inf:
+        raise base.NoPathException("Goal can not be reached from start")
+
+    def heuristic_static(a, b, grid=False):
+        return field[a[0]][a[1]]
+
+    get_children_grid = neighbor_table(map)
+    if reservations:
+        get_children_grid = reservations.constrain(get_children_grid)
+
+    return base.astar_base(start, goal, map, heuristic_static, reconstruct_path, get_children_grid, cost)
 
 
 def plot(path, map):
@@ -1,7 +1,7 @@
 import datetime
 
 import numpy as np
-from planner.astar import astar_grid48con
+from planner.astar import astar_grid48con, base
 
 from planner.astar.base import NoPathException
 
@@ -22,24 +22,37 @@ def test_get_children_middle():
     assert len(children) == 0, "Not getting all the children"
 
 
-def rand_coords(x, y):
-    return (np.random.randint(0, x),
-            np.random.randint(0, y))
+def test_neighbor_table_same_as_get_children():
+    _grid = np.zeros([5, 6, 7])
+    _grid[2, 3, 4] = -1
+    _grid[1, :, 2] = -1
+    table = astar_grid48con.neighbor_table(_grid)
+    for x in range(5):
+        for y in range(6):
+            for t in range(7):
+                assert table((x, y, t), _grid) == astar_grid48con.get_children((x, y, t), _grid)
+    assert astar_grid48con.neighbor_table(_grid) is table, "Should be precomputed once per grid"
+    assert astar_grid48con.neighbor_table(_grid.swapaxes(0, 1)) is not table, "Views need their own tables"
 
 
-def astar_wait():
-    size = 10
-    _grid = np.zeros([size, size, size * 2])
-    for i in range(int(np.round(pow(size, 2) * .3))):
-        _grid[rand_coords(size, size)] = -1
+def test_neighbor_table_layout_change():
+    _grid = np.zeros([5, 5, 20])
+    table = astar_grid48con.neighbor_table(_grid)
+    field = astar_grid48con.heuristic_field(_grid, (4, 0))
 
-    start = (rand_coords(size, size) + (0,))
-    while _grid[start] == -1:
-        start = (rand_coords(size, size) + (0,))
+    _grid[2, 0:4, :] = -1  # changed in place
+    assert astar_grid48con.neighbor_table(_grid) is not table, "A changed grid needs a new table"
+    assert astar_grid48con.heuristic_field(_grid, (4, 0)) is not field, "A changed grid needs a new field"
+    path = astar_grid48con.astar_grid4con((0, 0, 0), (4, 0, 19), _grid)
+    assert (2, 0) not in map(lambda pose: pose[0:2], path), "Should not plan through the new wall"
+    assert len(path) == 13, "Should go around the new wall"
+    assert astar_grid48con.neighbor_table(_grid) is astar_grid48con.neighbor_table(_grid), \
+        "Should be precomputed once per change"
 
-    goal = (rand_coords(size, size) + (size * 2 - 1,))
-    while _grid[goal] == -1:
-        goal = (rand_coords(size, size) + (size * 2 - 1,))
+
+def astar_wait(seed):
+    from planner.astar.astar_benchmark import get_problem
+    start, goal, _grid = get_problem(10, seed=seed)
 
     startt = datetime.datetime.now()
 
@@ -61,8 +74,87 @@ def astar_wait():
 def test_astar_wait():
     res = []
     for i in range(10):
-        res.append(astar_wait())
+        res.append(astar_wait(i))
 
     res = np.array(res)
     print("Duration mean:", np.mean(res[res[:, 1] > 0, 1]))
     print("Length mean:", np.mean(res[:, 0]))
+
+
+def test_astar_heap_same_as_list():
+    from planner.astar.astar_benchmark import get_problem, astar_list, astar_heap, run
+    for seed in range(5):
+        start, goal, _grid = get_problem(15, seed=seed)
+        path_list, _ = run(astar_list, start, goal, _grid)
+        path_heap, _ = run(astar_heap, start, goal, _grid)
+        assert path_list == path_heap, "Heap based open set changed the path"
+
+
+def test_astar_distance_field_optimal():
+    from planner.astar.astar_benchmark import get_problem, astar_heap, run
+    for seed in range(5):
+        start, goal, _grid = get_problem(15, seed=seed)
+        path_euclid, _ = run(astar_heap, start, goal, _grid)
+        path_field, _ = run(astar_grid48con.astar_grid4con, start, goal, _grid)
+        assert len(path_euclid) == len(path_field), "Distance field heuristic is not admissible"
+
+
+def test_heuristic_field():
+    _grid = np.zeros([5, 5, 10])
+    _grid[2, 0:4, :] = -1
+    _grid[3, 3, 5] = -1  # only blocked at one time -> not part of the static layer
+    field = astar_grid48con.heuristic_field(_grid, (0, 0))
+    assert field[0, 0] == 0
+    assert field[4, 0] == 12, "Should go around the wall"
+    assert field[3, 3] == 8
+    assert astar_grid48con.heuristic_field(_grid, (0, 0)) is field, "Should be cached"
+
+    field_blocked = astar_grid48con.heuristic_field(_grid, (2, 0))
+    assert np.all(field_blocked == np.Inf), "Nothing can reach a goal that is blocked all the time"
+    try:
+        astar_grid48con.astar_grid4con((0, 0, 0), (2, 0, 9), _grid)
+        assert False, "Should not find a path"
+    except NoPathException:
+        pass
+
+
+def test_astar_costmap():
+    rand = np.random.RandomState(0)
+    _grid = rand.randint(1, 5, [8, 8, 30]).astype(float)  # costs that change over time
+    _grid[3, 0:6, :] = -1
+    start, goal = (0, 0, 0), (7, 2, 29)
+    path = astar_grid48con.astar_grid4con(start, goal, _grid)
+    path_dijkstra = base.astar_base(start, goal, _grid, lambda a, b, grid: 0, astar_grid48con.reconstruct_path,
+                                    astar_grid48con.get_children, astar_grid48con.cost)
+
+    def path_cost(p):
+        return sum(map(lambda i: astar_grid48con.cost(p[i], p[i + 1], _grid), range(len(p) - 1)))
+
+    assert path_cost(path) == path_cost(path_dijkstra), "Distance field of the costs is not admissible"
+    assert astar_grid48con.heuristic_lookup(_grid, goal) is astar_grid48con.heuristic_lookup(_grid, goal), \
+        "Should be made once per field"
+
+
+def test_astar_memory_independent_of_grid_size():
+    from planner.astar.astar_benchmark import run_memory
+    _grid = np.zeros([100, 100, 200])
+    astar_grid48con.astar_grid4con((50, 50, 0), (55, 52, 199), _grid)  # precomputation per grid
+    peak = run_memory(astar_grid48con.astar_grid4con, (10, 10, 0), (15, 12, 199), _grid)
+    assert peak < _grid.nbytes / 10, "Memory per query should scale with the explored region"
+
+
+def test_astar_reservations():
+    _grid = np.zeros([5, 1, 10])  # a corridor
+    path_free = astar_grid48con.astar_grid4con((0, 0, 0), (4, 0, 9), _grid)
+    assert len(path_free) == 5
+
+    reservations = astar_grid48con.ReservationTable(vertices=[(2, 0, 2)])
+    path_vertex = astar_grid48con.astar_grid4con((0, 0, 0), (4, 0, 9), _grid, reservations)
+    assert (2, 0, 2) not in path_vertex
+    assert len(path_vertex) == 6, "Should wait once"
+
+    reservations = astar_grid48con.ReservationTable(edges=[((3, 0), (2, 0), 2)])  # any direction
+    path_edge = astar_grid48con.astar_grid4con((0, 0, 0), (4, 0, 9), _grid, reservations)
+    assert (2, 0, 2) in path_edge and (3, 0, 3) not in path_edge
+    assert len(path_edge) == 6, "Should wait once"
+    assert not _grid.any(), "The grid must not be changed"
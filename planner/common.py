@@ -1,22 +1,35 @@
 import numpy as np
 
-from planner.astar.astar_grid48con import astar_grid4con
+from planner.astar.astar_grid48con import astar_grid4con, ReservationTable, per_grid
 from planner.astar.base import NoPathException
+from planner.path_cache import PathCache, map_fingerprint
 
 VERTEX = 0
 EDGE = 1
 
-path_save = {}
+path_save = PathCache()
 
-def path(start: tuple, goal: tuple, _map: np.array, blocked: list, path_save_process: dict = {}, calc: bool = True):
+
+def fingerprint(_map: np.array) -> str:
+    """Fingerprint of the map, computed once per map"""
+    return per_grid('fingerprint', _map, map_fingerprint)
+
+
+def path_key(start: tuple, goal: tuple, _map: np.array, blocked: list = ()) -> tuple:
+    """Key of a path in the path_save"""
+    return (fingerprint(_map), start, goal) + tuple(blocked)
+
+
+def path(start: tuple, goal: tuple, _map: np.array, blocked: list, path_save_process: dict = None,
+         calc: bool = True):
     """
     Calculate or return pre-calculated path from start to goal
 
     Args:
       start: The start to start from
       goal: The goal to plan to
-      _map: The map to plan on
-      blocked: List of blocked points for agents e.g. ((x, y, t), agent)
+      _map: The map to plan on (will not be changed)
+      blocked: List of blocked vertices (VERTEX, (x, y, t)) and edges (EDGE, ((x, y), (x, y), t))
       path_save_process: pre-processed paths are saved here
       calc: whether or not the path should be calculated if no saved id available. (returns False if not saved)
 
@@ -25,43 +38,36 @@ def path(start: tuple, goal: tuple, _map: np.array, blocked: list, path_save_pro
       or [] if no path found
       or False if path shouldn't have been calculated but was not saved either
     """
-    _map = _map.copy()
+    vertices = []
+    edges = []
     for b in blocked:
         if b[0] == VERTEX:
             v = b[1]
-            _map[(v[1],
-                  v[0],
-                  v[2])] = -1
+            vertices.append(v)
             if v[:2] == start or v[:2] == goal:
                 return False, {}
         elif b[0] == EDGE:
-            for v in b[1][0:2]:
-                _map[(v[1],
-                      v[0],
-                      b[1][2])] = -1
-                if v[:2] == start or v[:2] == goal:
-                    return False, {}
-                # TODO: actually block edge!
+            edges.append(b[1])
 
+    if path_save_process is None:
+        path_save_process = {}
     blocked.sort()
-    startgoal = [start, goal]
-    index = tuple(startgoal) + tuple(blocked)
-    global path_save
-    if index not in path_save.keys():
+    index = path_key(start, goal, _map, blocked)
+    _path = path_save.get(index, False)
+    if _path is False:
         if calc:  # if we want to calc (i.e. find the cost)
             assert len(start) == 2, "Should be called with only spatial coords"
             try:
                 _path = astar_grid4con(start + (0,),
                                        goal + (_map.shape[2] - 1,),
-                                       _map.swapaxes(0, 1))
+                                       _map.swapaxes(0, 1),
+                                       ReservationTable(vertices, edges))
             except NoPathException:
                 _path = []
 
             path_save_process[index] = _path
         else:
             return False, {}
-    else:  # exists in the path_save
-        _path = path_save[index]
 
     for b in blocked:
         if b[0] == VERTEX and b[1] in _path:
@@ -0,0 +1,316 @@
+#!/usr/bin/python
+"""
+Offline benchmark suite of the planners on seeded random instances (see `planner.tcbs_test.get_data_random`).
+
+From a base instance, one parameter at a time (map size, obstacle density, number of agents and jobs) is swept,
+which gives a scaling curve per planner and parameter. The results are stored in a versioned JSON file and can
+be compared against a baseline with regression thresholds, e.g.:
+
+    python -m planner.eval.benchmark_suite run -o baseline.json
+    python -m planner.eval.benchmark_suite run -o current.json
+    python -m planner.eval.benchmark_suite compare current.json baseline.json --time_ratio 1.3
+
+`compare` exits with 1 if there are regressions.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import random
+import subprocess
+import sys
+import time
+from itertools import product
+
+import numpy as np
+
+from planner.astar.astar_grid48con import astar_grid4con, clear_caches
+from planner.astar.base import NoPathException
+from planner.common import path, path_save
+from planner.greedy.greedy import plan_greedy
+from planner.tcbs.plan import generate_config, plan
+from planner.tcbs.stats import PlannerStats
+from planner.tcbs_test import get_data_random
+from tools import ColoredLogger, TimeoutException, time_limit
+
+logging.setLoggerClass(ColoredLogger)
+
+VERSION = 1  # of the results file, results of other versions can not be compared
+
+BASE = {'map_res': 10, 'map_fill_perc': 20, 'agent_n': 3, 'job_n': 3}
+SWEEPS = {'map_res': [8, 10, 12, 14],
+          'map_fill_perc': [0, 10, 20, 30],
+          'agent_n': [2, 3, 4],
+          'job_n': [2, 3, 4]}
+
+THRESHOLDS = {'time_ratio': 1.25,  # slower than the baseline by this factor
+              'min_time': .01,  # [s] differences below are noise
+              'cost_ratio': 1.,  # worse solutions
+              'expansions_ratio': 1.1}  # more search effort of TCBS
+
+
+def get_instances(base: dict = BASE, sweeps: dict = SWEEPS, seeds=(1, 2, 3)) -> list:
+    """The base instance and one instance per value of each swept parameter, for all seeds (no duplicates)"""
+    instances = []
+    for seed in seeds:
+        params = [base]
+        for name, values in sorted(sweeps.items()):
+            for value in values:
+                params.append(dict(base, **{name: value}))
+        for p in params:
+            instance = dict(p, seed=seed)
+            if instance not in instances:
+                instances.append(instance)
+    return instances
+
+
+def get_data(instance: dict):
+    """Agents, map, idle goals and jobs of an instance (also seeds `random` which sets the job priorities)"""
+    random.seed(instance['seed'])
+    return get_data_random(instance['seed'], map_res=instance['map_res'], map_fill_perc=instance['map_fill_perc'],
+                           agent_n=instance['agent_n'], job_n=instance['job_n'], idle_goals_n=0)
+
+
+def paths_cost(paths: list) -> float:
+    """Sum of the times at which the agents finish their last path"""
+    return float(sum(map(lambda agent_paths: agent_paths[-1][-1][2] if agent_paths and agent_paths[-1] else 0,
+                         paths)))
+
+
+def config_offline() -> dict:
+    config = generate_config()
+    config['filename_pathsave'] = ''  # no path store file, every run starts with an empty path cache
+    return config
+
+
+def bench_astar(agent_pos, grid, idle_goals, jobs) -> dict:
+    """A path from start to goal of every job with `astar_grid4con` (cost None if a job has no path)"""
+    cost = 0.
+    for start, goal, _ in jobs:
+        try:
+            cost += len(astar_grid4con(start + (0,), goal + (grid.shape[2] - 1,), grid.swapaxes(0, 1))) - 1
+        except NoPathException:
+            return {'cost': None}
+    return {'cost': cost}
+
+
+def bench_tcbs(agent_pos, grid, idle_goals, jobs) -> dict:
+    stats = PlannerStats()
+    _, _, res_paths = plan(agent_pos, jobs, [], idle_goals, grid, config_offline(), stats=stats)
+    return {'cost': paths_cost(res_paths), 'expansions': stats.counters['expansions']}
+
+
+def bench_greedy(agent_pos, grid, idle_goals, jobs) -> dict:
+    _, res_paths = plan_greedy(agent_pos, jobs, grid, config_offline())
+    return {'cost': paths_cost(res_paths)}
+
+
+def bench_path_cache(agent_pos, grid, idle_goals, jobs) -> dict:
+    """
+    All paths from the agents to the job starts and of the jobs with `common.path`, twice (cold and warm)
+    (cost None if a pair has no path)
+    """
+    pairs = list(map(lambda a_j: (a_j[0], a_j[1][0]), product(agent_pos, jobs)))
+    pairs += list(map(lambda j: (j[0], j[1]), jobs))
+    cost = 0.
+    for start, goal in pairs:
+        _path, path_save_process = path(start, goal, grid, [])
+        path_save.update(path_save_process)
+        cost = cost + len(_path) if _path and cost is not None else None
+    hits = path_save.hits
+    start_time = time.perf_counter()
+    for start, goal in pairs:
+        path(start, goal, grid, [])
+    return {'cost': cost,
+            'warm_time': time.perf_counter() - start_time,
+            'hit_rate': (path_save.hits - hits) / len(pairs)}
+
+
+BENCHMARKS = {'astar': bench_astar, 'tcbs': bench_tcbs, 'greedy': bench_greedy, 'path_cache': bench_path_cache}
+
+
+def measure(fun, instance: dict, samples: int, timeout: int) -> dict:
+    """
+    Run a benchmark on an instance, every sample on a copy of the map and cold
+    (with an empty path cache and nothing precomputed for any map)
+
+    Returns:
+      the instance with the status, the fastest time of the samples [s], all times and the metrics of the benchmark
+    """
+    agent_pos, grid, idle_goals, jobs = get_data(instance)
+    res = dict(instance, status='ok', times=[])
+    for _ in range(samples):
+        path_save.clear()
+        clear_caches()  # distance fields are shared by all maps with the same layout
+        _grid = grid.copy()
+        start = time.perf_counter()
+        try:
+            with time_limit(timeout):
+                metrics = fun(agent_pos, _grid, idle_goals, jobs)
+        except TimeoutException:
+            res['status'] = 'timeout'
+            break
+        except Exception as e:
+            logging.error("Benchmark on " + str(instance) + " failed: " + repr(e))
+            res['status'] = 'error: ' + repr(e)
+            break
+        res['times'].append(time.perf_counter() - start)
+        res.update(metrics)
+    res['time'] = min(res['times']) if res['status'] == 'ok' else None
+    return res
+
+
+def git_sha() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_suite(benchmarks=tuple(BENCHMARKS), instances: list = None, samples: int = 3, timeout: int = 60) -> dict:
+    """
+    Run the benchmarks on the instances
+
+    Args:
+      benchmarks: names of the benchmarks (see `BENCHMARKS`)
+      instances: see `get_instances` (Default: all sweeps with three seeds)
+      samples: runs per benchmark and instance
+      timeout: seconds per run
+
+    Returns:
+      the results with the version, the git commit, the system and one entry per benchmark and instance
+    """
+    if instances is None:
+        instances = get_instances()
+    results = []
+    for name in benchmarks:
+        for instance in instances:
+            res = measure(BENCHMARKS[name], instance, samples, timeout)
+            res['benchmark'] = name
+            results.append(res)
+            logging.info("%s %s: %s" % (name, str(instance), str(res['time'])))
+    return {'version': VERSION,
+            'created': datetime.datetime.now().isoformat(),
+            'git': git_sha(),
+            'cpus': multiprocessing.cpu_count(),
+            'python': sys.version.split()[0],
+            'samples': samples,
+            'results': results}
+
+
+def save(results: dict, fname: str):
+    with open(fname, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True, allow_nan=False)  # standard JSON only
+
+
+def load(fname: str) -> dict:
+    with open(fname) as f:
+        results = json.load(f)
+    assert results.get('version') == VERSION, \
+        "Results in %s are of version %s, can only read version %d" % (fname, results.get('version'), VERSION)
+    return results
+
+
+def result_key(res: dict) -> tuple:
+    return (res['benchmark'],) + tuple(res[p] for p in sorted(BASE)) + (res['seed'],)
+
+
+def scaling(results: dict, benchmark: str, param: str, base: dict = BASE) -> list:
+    """
+    Scaling curve of a benchmark: the median time over the seeds per value of the parameter
+    (the other parameters as in the base instance)
+
+    Returns:
+      (value, median time [s]) sorted by value, None as time if a run did not finish
+    """
+    times = {}
+    for res in results['results']:
+        if res['benchmark'] == benchmark and all(res[p] == base[p] for p in base if p != param):
+            times.setdefault(res[param], []).append(res['time'])
+    return list(map(lambda v_ts: (v_ts[0], None if None in v_ts[1] else float(np.median(v_ts[1]))),
+                    sorted(times.items())))
+
+
+def compare(current: dict, baseline: dict, thresholds: dict = THRESHOLDS) -> list:
+    """
+    Find the regressions of the current results against the baseline
+
+    Args:
+      current: results of `run_suite`
+      baseline: results to compare against
+      thresholds: ratios to the baseline above which time, cost and expansions are regressions
+        (and the minimal time difference that counts), see `THRESHOLDS`
+
+    Returns:
+      a message per regression
+    """
+    thresholds = dict(THRESHOLDS, **thresholds)
+    base_results = {result_key(r): r for r in baseline['results']}
+    regressions = []
+    for res in current['results']:
+        base = base_results.get(result_key(res))
+        if base is None or base['status'] != 'ok':
+            continue
+        name = "%s %s" % (res['benchmark'], ' '.join('%s=%s' % (p, res[p]) for p in sorted(BASE) + ['seed']))
+        if res['status'] != 'ok':
+            regressions.append("%s: %s (was ok)" % (name, res['status']))
+            continue
+        if (res['time'] > base['time'] * thresholds['time_ratio'] and
+                res['time'] - base['time'] > thresholds['min_time']):
+            regressions.append("%s: time %.4fs (was %.4fs)" % (name, res['time'], base['time']))
+        for metric in ['cost', 'expansions']:
+            if res.get(metric) is None or base.get(metric) is None:
+                continue  # no path
+            if res[metric] > base[metric] * thresholds[metric + '_ratio']:
+                regressions.append("%s: %s %s (was %s)" % (name, metric, res[metric], base[metric]))
+    return regressions
+
+
+def print_scaling(results: dict):
+    benchmarks = sorted(set(map(lambda r: r['benchmark'], results['results'])))
+    for benchmark in benchmarks:
+        print(benchmark)
+        for param in sorted(BASE):
+            curve = scaling(results, benchmark, param)
+            print("  %-14s" % param + " ".join(map(
+                lambda v_t: "%4s: %8s" % (v_t[0], '-' if v_t[1] is None else '%.4fs' % v_t[1]), curve)))
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the planners with regression thresholds")
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', help="run the benchmarks and save the results")
+    run.add_argument("--benchmarks", nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    run.add_argument("--seeds", nargs='+', type=int, default=[1, 2, 3])
+    for param in sorted(SWEEPS):
+        run.add_argument("--" + param, nargs='+', type=int, default=SWEEPS[param], help="values to sweep")
+    run.add_argument("--samples", type=int, default=3, help="runs per benchmark and instance (the fastest counts)")
+    run.add_argument("--timeout", type=int, default=60, help="seconds per run")
+    run.add_argument("-o", "--output", default="benchmarks.json")
+    comp = commands.add_parser('compare', help="compare results against a baseline")
+    comp.add_argument("current")
+    comp.add_argument("baseline")
+    for name, value in sorted(THRESHOLDS.items()):
+        comp.add_argument("--" + name, type=float, default=value)
+    args = parser.parse_args(args)
+
+    if args.command == 'run':
+        instances = get_instances(seeds=args.seeds, sweeps={p: getattr(args, p) for p in SWEEPS})
+        results = run_suite(args.benchmarks, instances, args.samples, args.timeout)
+        save(results, args.output)
+        print_scaling(results)
+        return 0
+    elif args.command == 'compare':
+        regressions = compare(load(args.current), load(args.baseline), {t: getattr(args, t) for t in THRESHOLDS})
+        for r in regressions:
+            print(r)
+        print("%d regressions" % len(regressions))
+        return 1 if regressions else 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import copy
+import json
+import os
+
+import numpy as np
+import pytest
+
+from planner.astar import astar_grid48con
+from planner.common import path_key, path_save
+from planner.eval.benchmark_suite import BASE, VERSION, bench_astar, bench_path_cache, compare, get_instances, \
+    load, main, measure, run_suite, save, scaling
+
+
+def test_get_instances():
+    instances = get_instances(sweeps={'map_res': [8, 10], 'agent_n': [2]}, seeds=(1, 2))
+    assert len(instances) == 6, "Base instance (map_res 10) and one per other value, per seed"
+    assert dict(BASE, seed=1) in instances, "Base instance"
+    assert dict(BASE, map_res=8, seed=2) in instances, "Swept instance"
+
+
+def test_bench_path_cache():
+    grid = np.zeros([5, 5, 20])
+    agent_pos = [(0, 0), (1, 0)]
+    jobs = [((2, 2), (4, 4), 0), ((3, 1), (0, 4), 0)]
+    path_save.clear()
+    res = bench_path_cache(agent_pos, grid, [], jobs)
+    for a, j in [(a, j) for a in agent_pos for j in jobs]:
+        assert path_key(a, j[0], grid) in path_save, "Should plan from every agent to every job start"
+    assert res['hit_rate'] == 1, "Paths planned before are in the cache"
+    path_save.clear()
+
+
+def test_measure_cold():
+    cached = []
+
+    def bench(agent_pos, grid, idle_goals, jobs):
+        cached.append((len(path_save), len(astar_grid48con._heuristic_fields)))
+        return bench_path_cache(agent_pos, grid, idle_goals, jobs)
+
+    res = measure(bench, dict(BASE, seed=1), samples=2, timeout=60)
+    assert res['status'] == 'ok' and len(res['times']) == 2
+    assert cached == [(0, 0), (0, 0)], "Every sample should start without precomputed paths and fields"
+
+
+def test_bench_no_path(tmpdir):
+    grid = np.zeros([5, 5, 20])
+    grid[0:5, 2, :] = -1  # a wall at x = 2 (indexed by y, x, t)
+    jobs = [((0, 0), (4, 0), 0)]
+    res = dict(BASE, seed=1, benchmark='astar', status='ok', time=1., **bench_astar([(0, 1)], grid, [], jobs))
+    assert res['cost'] is None, "No cost without a path"
+    assert bench_path_cache([(0, 1)], grid, [], jobs)['cost'] is None, "No cost without a path"
+    fname = os.path.join(str(tmpdir), "no_path.json")
+    save({'version': VERSION, 'results': [res]}, fname)
+    assert compare(load(fname), load(fname)) == [], "Results without cost can be compared"
+
+
+def test_benchmark_suite(tmpdir):
+    instances = get_instances(sweeps={'map_res': [8], 'job_n': [2]}, seeds=(1,))
+    results = run_suite(instances=instances, samples=1)
+    assert results['version'] == VERSION, "Versioned results"
+    assert len(results['results']) == 4 * 3, "Each benchmark on each instance"
+    for res in results['results']:
+        assert res['status'] == 'ok', "All benchmarks should run"
+        assert res['time'] > 0 and res['cost'] > 0, "Time and cost are measured"
+    assert all(map(lambda r: r['hit_rate'] == 1,
+                   filter(lambda r: r['benchmark'] == 'path_cache', results['results']))), \
+        "Paths planned before are in the cache"
+    assert list(map(lambda v_t: v_t[0], scaling(results, 'tcbs', 'map_res'))) == [8, 10], "Scaling curve"
+
+    fname = os.path.join(str(tmpdir), "baseline.json")
+    save(results, fname)
+    assert load(fname) == results, "Results are stored as they are"
+    assert compare(results, results) == [], "No regression against itself"
+
+    baseline = copy.deepcopy(results)
+    tcbs = next(filter(lambda r: r['benchmark'] == 'tcbs', baseline['results']))
+    tcbs['time'] /= 2
+    tcbs['cost'] -= 1
+    assert len(compare(results, baseline, {'min_time': 0})) == 2, "Slower and worse"
+    assert compare(results, baseline, {'time_ratio': 3, 'cost_ratio': 2}) == [], "Within the thresholds"
+
+    save(baseline, fname)
+    current = os.path.join(str(tmpdir), "current.json")
+    save(results, current)
+    assert main(["compare", current, fname, "--min_time", "0"]) == 1, "Regressions fail the comparison"
+    assert main(["compare", fname, fname]) == 0, "No regressions"
+
+    results['version'] = VERSION + 1
+    with open(current, 'w') as f:
+        json.dump(results, f)
+    with pytest.raises(AssertionError):
+        load(current)
@@ -2,10 +2,9 @@ import logging
 import numpy as np
 from functools import reduce
 
-from pyflann import FLANN
-
 from planner.tcbs.plan import plan as plan_cbsext, load_paths, save_paths, make_unique
 from planner.common import path
+from planner.spatial_index import GridIndex
 
 logging.getLogger('pyutilib.component.core.pca').setLevel(logging.INFO)
 
@@ -31,73 +30,74 @@ def plan_greedy(agent_pos, jobs, grid, config):
     return res_agent_job, res_paths
 
 
-def get_closest(possible_starts, free_tasks_starts, grid, n):
-    flann = FLANN()
-    result, dists = flann.nn(
-        possible_starts,
-        free_tasks_starts,
-        n,
-        algorithm="kmeans",
-        branching=32,
-        iterations=7,
-        checks=16)
+def get_closest(index, possible_starts, tasks, free_tasks, grid, n):
+    """
+    The closest pair of a free task and a possible start (agent or task end) by path length
+    among the n closest pairs by euclidean distance
+
+    Args:
+      index: GridIndex of the agents followed by the task ends
+      possible_starts: ids of the possible starts in the index
+      tasks: all tasks
+      free_tasks: indices of the free tasks
+      grid: the map
+      n: number of pairs to plan paths for
+
+    Returns:
+      index in free_tasks, id of the start in the index and the path between them
+    """
+    n_agents = len(index.points) - len(tasks)
+    pairs = []
+    for i_free_task, i_task in enumerate(free_tasks):
+        ids = possible_starts - {n_agents + i_task}  # not after itself
+        for dist, i_start in index.nearest(tasks[i_task][0], n, ids=ids):
+            pairs.append((dist, i_free_task, i_start))
+    nearest = sorted(pairs)[:n]
     lengths = []
-    nearestss = []
     paths = []
-    INF = 2 * np.max(np.max(dists))
-    for i in range(n):
-        temp_nearest = np.unravel_index(np.argmin(dists), [len(possible_starts), n])
-        dists[temp_nearest] = INF
-        nearestss.append(temp_nearest)
-
-        temp_i_possible_starts = result[temp_nearest]
-        temp_i_free_tasks_start = temp_nearest[0]
-        p, _ = path(tuple(possible_starts[temp_i_possible_starts]),
-                    tuple(free_tasks_starts[temp_i_free_tasks_start]),
+    for _, i_free_task, i_start in nearest:
+        p, _ = path(tuple(index.points[i_start]),
+                    tuple(tasks[free_tasks[i_free_task]][0]),
                     grid,
                     [])
-        if p:
-            lengths.append(len(p))
+        lengths.append(len(p) if p else np.Inf)
         paths.append(p)
-    best_path = np.argmin(lengths)
-    nearest = nearestss[best_path]
-    i_free_tasks_start = nearest[0]
-    i_possible_starts = result[nearest]
-    return i_free_tasks_start, i_possible_starts, paths[best_path]
+    best_path = int(np.argmin(lengths))
+    _, i_free_task, i_start = nearest[best_path]
+    return i_free_task, i_start, paths[best_path]
 
 
 def strictly_consec(agents_list, tasks, grid):
     N_CLOSEST = 2
-    TYPE = "float64"
-    agents = np.array(agents_list, dtype=TYPE)
     tasks = make_unique(tasks)
+    n_agents = len(agents_list)
 
-    free_agents = agents.copy()
-    free_tasks = tasks.copy()
+    # agents first, then the task ends (as where the next task can start)
+    index = GridIndex(list(agents_list) + list(map(lambda a: a[1], tasks)))
+    free_agents = set(range(n_agents))
+    free_tasks = list(range(len(tasks)))
 
     consec = {}
     agent_task_d = {}
 
     while len(free_tasks) > 0:
-        free_tasks_ends = np.array(list(map(lambda a: a[1], free_tasks)), dtype=TYPE)
-        free_tasks_starts = np.array(list(map(lambda a: a[0], free_tasks)), dtype=TYPE)
         if len(free_tasks) > len(free_agents):
-            possible_starts = np.concatenate([free_agents, free_tasks_ends], axis=0)
+            possible_starts = free_agents | set(map(lambda i_t: n_agents + i_t, free_tasks))
         else:
-            possible_starts = free_agents
+            possible_starts = set(free_agents)
         if len(possible_starts) > 1:
             i_free_tasks_start, i_possible_starts, p = get_closest(
-                possible_starts, free_tasks_starts, grid, N_CLOSEST)
+                index, possible_starts, tasks, free_tasks, grid, N_CLOSEST)
         else:  # only one start left
             i_free_tasks_start = 0
-            i_possible_starts = 0
-        if i_possible_starts >= len(free_agents):  # is a task end
-            i_task_end = i_possible_starts - len(free_agents)
-            consec[i_task_end] = tasks.index(free_tasks[i_free_tasks_start])  # after this task comes that
+            i_possible_starts = next(iter(possible_starts))
+        if i_possible_starts >= n_agents:  # is a task end
+            i_task_end = i_possible_starts - n_agents
+            consec[i_task_end] = free_tasks[i_free_tasks_start]  # after this task comes that
         else:  # an agent
-            i_agent = agents_list.index(t(free_agents[i_possible_starts]))
-            agent_task_d[i_agent] = tasks.index(t(free_tasks[i_free_tasks_start]))
-            free_agents = np.delete(free_agents, i_possible_starts, axis=0)
+            agent_task_d[i_possible_starts] = free_tasks[i_free_tasks_start]
+            free_agents.remove(i_possible_starts)
+        index.remove(i_possible_starts)
         free_tasks.pop(i_free_tasks_start)
 
     agent_task = [tuple() for _ in range(len(agents_list))]
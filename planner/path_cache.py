@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from planner.path_store import PathStore
+from tools import ColoredLogger
+
+logging.setLoggerClass(ColoredLogger)
+
+MAX_ENTRIES = 100000
+MAX_BYTES = 512 * 2 ** 20
+
+POSE_BYTES = sys.getsizeof((0, 0, 0)) + 8  # one tuple per pose plus the list pointer to it
+
+
+def map_fingerprint(grid: np.array) -> str:
+    """
+    Stable identifier of a map, so that cached paths are only used on the map they were planned on
+
+    Args:
+      grid: the map (2D-space + time)
+
+    Returns:
+      the fingerprint as hex string
+    """
+    h = hashlib.md5()
+    h.update(str((grid.shape, grid.dtype.str)).encode())
+    h.update(np.ascontiguousarray(grid).tobytes())
+    return h.hexdigest()
+
+
+def entry_bytes(key: tuple, _path: list) -> int:
+    """Rough estimate of the memory one cache entry takes"""
+    return sys.getsizeof(key) + sys.getsizeof(_path) + len(_path) * POSE_BYTES
+
+
+class PathCache(object):
+    """
+    Bounded cache of planned paths with least recently used eviction.
+    Keys are tuples starting with the fingerprint of the map (see `map_fingerprint`).
+    A `PathStore` file can be attached to persist all paths, it is then used to look up paths that are
+    not in memory (any more).
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store = None
+
+    def get(self, key: tuple, default=None):
+        """The path for this key (counting as hit or miss) or default"""
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.store is not None:
+            _path = self.store.get(key)
+            if _path is not None:
+                self.hits += 1
+                self._set(key, _path)
+                return _path
+        self.misses += 1
+        return default
+
+    def peek(self, key: tuple, default=None):
+        """The path for this key if it is in memory or default (not counted and without looking at the store)"""
+        return self._entries.get(key, default)
+
+    def __getitem__(self, key: tuple):
+        res = self.get(key, KeyError)
+        if res is KeyError:
+            raise KeyError(key)
+        return res
+
+    def __setitem__(self, key: tuple, _path: list):
+        self._set(key, _path)
+        if self.store is not None:
+            self.store.put(key, _path)
+
+    def _set(self, key: tuple, _path: list):
+        if key in self._entries:
+            self.n_bytes -= entry_bytes(key, self._entries[key])
+        self._entries[key] = _path
+        self._entries.move_to_end(key)
+        self.n_bytes += entry_bytes(key, _path)
+        self.evict()
+
+    def __contains__(self, key: tuple):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        return self._entries.items()
+
+    def update(self, other, persist: bool = True):
+        """Add all paths of other (to memory only if not persist)"""
+        for key, _path in other.items():
+            if persist:
+                self[key] = _path
+            else:
+                self._set(key, _path)
+
+    def clear(self):
+        self._entries.clear()
+        self.n_bytes = 0
+
+    def resize(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within its budgets"""
+        while len(self._entries) > self.max_entries or (self._entries and self.n_bytes > self.max_bytes):
+            key, _path = self._entries.popitem(last=False)
+            self.n_bytes -= entry_bytes(key, _path)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.n_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def attach(self, filename: str):
+        """
+        Use the path store in this file (it is created if it does not exist)
+
+        Returns:
+          whether the file could be used as path store
+        """
+        if self.store is not None:
+            if self.store.filename == filename:
+                return True
+            self.store.close()
+            self.store = None
+        try:
+            self.store = PathStore(filename)
+        except ValueError as e:
+            logging.warning(str(e) + ", not using it")
+            return False
+        return True
+
+    def save(self, filename: str):
+        """Make sure all paths in memory are in the path store of this file"""
+        if self.store is not None and self.store.filename == filename:
+            return  # all paths are written to the attached store anyway
+        if self.attach(filename):
+            for key, _path in self._entries.items():
+                self.store.put(key, _path)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from planner.common import path, path_save, path_key
+from planner.path_cache import PathCache, map_fingerprint
+
+
+def test_path_cache_lru():
+    cache = PathCache(max_entries=2)
+    cache[('m', (0, 0), (1, 1))] = [(0, 0, 0)]
+    cache[('m', (0, 0), (2, 2))] = [(0, 0, 0)]
+    assert cache.get(('m', (0, 0), (1, 1))), "Should be cached"
+    cache[('m', (0, 0), (3, 3))] = [(0, 0, 0)]  # evicts the least recently used
+    assert ('m', (0, 0), (2, 2)) not in cache
+    assert ('m', (0, 0), (1, 1)) in cache
+    assert cache.get(('m', (0, 0), (4, 4))) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_path_cache_peek(tmpdir):
+    cache = PathCache()
+    cache.attach(str(tmpdir.join('paths.bin')))
+    cache[('m', (0, 0), (1, 1))] = [(0, 0, 0)]
+    cache.clear()  # only in the store now
+    assert cache.peek(('m', (0, 0), (1, 1))) is None, "Should only look in memory"
+    assert cache.peek(('m', (0, 0), (2, 2)), False) is False
+    cache[('m', (0, 0), (2, 2))] = [(0, 0, 0)]
+    assert cache.peek(('m', (0, 0), (2, 2))) == [(0, 0, 0)]
+    assert cache.stats()['hits'] == 0, "Peeking should not count"
+    assert cache.stats()['misses'] == 0, "Peeking should not count"
+
+
+def test_path_cache_bytes():
+    cache = PathCache(max_bytes=10000)
+    for i in range(100):
+        cache[('m', (0, 0), (i, 0))] = [(j, 0, j) for j in range(i + 1)]
+    assert cache.n_bytes <= 10000
+    assert 0 < len(cache) < 100
+
+
+def test_path_cache_map_fingerprint(tmpdir):
+    grid = np.zeros([5, 5, 20])
+    p, path_save_process = path((0, 0), (4, 0), grid, [])
+    path_save.update(path_save_process)
+    assert path_key((0, 0), (4, 0), grid) in path_save
+
+    fname = str(tmpdir.join("paths.paths"))
+    path_save.save(fname)
+    cache = PathCache()
+    cache.attach(fname)
+    assert cache.get(path_key((0, 0), (4, 0), grid)) == p
+
+    changed = grid.copy()
+    changed[2, :, :] = -1
+    assert map_fingerprint(changed) != map_fingerprint(grid)
+    assert cache.get(path_key((0, 0), (4, 0), changed)) is None, "Paths must not be used on another map"
+
+
+def test_path_cache_layout_change():
+    grid = np.zeros([5, 5, 20])
+    p, path_save_process = path((0, 0), (4, 0), grid, [])
+    path_save.update(path_save_process)
+
+    grid[0:4, 2, :] = -1  # a wall at x = 2 (the grid is indexed by y, x, t), changed in place
+    p_changed, _ = path((0, 0), (4, 0), grid, [])
+    assert (2, 0) not in map(lambda pose: pose[0:2], p_changed), "Should not use the path of the old layout"
+    assert len(p_changed) > len(p), "Should go around the new wall"
+    assert grid.flags.writeable, "The grid of the caller should not be changed"
@@ -0,0 +1,147 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+
+import numpy as np
+
+from tools import ColoredLogger
+
+logging.setLoggerClass(ColoredLogger)
+
+MAGIC = b'MIRPATH1'
+RECORD_HEADER = struct.Struct('<16sI')  # key digest, number of poses
+POSE_DTYPE = np.dtype('<i2')  # x, y, t of each pose
+POSE_BYTES = 3 * POSE_DTYPE.itemsize
+COORD_MAX = np.iinfo(POSE_DTYPE).max
+
+
+def plain_key(key):
+    """The key with numpy scalars as plain python numbers (so np.int64(3) and 3 give the same key)"""
+    if isinstance(key, (tuple, list)):
+        return type(key)(map(plain_key, key))
+    if isinstance(key, np.integer):
+        return int(key)
+    if isinstance(key, np.floating):
+        return float(key)
+    return key
+
+
+def key_digest(key: tuple) -> bytes:
+    """Stable digest of a path key (the same in all processes)"""
+    return hashlib.blake2b(repr(plain_key(key)).encode(), digest_size=16).digest()
+
+
+class PathStore(object):
+    """
+    Persistent append-only file of paths.
+
+    The file is the magic header followed by records of (key digest, number of poses) and the poses as
+    int16 array. Records are only ever appended (under an exclusive file lock), so readers in other
+    processes can use the file concurrently without locking: they only index records that are complete.
+    Only the record headers are read into the index, paths are read from a memory map on lookup.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._pid = None
+        self.open()
+
+    def open(self):
+        self._pid = os.getpid()
+        self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._index = {}  # digest -> (offset, number of poses)
+        self._indexed = 0  # bytes of the file indexed
+        self._mmap = None
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAGIC)
+        if os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+            os.close(self._fd)
+            raise ValueError("File %s is not a path store" % self.filename)
+        self._indexed = len(MAGIC)
+        self.refresh()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        os.close(self._fd)
+
+    def _check_process(self):
+        """Descriptors and locks are shared with the parent after a fork, so every process opens its own"""
+        if os.getpid() != self._pid:
+            self.close()
+            self.open()
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the file for writing"""
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Index records appended (by any process) since the last refresh"""
+        size = os.fstat(self._fd).st_size
+        while self._indexed + RECORD_HEADER.size <= size:
+            digest, n = RECORD_HEADER.unpack(os.pread(self._fd, RECORD_HEADER.size, self._indexed))
+            offset = self._indexed + RECORD_HEADER.size
+            if offset + n * POSE_BYTES > size:
+                break  # still being written
+            self._index[digest] = (offset, n)
+            self._indexed = offset + n * POSE_BYTES
+
+    def __contains__(self, key: tuple):
+        self._check_process()
+        digest = key_digest(key)
+        if digest not in self._index:
+            self.refresh()
+        return digest in self._index
+
+    def __len__(self):
+        self._check_process()
+        self.refresh()
+        return len(self._index)
+
+    def get(self, key: tuple, default=None):
+        """
+        The path for this key or default
+
+        Returns:
+          the path as list of tuples (or [] if there was no path)
+        """
+        self._check_process()
+        digest = key_digest(key)
+        if digest not in self._index:
+            self.refresh()
+            if digest not in self._index:
+                return default
+        offset, n = self._index[digest]
+        if n == 0:
+            return []
+        if self._mmap is None or len(self._mmap) < offset + n * POSE_BYTES:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        poses = np.frombuffer(self._mmap, dtype=POSE_DTYPE, count=3 * n, offset=offset)
+        return list(map(tuple, poses.reshape(n, 3).tolist()))
+
+    def put(self, key: tuple, _path: list):
+        """Append a path (if it is not stored already)"""
+        if key in self:
+            return
+        poses = np.array(_path, dtype=np.int64).reshape(len(_path), 3)
+        if len(_path) and (poses.min() < 0 or poses.max() > COORD_MAX):
+            logging.warning("Path does not fit in the store, not saving it")
+            return
+        record = RECORD_HEADER.pack(key_digest(key), len(_path)) + poses.astype(POSE_DTYPE).tobytes()
+        with self._locked():
+            os.write(self._fd, record)  # appended at the end because of O_APPEND
+        self.refresh()
+
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from planner.path_store import PathStore, MAGIC, key_digest
+
+key_a = ('fingerprint', (0, 0), (2, 1))
+path_a = [(0, 0, 0), (1, 0, 1), (2, 0, 2), (2, 1, 3)]
+key_b = ('fingerprint', (0, 0), (9, 9), (0, (3, 3, 3)))
+
+
+def test_path_store(tmpdir):
+    fname = str(tmpdir.join("test.paths"))
+    store = PathStore(fname)
+    assert store.get(key_a) is None
+    store.put(key_a, path_a)
+    store.put(key_b, [])  # no path found
+    assert store.get(key_a) == path_a
+    assert store.get(key_b) == []
+
+    size = os.path.getsize(fname)
+    store.put(key_a, path_a)
+    assert os.path.getsize(fname) == size, "Should only be appended once"
+    store.close()
+
+    store = PathStore(fname)  # reopening
+    assert len(store) == 2
+    assert store.get(key_a) == path_a
+    store.close()
+
+
+def append_in_process(fname):
+    store = PathStore(fname)
+    store.put(key_b, path_a)
+    store.close()
+
+
+def test_key_digest_numpy(tmpdir):
+    key_np = ('fingerprint', (np.int64(0), np.int64(0)), (np.int32(9), 9), (0, (np.int16(3), 3, 3)))
+    assert key_digest(key_np) == key_digest(key_b), "Numpy and plain ints should give the same digest"
+    assert key_digest(key_np) != key_digest(key_a)
+    store = PathStore(str(tmpdir.join('paths.bin')))
+    store.put(key_b, path_a)
+    assert store.get(key_np) == path_a, "Should find the path with numpy coordinates"
+
+
+def test_path_store_concurrent(tmpdir):
+    fname = str(tmpdir.join("test.paths"))
+    store = PathStore(fname)
+    store.put(key_a, path_a)
+    p = multiprocessing.Process(target=append_in_process, args=(fname,))
+    p.start()
+    p.join()
+    assert store.get(key_b) == path_a, "Should see paths of other processes"
+    store.close()
+
+
+def test_path_store_other_file(tmpdir):
+    fname = str(tmpdir.join("test.pkl"))
+    with open(fname, 'wb') as f:
+        f.write(b'not a path store')
+    with pytest.raises(ValueError):
+        PathStore(fname)
+    with open(fname, 'rb') as f:
+        assert not f.read().startswith(MAGIC), "Should not be changed"
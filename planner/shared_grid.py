@@ -0,0 +1,54 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedGrid(object):
+    """
+    A grid in shared memory, so that worker processes can use it without getting a copy.
+    Workers only get the (small) token and `attach` to the grid with it.
+    The creating process owns the memory and has to `close` it.
+    """
+
+    def __init__(self, grid: np.array):
+        self.shm = shared_memory.SharedMemory(create=True, size=max(grid.nbytes, 1))
+        self.token = (self.shm.name, grid.shape, grid.dtype.str)
+        self.grid = np.ndarray(grid.shape, dtype=grid.dtype, buffer=self.shm.buf)
+        self.grid[:] = grid
+        self.grid.flags.writeable = False
+
+    def close(self):
+        if self.shm is not None:
+            self.grid = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_attached = {}  # name -> (shared memory, grid) in this process
+
+
+def attach(token: tuple) -> np.array:
+    """
+    The grid of a token from `SharedGrid` (read only), attaching only once per process
+
+    Args:
+      token: name, shape and dtype of the shared grid
+
+    Returns:
+      the grid
+    """
+    name, shape, dtype = token
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        grid = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        grid.flags.writeable = False
+        _attached[name] = (shm, grid)
+    return _attached[name][1]
+
@@ -0,0 +1,26 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from planner.shared_grid import SharedGrid, attach
+
+
+def sum_in_process(token):
+    grid = attach(token)
+    return float(np.sum(grid)), grid.flags.writeable
+
+
+def test_shared_grid():
+    grid = np.zeros([10, 12, 20])
+    grid[2:4, 3, :] = -1
+    with SharedGrid(grid) as shared:
+        assert np.array_equal(shared.grid, grid), "Shared grid should be a copy of the grid"
+        assert shared.token[1:] == (grid.shape, grid.dtype.str)
+        with multiprocessing.Pool(processes=2) as pool:
+            res = pool.map(sum_in_process, [shared.token] * 4)
+        assert res == [(np.sum(grid), False)] * 4, "Workers should see the grid read only"
+        name = shared.token[0]
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)  # should be unlinked
@@ -0,0 +1,77 @@
+from heapq import nsmallest
+
+import numpy as np
+
+BUCKET_SIZE = 4
+
+
+class GridIndex(object):
+    """
+    Nearest neighbour index of 2D points in square buckets of a grid.
+    It is built once, points can be removed when they are not of interest any more (e.g. assigned jobs).
+    Neighbours are ranked by euclidean distance or by any distance that is at least the euclidean one
+    (like the length of the shortest path on the map).
+    """
+
+    def __init__(self, points: list, bucket_size: int = BUCKET_SIZE):
+        self.points = list(map(lambda p: (p[0], p[1]), points))
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        for i, p in enumerate(self.points):
+            self.buckets.setdefault(self.bucket(p), set()).add(i)
+        self.removed = set()
+        if self.buckets:
+            bucket_coords = np.array(list(self.buckets.keys()))
+            self.min_bucket = tuple(np.min(bucket_coords, axis=0).tolist())
+            self.max_bucket = tuple(np.max(bucket_coords, axis=0).tolist())
+
+    def bucket(self, p: tuple) -> tuple:
+        return int(p[0] // self.bucket_size), int(p[1] // self.bucket_size)
+
+    def __len__(self):
+        return len(self.points) - len(self.removed)
+
+    def remove(self, i: int):
+        """Do not return point i any more"""
+        if i not in self.removed:
+            self.buckets[self.bucket(self.points[i])].remove(i)
+            self.removed.add(i)
+
+    def ring(self, center: tuple, r: int):
+        """Indices of the points in the buckets r buckets away from center"""
+        for bx in range(center[0] - r, center[0] + r + 1):
+            for by in ([center[1] - r, center[1] + r] if abs(bx - center[0]) < r else
+                       range(center[1] - r, center[1] + r + 1)):
+                yield from self.buckets.get((bx, by), ())
+
+    def nearest(self, coord: tuple, n: int, ids: set = None, distance=None) -> list:
+        """
+        The n nearest points to coord
+
+        Args:
+          coord: the query point
+          n: number of neighbours
+          ids: only consider these points (Default: all that were not removed)
+          distance: distance of point i to coord, must be at least the euclidean distance
+            (Default: the euclidean distance)
+
+        Returns:
+          list of (distance, i) sorted by distance (and i if equal)
+        """
+        if distance is None:
+            def distance(i):
+                return np.sqrt((self.points[i][0] - coord[0]) ** 2 + (self.points[i][1] - coord[1]) ** 2)
+        if not self.buckets or n <= 0:
+            return []
+        center = self.bucket(coord)
+        max_r = max(abs(center[0] - self.min_bucket[0]), abs(center[0] - self.max_bucket[0]),
+                    abs(center[1] - self.min_bucket[1]), abs(center[1] - self.max_bucket[1]))
+        found = []
+        for r in range(max_r + 1):
+            # all points from this ring on are further away than this
+            if len(found) >= n and nsmallest(n, found)[-1][0] <= (r - 1) * self.bucket_size:
+                break
+            for i in self.ring(center, r):
+                if ids is None or i in ids:
+                    found.append((distance(i), i))
+        return nsmallest(n, found)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from planner.spatial_index import GridIndex
+
+
+def brute_force(points, coord, n, ids, distance):
+    return sorted((distance(i), i) for i in ids)[:n]
+
+
+def test_grid_index():
+    rand = np.random.RandomState(0)
+    points = list(map(tuple, rand.randint(0, 30, [50, 2]).tolist()))
+    index = GridIndex(points)
+    ids = set(range(len(points)))
+    for i_q in range(30):
+        coord = tuple(rand.randint(-5, 35, 2).tolist())
+
+        def euclidean(i):
+            return np.sqrt((points[i][0] - coord[0]) ** 2 + (points[i][1] - coord[1]) ** 2)
+
+        def manhattan(i):
+            return abs(points[i][0] - coord[0]) + abs(points[i][1] - coord[1])
+
+        n = 1 + i_q % 5
+        assert index.nearest(coord, n) == brute_force(points, coord, n, ids, euclidean)
+        assert index.nearest(coord, n, distance=manhattan) == brute_force(points, coord, n, ids, manhattan)
+        some = set(range(0, len(points), 3)) & ids
+        assert index.nearest(coord, n, ids=some) == brute_force(points, coord, n, some, euclidean)
+        if i_q % 2:
+            index.remove(i_q)
+            ids.remove(i_q)
+            assert len(index) == len(ids)
+    assert len(index.nearest((0, 0), 100)) == len(ids), "Should return all points if there are less"
+
+
+def test_grid_index_empty():
+    assert GridIndex([]).nearest((1, 1), 3) == []
+    index = GridIndex([(1, 1)])
+    index.remove(0)
+    assert index.nearest((1, 1), 3) == []
@@ -1,7 +1,9 @@
 import logging
-import numpy as np
 import time
-import matplotlib.pyplot as plt
+from heapq import heapify, heappush, heappop
+from itertools import count
+
+import numpy as np
 
 from tools import ColoredLogger
 
@@ -9,84 +11,267 @@ logging.setLoggerClass(ColoredLogger)
 
 MAX_COST = 99999
 
-def astar_base(start, condition, heuristic, get_children, cost, goal_test):
+def astar_base(start, condition, heuristic, get_children, cost, goal_test, evaluate=None, stats=None):
+    """
+    A* over the search states
+
+    Args:
+      start: first state
+      condition: the conditions of the problem
+      heuristic: (condition, state) -> estimated cost to the goal
+      get_children: (condition, state) -> following states
+      cost: (condition, state) -> total cost, state (with the collisions found)
+      goal_test: (condition, state) -> whether it is a goal
+      evaluate: (condition, state) -> total cost, heuristic, collisions, state
+        to evaluate a state at once (Default: cost and heuristic)
+      stats: `PlannerStats` to count expansions, generated, pruned and duplicate states in
+
+    Returns:
+      the goal state found
+    """
+    if evaluate is None:
+        evaluate = evaluate_separately(cost, heuristic)
     _, start = cost(condition, start)  # it may have collisions
 
-    collect_stats = False
-    stats = {}
+    n = SearchCounts()
 
-    closed = []
-    open = [start]
+    # states are hashable, so closed and open are sets
+    closed = set()
     g_score = {}
     g_score[start] = 0
     f_score = {}
     f_score[start] = heuristic(condition, start)
 
-    f_score_open = np.array([])
-    f_score_open = np.append(f_score_open, f_score[start])
+    # binary heap of (f, n, state), n keeps equal f values in the order of discovery
+    order = count()
+    open_heap = [(f_score[start], next(order), start)]
+    open = {start}
 
-    while len(open) > 0:
-        # the node in openSet having the lowest fScore[] value
-        current = argmin_f_open(open, f_score_open)
+    try:
+        while len(open_heap) > 0:
+            # the node in openSet having the lowest fScore[] value
+            f, _, current = heappop(open_heap)
+            if current not in open or f > f_score[current]:
+                continue  # outdated entry
+            open.remove(current)
 
-        if goal_test(condition, current):
-            return current
+            if goal_test(condition, current):
+                return current
+
+            closed.add(current)
+            children = get_children(condition, current)
+            n.expansions += 1
+            n.generated += len(children)
+            for neighbor in children:
+
+                if neighbor in closed:
+                    n.duplicates += 1
+                    continue  # Ignore the neighbor which is already evaluated.
+                # The distance from start to a neighbor and estimation to the goal
+                c, h, _, neighbor = evaluate(condition, neighbor)
+
+                if c >= MAX_COST:
+                    n.pruned += 1
+                    closed.add(neighbor)
+                    continue  # This is not part of a plan
+
+                tentative_g_score = c
+
+                if neighbor in open and tentative_g_score >= g_score[neighbor]:
+                    n.duplicates += 1
+                    continue  # This is not a better path.
+                open.add(neighbor)  # Discover a new node (or a better path to it)
+                g_score[neighbor] = tentative_g_score
+                the_f_score = tentative_g_score + h
+                f_score[neighbor] = the_f_score
+                heappush(open_heap, (the_f_score, next(order), neighbor))
+                if len(open) > n.open_max:
+                    n.open_max = len(open)
+
+        raise RuntimeError("Can not find a solution")
+    finally:
+        n.add_to(stats, closed)
+
+
+def astar_anytime(start, condition, heuristic, get_children, cost, goal_test, evaluate=None,
+                  weight: float = 1., deadline: float = None, stats=None):
+    """
+    Anytime weighted A* over the search states: states are expanded by g + weight * h, so that a first
+    solution is found fast. The search goes on to improve it (pruning all states with g + h not better
+    than the best solution) until the open set is empty or the deadline is reached.
+    If there is no solution at the deadline, the search descends greedily (depth first on h) from the open
+    states to the first solution it finds, which has no bound.
+
+    Args:
+      start: first state
+      condition: the conditions of the problem
+      heuristic: (condition, state) -> estimated cost to the goal
+      get_children: (condition, state) -> following states
+      cost: (condition, state) -> total cost, state (with the collisions found)
+      goal_test: (condition, state) -> whether it is a goal
+      evaluate: (condition, state) -> total cost, heuristic, collisions, state (Default: cost and heuristic)
+      weight: weight of the heuristic (1 is A*)
+      deadline: time.time() to return the best solution found until then (Default: no deadline)
+      stats: `PlannerStats` to count expansions, generated, pruned and duplicate states in
+
+    Returns:
+      the best goal state found and the bound of its cost to the lowest g + h of all states still open
+      (1 if the search has finished, relative to the heuristic, np.Inf if it was found after the deadline)
+    """
+    if evaluate is None:
+        evaluate = evaluate_separately(cost, heuristic)
+    _, start = cost(condition, start)  # it may have collisions
+
+    closed = set()
+    g_score = {start: 0}
+    f_score = {start: heuristic(condition, start)}  # without weight
+    weighted_f_score = {start: f_score[start] * weight}
+    order = count()
+    open_heap = [(weighted_f_score[start], next(order), start)]
+    open = {start}
+    best = None
+    best_cost = MAX_COST
 
-        i_rm = open.index(current)
-        open.remove(current)
-        f_score_open = np.delete(f_score_open, i_rm)
+    def timed_out():
+        return deadline is not None and time.time() >= deadline
 
-        closed.append(current)
+    n = SearchCounts()
+    try:
+        while len(open_heap) > 0 and not timed_out():
+            weighted_f, _, current = heappop(open_heap)
+            if current not in open or weighted_f > weighted_f_score[current]:
+                continue  # outdated entry
+            open.remove(current)
+            if f_score[current] >= best_cost:
+                continue  # can not improve the solution
+
+            if goal_test(condition, current):
+                best, best_cost = current, g_score[current]
+                logging.debug("Solution with cost %.2f, bound %.3f" % (best_cost, bound(best_cost, open, f_score)))
+                continue
+
+            closed.add(current)
+            children = get_children(condition, current)
+            n.expansions += 1
+            n.generated += len(children)
+            for neighbor in children:
+                if neighbor in closed:
+                    n.duplicates += 1
+                    continue
+                if timed_out():
+                    open.add(current)  # not all of its children are evaluated, it still bounds the cost
+                    closed.discard(current)
+                    break
+                c, h, _, neighbor = evaluate(condition, neighbor)
+                if c >= MAX_COST:
+                    n.pruned += 1
+                    closed.add(neighbor)
+                    continue  # This is not part of a plan
+                if c + h >= best_cost:
+                    n.pruned_bound += 1
+                    continue  # can not improve the solution
+                if neighbor in open and c >= g_score[neighbor]:
+                    n.duplicates += 1
+                    continue  # This is not a better path.
+                open.add(neighbor)
+                g_score[neighbor] = c
+                f_score[neighbor] = c + h
+                weighted_f_score[neighbor] = c + weight * h
+                heappush(open_heap, (weighted_f_score[neighbor], next(order), neighbor))
+                if len(open) > n.open_max:
+                    n.open_max = len(open)
+
+        if best is None and len(open) > 0:
+            logging.warning("No solution before the deadline, descending greedily to one")
+            best = greedy_descent(open, f_score, g_score, condition, get_children, goal_test, evaluate, closed, n)
+            return best, np.Inf
+    finally:
+        n.add_to(stats, closed)
+
+    if best is None:
+        raise RuntimeError("Can not find a solution")
+    return best, bound(best_cost, open, f_score)
+
+
+def greedy_descent(open: set, f_score: dict, g_score: dict, condition, get_children, goal_test, evaluate,
+                   closed: set, n):
+    """
+    Depth first search on h from the open states of `astar_anytime`, to the first goal state
+
+    Args:
+      open: states to start from
+      f_score: g + h of the open states
+      g_score: g of the open states
+      condition: the conditions of the problem
+      get_children: (condition, state) -> following states
+      goal_test: (condition, state) -> whether it is a goal
+      evaluate: (condition, state) -> total cost, heuristic, collisions, state
+      closed: states evaluated already (the ones visited here are added)
+      n: `SearchCounts` to count in
+
+    Returns:
+      the goal state found
+    """
+    order = count()
+    # binary heap of (h, -n, state), equal h values go to the state found last (depth first)
+    open_heap = [(f_score[state] - g_score[state], -next(order), state) for state in open]
+    heapify(open_heap)
+    while len(open_heap) > 0:
+        _, _, current = heappop(open_heap)
+        if goal_test(condition, current):
+            return current
+        closed.add(current)
         children = get_children(condition, current)
+        n.expansions += 1
+        n.generated += len(children)
         for neighbor in children:
-
             if neighbor in closed:
-                continue  # Ignore the neighbor which is already evaluated.
-            # The distance from start to a neighbor
-            c, neighbor = cost(condition, neighbor)
-
-            if collect_stats:
-                stats[time.time()] = {
-                    "closed.__len__()": closed.__len__(),
-                    "open.__len__()": open.__len__(),
-                    "neighbor[2].__len__() (blocks)": neighbor[2].__len__(),
-                    "c": c if c < MAX_COST else 0
-                }
-                if stats.__len__() == 300000:
-                    display_stats(stats)
-
+                n.duplicates += 1
+                continue
+            c, h, _, neighbor = evaluate(condition, neighbor)
+            closed.add(neighbor)  # visited once
             if c >= MAX_COST:
-                closed.append(neighbor)
+                n.pruned += 1
                 continue  # This is not part of a plan
+            heappush(open_heap, (h, -next(order), neighbor))
+    raise RuntimeError("Can not find a solution")
 
-            tentative_g_score = c
-
-            append = True
-            if neighbor not in open:  # Discover a new node
-                open.append(neighbor)
-            elif tentative_g_score >= g_score[neighbor]:
-                continue  # This is not a better path.
-            else:
-                append = False
-            g_score[neighbor] = tentative_g_score
-            the_f_score = tentative_g_score + heuristic(condition, neighbor)
-            f_score[neighbor] = the_f_score
-            if append:
-                f_score_open = np.append(f_score_open, the_f_score)
 
-    raise RuntimeError("Can not find a solution")
+class SearchCounts(object):
+    """Counts of one search, kept in attributes (faster than the dict of `PlannerStats` in the inner loop)"""
+
+    def __init__(self):
+        self.expansions = 0
+        self.generated = 0
+        self.pruned = 0
+        self.pruned_bound = 0
+        self.duplicates = 0
+        self.open_max = 1  # the start
+
+    def add_to(self, stats, closed: set):
+        if stats is None:
+            return
+        for name in ['expansions', 'generated', 'pruned', 'pruned_bound', 'duplicates']:
+            stats.count(name, getattr(self, name))
+        stats.maximum('open_max', self.open_max)
+        stats.maximum('closed', len(closed))
+
+
+def bound(best_cost: float, open: set, f_score: dict) -> float:
+    """Suboptimality bound of a solution: its cost relative to the lowest g + h of the open states"""
+    lower = min(map(lambda state: f_score[state], open), default=best_cost)
+    if lower >= best_cost:
+        return 1.
+    return best_cost / lower if lower > 0 else np.Inf
 
 
-def argmin_f_open(open_list, f_score_open):
-    assert len(open_list) == len(f_score_open), "Lengths must be equal"
-    return open_list[np.argmin(f_score_open)]
+def evaluate_separately(cost, heuristic):
+    """An evaluate function for astar_base from separate cost and heuristic functions"""
 
+    def evaluate(condition, state):
+        c, state = cost(condition, state)
+        if c >= MAX_COST:
+            return c, MAX_COST, (), state
+        return c, heuristic(condition, state), (), state
 
-def display_stats(stats):
-    f = plt.figure()
-    x = stats.keys()
-    for i, k in enumerate(list(stats[list(x)[0]].keys())):
-        ax = f.add_subplot(221 + i)
-        ax.plot(x, list(map(lambda x_: stats[x_][k], x)))
-        ax.set_title(k)
-    plt.show()
\ No newline at end of file
+    return evaluate
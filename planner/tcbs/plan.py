@@ -1,17 +1,21 @@
 import logging
 import multiprocessing
-import pickle
-import uuid
+import time
 from functools import reduce
-from itertools import product
+from itertools import chain
 from typing import List, Any, Union, Iterator
 
 import matplotlib.pyplot as plt
+from scipy.special import ndtr
 from scipy.stats import norm
 
-from planner.astar.astar_grid48con import distance_manhattan
-from planner.tcbs.base import astar_base, MAX_COST
+from planner.astar.astar_grid48con import distance_manhattan, heuristic_field
+from planner.tcbs.base import astar_anytime, astar_base, MAX_COST
+from planner.tcbs.stats import PlannerStats
 from planner.common import *
+from planner.path_cache import MAX_ENTRIES, MAX_BYTES
+from planner.shared_grid import SharedGrid, attach
+from planner.spatial_index import GridIndex
 from planner.eval.display import plot_inputs, plot_results
 from tools import ColoredLogger
 
@@ -21,12 +25,21 @@ plt.style.use('bmh')
 
 _config = {}
 _distances = None
+_job_index = None  # GridIndex of the job starts for number_nearest
+_engine = None  # PlannerEngine used by the running plan()
+_worker_grid_token = None  # token of the shared grid in PlannerEngine workers
+_agent_paths = {}  # paths per agent, see agent_paths_key
+_stats = PlannerStats()  # of the running plan() (counts nothing outside of it)
+
+MAX_AGENT_PATHS = 100000
 
 EXPECTED_MAX_N_BLOCKS = 1000
+MIN_POSES_VECTORIZED = 256  # find_collision with numpy for more poses
 
 
 def plan(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid: np.array,
-         config: dict = {}, plot: bool = False, pathplanning_only_assignment=False):
+         config: dict = {}, plot: bool = False, pathplanning_only_assignment=False, engine=None, seed=None,
+         stats: PlannerStats = None):
     """
     Main entry point for planner
 
@@ -38,20 +51,63 @@ def plan(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid:
       idle_goals: idle goals to consider (((g_x, g_y), (t_mu, t_std)), ...)
       grid: the map (2D-space + time)
       plot: whether to plot conditions and results or not
-      filename: filename to save / read path_save (set to False to not do this)
+      filename: filename of the path store to save / read path_save (set to False to not do this)
       agent_pos: list: 
       jobs: list: 
       alloc_jobs: list: 
       idle_goals: list: 
       grid: np.array: 
       plot: bool:  (Default value = False)
-      filename: str:  (Default value = 'path_save.pkl')
+      filename: str:  (Default value = 'path_save.paths')
       pathplanning_only_assignment: bool: do the pathplanning only (this assumes each job to the same index agent)
+      engine: PlannerEngine to plan with, to reuse its workers across calls (Default: a new one just for this call)
+      seed: agent -> job and agent -> idle goal allocations of a previous plan (with the indices of these jobs and
+        idle goals) to start the search from, only the rest is planned (see `seed_state`)
+      stats: `PlannerStats` to fill with the counters and timers of this planning
 
     Returns:
       : tuple of tuples of agent -> job allocations, agent -> idle goal allocations and blocked map areas
 
     """
+    return plan_anytime(agent_pos, jobs, alloc_jobs, idle_goals, grid, config, plot, pathplanning_only_assignment,
+                        engine, seed, stats)[:3]
+
+
+def plan_anytime(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid: np.array,
+                 config: dict = {}, plot: bool = False, pathplanning_only_assignment=False, engine=None, seed=None,
+                 stats: PlannerStats = None):
+    """
+    Like `plan`, but also returns the suboptimality bound of the solution.
+    With `time_limit` in the config, the best solution found in this time is returned (if there is none yet,
+    the search goes on greedily to the first one), with `suboptimality` > 1 the search finds a first solution
+    faster (see `astar_anytime`).
+
+    Returns:
+      : agent -> job allocations, agent -> idle goal allocations, paths and the bound of the solution
+      (1 for the optimal one, np.Inf for one found after the time limit)
+    """
+    startt = time.time()
+    global _engine, _stats
+    own_engine = engine is None
+    if own_engine:
+        engine = PlannerEngine()
+    _engine = engine
+    _stats = stats if stats is not None else PlannerStats()
+    cache_hits, cache_misses = path_save.hits, path_save.misses
+    try:
+        with _stats.timer('total'):
+            return _plan(agent_pos, jobs, alloc_jobs, idle_goals, grid, config, plot, pathplanning_only_assignment,
+                         startt, seed)
+    finally:
+        _stats.count('path_cache_hits', path_save.hits - cache_hits)
+        _stats.count('path_cache_misses', path_save.misses - cache_misses)
+        _engine = None
+        _stats = PlannerStats()
+        if own_engine:
+            engine.close()
+
+
+def _plan(agent_pos, jobs, alloc_jobs, idle_goals, grid, config, plot, pathplanning_only_assignment, startt, seed):
 
     if not config:
         config = generate_config()  # default config
@@ -59,20 +115,20 @@ def plan(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid:
     global _config
     _config = config
 
-    # load path_save
-    if filename:  # TODO: check if file was created on same map
+    path_save.resize(config['path_cache_max_entries'], config['path_cache_max_bytes'])
+    if not seed:
+        _agent_paths.clear()  # when replanning, the paths of agents that did not change are still valid
+    global _distances, _job_index
+    _distances = None
+    _job_index = None
+    # load path_save (paths are keyed by the map they were planned on)
+    if filename:
         load_paths(filename)
 
-    pool = alloc_threads()
-    alloc_threads()
+    _engine.set_grid(grid)
     agent_job = []
     _agent_idle = []
 
-    if _config['number_nearest'] != 0:
-        global _distances
-        filename = pre_calc_paths(jobs, idle_goals, grid, filename)
-        _distances = pre_calc_distances(agent_pos, jobs, idle_goals, grid, filename)
-
     agent_pos_test = set()
     for a in agent_pos:
         # init agent_job allocation
@@ -104,17 +160,30 @@ def plan(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid:
     # making jobs unique
     jobs = make_unique(jobs)
 
+    if _config['number_nearest'] != 0:
+        # for the nearest jobs (and the heuristic)
+        with _stats.timer('pre_calc'):
+            _distances = pre_calc_distances(agent_pos, jobs, idle_goals, grid, filename)
+        _job_index = GridIndex(list(map(lambda job: job[0], jobs)))  # of the job starts
+
     blocked = ()
     condition = comp2condition(agent_pos, jobs, alloc_jobs, idle_goals, grid)
 
     # planning!
-    (agent_job, _agent_idle, blocked
-     ) = astar_base(start=comp2state(agent_job, _agent_idle, blocked),
-                    condition=condition,
-                    goal_test=goal_test,
-                    get_children=get_children,
-                    heuristic=heuristic,
-                    cost=cost)
+    start = comp2state(agent_job, _agent_idle, blocked)
+    deadline = startt + _config['time_limit'] if _config['time_limit'] else None
+    with _stats.timer('search'):
+        if seed:
+            # the repair gets half of the time left, the rest is for planning from scratch if it fails
+            repair_deadline = (time.time() + deadline) / 2 if deadline is not None else None
+            try:
+                (agent_job, _agent_idle, blocked), bound = search(
+                    seed_state(seed, agent_job, len(jobs), len(idle_goals)), condition, repair_deadline)
+            except RuntimeError as e:
+                logging.warning("Could not repair the previous plan (%s), planning from scratch" % str(e))
+                (agent_job, _agent_idle, blocked), bound = search(start, condition, deadline)
+        else:
+            (agent_job, _agent_idle, blocked), bound = search(start, condition, deadline)
 
     _paths = get_paths(condition, comp2state(agent_job, _agent_idle, blocked))
 
@@ -130,18 +199,125 @@ def plan(agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list, grid:
         plot_results(ax2, _agent_idle, _paths, agent_job, agent_pos, grid, idle_goals, jobs)
         plt.show()
 
-    pool.close()
-    pool.terminate()
-    pool.join()
+    return agent_job, _agent_idle, _paths, bound
+
+
+def search(start: tuple, condition: dict, deadline: float = None) -> tuple:
+    """
+    Search a goal state from start, exact or anytime (see the config)
+
+    Args:
+      start: the state to start from
+      condition: the conditions of the problem
+      deadline: time.time() to return the best solution found so far
+
+    Returns:
+      the goal state and its suboptimality bound
+    """
+    if deadline is not None or _config['suboptimality'] != 1:
+        return astar_anytime(start=start,
+                             condition=condition,
+                             goal_test=goal_test,
+                             get_children=get_children,
+                             heuristic=heuristic,
+                             cost=cost,
+                             evaluate=evaluate,
+                             weight=_config['suboptimality'],
+                             deadline=deadline,
+                             stats=_stats)
+    return astar_base(start=start,
+                      condition=condition,
+                      goal_test=goal_test,
+                      get_children=get_children,
+                      heuristic=heuristic,
+                      cost=cost,
+                      evaluate=evaluate,
+                      stats=_stats), 1.
+
+
+def seed_state(seed: tuple, agent_job: tuple, n_jobs: int, n_idle_goals: int) -> tuple:
+    """
+    Start state from the allocations of a previous plan, so that the search only has to assign new jobs and
+    resolve the collisions around them.
+    The preallocated jobs stay first, jobs that do not exist any more are dropped. Idle goals are only kept
+    if all jobs are assigned (the search assigns idle goals after all jobs).
 
-    return agent_job, _agent_idle, _paths
+    Args:
+      seed: agent -> job and agent -> idle goal allocations of the previous plan
+      agent_job: agent -> job allocations with the preallocated jobs
+      n_jobs: number of jobs
+      n_idle_goals: number of idle goals
 
+    Returns:
+      the start state
+    """
+    seed_job, seed_idle = seed
+    assigned = set(chain.from_iterable(agent_job))
+    agent_job = list(agent_job)
+    for i_a in range(min(len(agent_job), len(seed_job))):
+        for j in seed_job[i_a]:
+            if 0 <= j < n_jobs and j not in assigned:
+                agent_job[i_a] += (j,)
+                assigned.add(j)
+    agent_idle = [()] * len(agent_job)
+    if len(assigned) == n_jobs:
+        assigned_idle = set()
+        for i_a in range(min(len(agent_job), len(seed_idle))):
+            if (not agent_job[i_a] and len(seed_idle[i_a]) and 0 <= seed_idle[i_a][0] < n_idle_goals and
+                    seed_idle[i_a][0] not in assigned_idle):
+                agent_idle[i_a] = (seed_idle[i_a][0],)
+                assigned_idle.add(seed_idle[i_a][0])
+    return comp2state(tuple(agent_job), tuple(agent_idle), ())
+
+
+class PlannerEngine(object):
+    """
+    Long lived worker pool for the planner that can be reused across `plan()` calls.
+    The grid is put in shared memory once (when it changes), workers only get its token.
+    They keep their path cache between tasks.
+    """
 
-def alloc_threads():
-    global pool
-    n = multiprocessing.cpu_count()
-    pool = multiprocessing.Pool(processes=n)
-    return pool
+    def __init__(self, processes: int = None):
+        self.processes = processes if processes else multiprocessing.cpu_count()
+        self.pool = None
+        self.shared_grid = None
+        self.grid_fingerprint = None
+
+    def set_grid(self, grid: np.array):
+        """Make sure the workers have this grid (restarting them if they had another one)"""
+        grid_fingerprint = fingerprint(grid)
+        if self.pool is None or grid_fingerprint != self.grid_fingerprint:
+            self.close()
+            self.shared_grid = SharedGrid(grid)
+            self.pool = multiprocessing.Pool(processes=self.processes,
+                                             initializer=init_worker,
+                                             initargs=(self.shared_grid.token,))
+            self.grid_fingerprint = grid_fingerprint
+
+    def map(self, fun, valss: list) -> list:
+        return self.pool.map(fun, valss)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            self.grid_fingerprint = None
+        if self.shared_grid is not None:
+            self.shared_grid.close()
+            self.shared_grid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def init_worker(grid_token: tuple):
+    global _worker_grid_token
+    _worker_grid_token = grid_token
 
 
 # Main methods
@@ -228,42 +404,55 @@ def assign_jobs(agent_idle, agent_job, agent_pos, blocked, jobs, left_jobs):
 
 
 def assign_nearest_jobs(agent_idle, agent_job, agent_pos, blocked, jobs, left_jobs, n):
-    from pyflann import FLANN
+    """
+    Children with one of the n nearest left jobs assigned to each agent.
+    The jobs are ranked by the length of the path to their start from where the agent is after its jobs.
+    """
+    global _job_index
+    starts = list(map(lambda job: (job[0][0], job[0][1]), jobs))
+    if _job_index is None or _job_index.points != starts:  # built once per plan
+        _job_index = GridIndex(starts)
+    distances = _distances if _distances and _distances['agents'] == agent_pos and _distances['tasks'] == jobs else None
     children = []
-    starts = []
-    ends = []
-    ends_job = []
-    for left_job in left_jobs:  # this makes many children ...
-        ends.append(left_job[0])
-        ends_job.append(jobs.index(left_job))
+    left = set(map(lambda left_job: jobs.index(left_job), left_jobs))
     for i_a in range(len(agent_pos)):
         if agent_job[i_a]:  # has assignment
             i_j = agent_job[i_a][-1]
-            starts.append(jobs[i_j][0])
+            pose = jobs[i_j][1]
+            dists = distances['tt'][i_j] if distances else None
         else:
-            starts.append(agent_pos[i_a])
-    flann = FLANN()
-    result, dists = flann.nn(
-        np.array(ends, dtype=float),
-        np.array(starts, dtype=float),
-        (n if len(ends) >= n else len(ends)),
-        algorithm="kmeans",
-        branching=32,
-        iterations=7,
-        checks=16)
-    assert len(agent_pos) == len(result), "Not the right amount of results"
-    for i_a in range(len(agent_pos)):
-        if len(result.shape) == 1:
-            result = np.array(list(map(lambda x: [x, ], result)))
-        for res in result[i_a]:
+            pose = agent_pos[i_a]
+            dists = distances['at'][i_a] if distances else None
+        for _, i_j_new in _job_index.nearest(pose, n, ids=left,
+                                             distance=(lambda i: dists[i]) if dists is not None else None):
             agent_job_new = agent_job.copy()
-            agent_job_new[i_a] += (ends_job[res],)
+            agent_job_new[i_a] += (i_j_new,)
             children.append(comp2state(tuple(agent_job_new),
                                        agent_idle,
                                        blocked))
     return children
 
 
+def evaluate(_condition: dict, _state: tuple):
+    """
+    Cost and heuristic of this state, planning the paths only once
+
+    Args:
+      _condition: The conditions of the problem
+      _state: The state to evaluate
+
+    Returns:
+      The **total** cost, the heuristic, the collisions found and the state with them
+    """
+    _paths = get_paths(_condition, _state)
+    if _paths is False:  # one path was not viable
+        return MAX_COST, MAX_COST, (), _state
+    _cost, collisions, _state = cost_of_paths(_condition, _state, _paths)
+    if _cost >= MAX_COST:
+        return _cost, MAX_COST, collisions, _state
+    return _cost, heuristic_of_paths(_condition, _state, _paths), collisions, _state
+
+
 def cost(_condition: dict, _state: tuple):
     """
     Get the cost for this state
@@ -275,13 +464,28 @@ def cost(_condition: dict, _state: tuple):
     Returns:
       The **total** cost of this state
     """
+    _paths = get_paths(_condition, _state)
+    if _paths is False:  # one path was not viable
+        return MAX_COST, _state
+    _cost, _, _state = cost_of_paths(_condition, _state, _paths)
+    return _cost, _state
+
+
+def cost_of_paths(_condition: dict, _state: tuple, _paths: list):
+    """
+    Get the cost for this state with its paths
+
+    Args:
+      _condition: The conditions of the problem
+      _state: The state to evaluate
+      _paths: The paths of the state (see `get_paths`)
+
+    Returns:
+      The **total** cost of this state, the collisions in the paths and the state with them
+    """
     (agent_pos, jobs, alloc_jobs, idle_goals, _map) = condition2comp(_condition)
     (agent_job, agent_idle, block_state) = state2comp(_state)
     _cost = 0.
-
-    _paths = get_paths(_condition, _state)
-    if _paths == False:  # one path was not viable
-        return MAX_COST, _state
     for i_a in range(len(_paths)):
         pathset = list(_paths[i_a])
         assigned_jobs = agent_job[i_a]
@@ -307,7 +511,8 @@ def cost(_condition: dict, _state: tuple):
             _cost += prob * path_len
 
     # finding collisions in paths
-    collisions = find_collision(_paths, _config['all_collisions'])
+    with _stats.timer('find_collision'):
+        collisions = find_collision(_paths, _config['all_collisions'])
     for collision in collisions:
         if collision != ():
             block_state += (collision,)
@@ -315,14 +520,14 @@ def cost(_condition: dict, _state: tuple):
     seen = set()
     for b in block_state:
         if b in seen:
-            return MAX_COST, _state
+            return MAX_COST, collisions, _state
         seen.add(b)
 
     _cost += block_state.__len__() / EXPECTED_MAX_N_BLOCKS
     assert block_state.__len__() < EXPECTED_MAX_N_BLOCKS, "more blocks than we expected"
 
     _state = comp2state(agent_job, agent_idle, block_state)
-    return _cost, _state
+    return _cost, collisions, _state
 
 
 def heuristic(_condition: dict, _state: tuple) -> float:
@@ -333,6 +538,111 @@ def heuristic(_condition: dict, _state: tuple) -> float:
       _condition: Input condition
       _state: State to eval
 
+    Returns:
+      cost heuristic for the given state
+    """
+    paths = get_paths(_condition, _state)
+    if paths is False:
+        return MAX_COST  # no feasible path set
+    return heuristic_of_paths(_condition, _state, paths)
+
+
+def heuristic_of_paths(_condition: dict, _state: tuple, paths: list) -> float:
+    """
+    Estimation from this state with its paths to the goal
+
+    Args:
+      _condition: Input condition
+      _state: State to eval
+      paths: The paths of the state (see `get_paths`)
+
+    Returns:
+      cost heuristic for the given state
+    """
+    (agent_pos, jobs, alloc_jobs, idle_goals, _map) = condition2comp(_condition)
+    if (_distances and _distances['agents'] == agent_pos and _distances['tasks'] == jobs and
+            _distances['idle_goals'] == idle_goals and _distances['fingerprint'] == fingerprint(_map)):
+        return heuristic_of_distances(_state, paths, agent_pos)
+    return heuristic_of_paths_loop(_condition, _state, paths)
+
+
+def heuristic_of_distances(_state: tuple, paths: list, agent_pos: list) -> float:
+    """
+    Like `heuristic_of_paths_loop` but with the distance fields and matrices of `pre_calc_distances`,
+    the nearest poses for all jobs and idle goals are found at once
+
+    Args:
+      _state: State to eval
+      paths: The paths of the state (see `get_paths`)
+      agent_pos: agent poses of the condition
+
+    Returns:
+      cost heuristic for the given state
+    """
+    (agent_job, _agent_idle, block_state) = state2comp(_state)
+    assert len(paths) == len(agent_pos), "All agents should have paths"
+    assert block_state.__len__() < EXPECTED_MAX_N_BLOCKS, "more blocks than we expected"
+    _cost = block_state.__len__() / EXPECTED_MAX_N_BLOCKS
+
+    left_jobs = np.ones(len(_distances['tasks']), dtype=bool)
+    left_jobs[list(chain.from_iterable(agent_job))] = False
+    left_jobs = np.flatnonzero(left_jobs)
+    left_idle_goals = np.ones(len(_distances['idle_goals']), dtype=bool)
+    left_idle_goals[list(chain.from_iterable(_agent_idle))] = False
+    left_idle_goals = np.flatnonzero(left_idle_goals)
+
+    if len(left_jobs):
+        agentposes = np.array([paths[i_a][-1][-1][0:2] if paths[i_a] else agent_pos[i_a][0:2]
+                               for i_a in range(len(agent_pos))], dtype=int).reshape(-1, 2)
+        poses = np.concatenate([agentposes, _distances['task_goals'][left_jobs]])
+        starts = _distances['task_starts'][left_jobs]
+        nearest = nearest_poses(poses, starts, exclude=np.arange(len(left_jobs)) + len(agentposes))
+        _cost += np.sum(pair_distances(_distances['start_fields'][left_jobs], starts, poses[nearest]))
+        _cost += np.sum(_distances['t'][left_jobs])
+
+    left_agents = [i_a for i_a in range(len(agent_pos)) if not agent_job[i_a] and not _agent_idle[i_a]]
+    if left_agents and len(left_idle_goals):
+        poses = np.array([agent_pos[i_a][0:2] for i_a in left_agents], dtype=int)
+        goals = _distances['idle_coords'][left_idle_goals]
+        nearest = nearest_poses(poses, goals)
+        path_lens = pair_distances(_distances['idle_fields'][left_idle_goals], goals, poses[nearest])
+        loc, scale = _distances['idle_distributions'][left_idle_goals].T
+        probs = ndtr((path_lens - loc) / scale)  # norm.cdf of all idle goals
+        _cost += np.sum(probs * path_lens)
+
+    return float(_cost)
+
+
+def nearest_poses(poses: np.array, coords: np.array, exclude: np.array = None) -> np.array:
+    """
+    Index of the closest pose to each coord like `get_nearest` (equal distances go to the smaller pose)
+
+    Args:
+      poses: spatial poses [pose, (x, y)]
+      coords: spatial coords [coord, (x, y)]
+      exclude: pose not to use per coord
+
+    Returns:
+      index of the nearest pose per coord
+    """
+    dists = np.sum((poses[np.newaxis, :, :] - coords[:, np.newaxis, :]) ** 2, axis=2)
+    # one key for the (distance, pose) tuples of get_nearest
+    base = int(poses.max()) + 1 if len(poses) else 1
+    keys = (dists * base + poses[:, 0]) * base + poses[:, 1]
+    if exclude is not None:
+        keys[np.arange(len(coords)), exclude] = np.iinfo(keys.dtype).max
+    return np.argmin(keys, axis=1)
+
+
+def heuristic_of_paths_loop(_condition: dict, _state: tuple, paths: list) -> float:
+    """
+    Estimation from this state with its paths to the goal, job by job (without precalculated distances)
+
+    Args:
+      _condition: Input condition
+      _state: State to eval
+      paths: The paths of the state (see `get_paths`)
+
     Returns:
       cost heuristic for the given state
     """
@@ -343,10 +653,6 @@ def heuristic(_condition: dict, _state: tuple) -> float:
     (left_agent_pos, left_idle_goals, left_jobs
      ) = clear_set(_agent_idle, agent_job, agent_pos, idle_goals, jobs)
 
-    paths = get_paths(_condition, _state)
-    if paths is False:
-        return MAX_COST  # no feasible path set
-
     agentposes = []
     assert len(paths) == len(agent_pos), "All agents should have paths"
     for i_agent in range(len(paths)):
@@ -361,12 +667,14 @@ def heuristic(_condition: dict, _state: tuple) -> float:
     valss = []
     for i_lj in range(len(left_jobs)):
         valss.append({'agentposes': agentposes,
-                      'job': left_jobs[i_lj]})
+                      'job': left_jobs[i_lj],
+                      '_map': _map})
 
     if left_agent_pos:
         for ig in left_idle_goals:
             valss.append({'agentposes': left_agent_pos,
-                          'idle_goal': ig})
+                          'idle_goal': ig,
+                          '_map': _map})
 
     job_costs = list(map(heuristic_per_job, valss))
     _cost += reduce(lambda a, b: a + b, job_costs, 0)
@@ -379,6 +687,7 @@ def heuristic(_condition: dict, _state: tuple) -> float:
 
 def heuristic_per_job(vals):
     agentposes = vals['agentposes']
+    _map = vals['_map']
     if 'job' in vals.keys():
         job = vals['job']
         _cost = 0
@@ -386,13 +695,13 @@ def heuristic_per_job(vals):
         agentposes_no_self.remove(job[1])
         # closest agent pose to this jobs start
         nearest_agent = get_nearest(agentposes_no_self, job[0])
-        _cost += distance_no_calc(nearest_agent, job[0])
-        _cost += distance_no_calc(job[0], job[1])
+        _cost += distance_no_calc(nearest_agent, job[0], _map)
+        _cost += distance_no_calc(job[0], job[1], _map)
     elif 'idle_goal' in vals.keys():
         idle_goal = vals['idle_goal']
         _cost = 0
         nearest_agent = get_nearest(agentposes, idle_goal[0])
-        path_len = distance_no_calc(nearest_agent, idle_goal[0])
+        path_len = distance_no_calc(nearest_agent, idle_goal[0], _map)
         prob = norm.cdf(path_len, loc=idle_goal[1][0], scale=idle_goal[1][1])
         _cost += prob * path_len
     else:
@@ -439,21 +748,25 @@ def goal_test(_condition: dict, _state: tuple) -> bool:
 # Path Helpers
 
 
-def distance_no_calc(start: tuple, goal: tuple):
+def distance_no_calc(start: tuple, goal: tuple, _map: np.array):
     """
     Return actual path length if precalculated available, else the manhattan distance
 
     Args:
       start: from
       goal: to
+      _map: the map the path is on
 
     Returns:
       Distance
     """
-    index = tuple([start, goal])
-    if index in path_save.keys():
-        p = path_save[index]
+    p = path_save.peek(path_key(start, goal, _map), False)
+    if p is not False:
         return path_duration(p)
+    fields = _distances['fields'] if _distances and _distances['fingerprint'] == fingerprint(_map) else {}
+    goal = tuple(goal[0:2])
+    if goal in fields and fields[goal][start[0], start[1]] < np.Inf:
+        return int(fields[goal][start[0], start[1]])
     else:
         return distance_manhattan(start, goal)
 
@@ -520,43 +833,143 @@ def reverse_path(path: list) -> list:
 
 
 def pre_calc_paths(jobs, idle_goals, grid, fname=None):
+    path_save_process = {}
     for job in jobs:
         # job distance itself
-        path(job[0], job[1], grid, [], calc=True)
+        path(job[0], job[1], grid, [], path_save_process, calc=True)
         # way from end to other jobs
         for next_job in jobs:
             if next_job is not job:
-                path(job[1], next_job[0], grid, [], calc=True)
+                path(job[1], next_job[0], grid, [], path_save_process, calc=True)
         # to idle goals
         for idle_goal in idle_goals:
-            path(job[1], idle_goal[0], grid, [], calc=True)
+            path(job[1], idle_goal[0], grid, [], path_save_process, calc=True)
+    path_save.update(path_save_process)
 
     # SAVE
-    if not fname:
-        fname = '/tmp/paths_' + str(uuid.uuid4()) + '.pkl'
-    save_paths(fname)
+    if fname:
+        save_paths(fname)
     return fname
 
 
 def pre_calc_distances(agents, tasks, idle_goals, grid, fname=None):
-    dist_at = np.zeros([len(agents), len(tasks)])
-    for ia, it in product(range(len(agents)), range(len(tasks))):
-        dist_at[ia, it] = distance_no_calc(agents[ia], tasks[it][0])
-    # tasks
-    dist_t = np.zeros([len(tasks)])
-    for it in range(len(tasks)):
-        dist_t[it] = distance_no_calc(tasks[it][0], tasks[it][1])
-    # tasks-tasks
-    dist_tt = np.zeros([len(tasks), len(tasks)])
-    for it1, it2 in product(range(len(tasks)), range(len(tasks))):
-        dist_tt[it1, it2] = distance_no_calc(tasks[it1][1], tasks[it2][0])
+    """
+    Distances between agents, tasks and idle goals from one distance field per goal
+    (instead of planning a path for every pair)
 
-    return {
-        'at': dist_at,
-        't': dist_t,
-        'tt': dist_tt
+    Args:
+      agents: agent poses
+      tasks: jobs
+      idle_goals: idle goals
+      grid: the map
+      fname: not used
+
+    Returns:
+      dict with the distances agent -> task start ('at'), task start -> task goal ('t'),
+      task goal -> task start ('tt') between these agents and tasks ('agents', 'tasks')
+      and the fields per goal ('fields') on the map ('fingerprint')
+    """
+    global _distances
+    goals = set(map(lambda task: tuple(task[0][0:2]), tasks))
+    goals.update(map(lambda task: tuple(task[1][0:2]), tasks))
+    goals.update(map(lambda idle_goal: tuple(idle_goal[0][0:2]), idle_goals))
+    _distances = {
+        'fields': distance_fields(sorted(goals), grid),
+        'fingerprint': fingerprint(grid)
     }
 
+    start_fields = stack_fields(list(map(lambda task: task[0], tasks)), grid)
+    goal_fields = stack_fields(list(map(lambda task: task[1], tasks)), grid)
+    idle_fields = stack_fields(list(map(lambda idle_goal: idle_goal[0], idle_goals)), grid)
+
+    task_starts = np.array(list(map(lambda task: task[0][0:2], tasks)), dtype=int).reshape(-1, 2)
+    task_goals = np.array(list(map(lambda task: task[1][0:2], tasks)), dtype=int).reshape(-1, 2)
+    _distances.update({
+        'at': field_distances(start_fields, task_starts, np.array(agents, dtype=int).reshape(-1, 2)).T,
+        't': pair_distances(goal_fields, task_goals, task_starts),
+        'tt': field_distances(start_fields, task_starts, task_goals).T,
+        'start_fields': start_fields,
+        'idle_fields': idle_fields,
+        'task_starts': task_starts,
+        'task_goals': task_goals,
+        'idle_coords': np.array(list(map(lambda idle_goal: idle_goal[0][0:2], idle_goals)), dtype=int).reshape(-1, 2),
+        'idle_distributions': np.array(list(map(lambda idle_goal: idle_goal[1], idle_goals)), dtype=float
+                                       ).reshape(-1, 2),
+        'agents': list(agents),
+        'tasks': list(tasks),
+        'idle_goals': list(idle_goals)
+    })
+    return _distances
+
+
+def stack_fields(goals: list, grid: np.array) -> np.array:
+    """The distance fields of these goals (from `_distances`) as array [goal, x, y]"""
+    fields = _distances['fields']
+    shape = (len(goals), grid.shape[1], grid.shape[0])  # fields are indexed [x, y]
+    if not goals:
+        return np.zeros(shape)
+    return np.stack(list(map(lambda goal: fields[tuple(goal[0:2])], goals)))
+
+
+def field_distances(_fields: np.array, goals: np.array, points: np.array) -> np.array:
+    """
+    Distances of points to the goals of the fields, the manhattan distance where the field has no path
+    (like `distance_no_calc`)
+
+    Args:
+      _fields: distance fields [goal, x, y] (see `stack_fields`)
+      goals: the goals of the fields [goal, (x, y)]
+      points: spatial points [point, (x, y)]
+
+    Returns:
+      distances [goal, point]
+    """
+    dists = _fields[:, points[:, 0], points[:, 1]]
+    no_path = np.isinf(dists)
+    if no_path.any():
+        manhattan = np.maximum(np.sum(np.abs(goals[:, np.newaxis, :] - points[np.newaxis, :, :]), axis=2),
+                               1)  # see `distance_manhattan`
+        dists[no_path] = manhattan[no_path]
+    return dists.astype(int)
+
+
+def pair_distances(_fields: np.array, goals: np.array, points: np.array) -> np.array:
+    """Like `field_distances` but only the distance of the i-th point to the i-th goal"""
+    dists = _fields[np.arange(len(_fields)), points[:, 0], points[:, 1]]
+    no_path = np.isinf(dists)
+    if no_path.any():
+        manhattan = np.maximum(np.sum(np.abs(goals - points), axis=1), 1)  # see `distance_manhattan`
+        dists[no_path] = manhattan[no_path]
+    return dists.astype(int)
+
+
+def distance_fields(goals: list, grid: np.array) -> dict:
+    """
+    Shortest path distances in steps of all cells to each of the goals (on the time invariant part of the map,
+    also on costmaps), computed by the workers of the running plan if there are some
+
+    Args:
+      goals: the spatial goals
+      grid: the map
+
+    Returns:
+      dict of goal -> distance field (indexed [x, y])
+    """
+    valss = list(map(lambda goal: {'goal': goal}, goals))
+    if _engine is not None:  # the workers have the map
+        res = _engine.map(get_distance_field, valss)
+    else:
+        for vals in valss:
+            vals['_map'] = grid
+        res = list(map(get_distance_field, valss))
+    return dict(zip(goals, res))
+
+
+def get_distance_field(vals):
+    _map = vals['_map'] if '_map' in vals else attach(_worker_grid_token)
+    # paths are planned in (x, y, t), see `path`, and their durations are counted in steps (see `path_duration`)
+    return heuristic_field(_map.swapaxes(0, 1), vals['goal'], steps=True)
+
 
 # Collision Helpers
 
@@ -564,7 +977,7 @@ def pre_calc_distances(agents, tasks, idle_goals, grid, fname=None):
 def get_paths_for_agent(vals):
     path_save_process = {}
     _agent_idle = vals['_agent_idle']
-    _map = vals['_map']
+    _map = vals['_map'] if '_map' in vals else attach(_worker_grid_token)
     agent_job = vals['agent_job']
     agent_pos = vals['agent_pos']
     alloc_jobs = vals['alloc_jobs']
@@ -572,8 +985,9 @@ def get_paths_for_agent(vals):
     i_a = vals['i_a']
     idle_goals = vals['idle_goals']
     jobs = vals['jobs']
+    # paths for the first jobs that are known already
+    n_known, paths_for_agent = vals['prefix'] if 'prefix' in vals else (0, tuple())
     # -------
-    paths_for_agent = tuple()
     if i_a in blocks.keys():
         block = blocks[i_a]
     else:
@@ -581,7 +995,7 @@ def get_paths_for_agent(vals):
     assigned_jobs = agent_job[i_a]
     pose = agent_pos[i_a][0:2]
     t_shift = 0
-    for ij in assigned_jobs:
+    for ij in assigned_jobs[n_known:]:
         if (i_a, ij) in alloc_jobs:  # can be first only; need to go to goal only
             p, path_save_process = path(pose, jobs[ij][1], _map, block, path_save_process, calc=True)
             if not p:
@@ -609,9 +1023,18 @@ def get_paths_for_agent(vals):
         if not p:
             return False
         paths_for_agent += (p,)
+    path_save.update(path_save_process, persist=False)  # for the next tasks of this worker
     return paths_for_agent, path_save_process
 
 
+def get_paths_for_agent_timed(vals):
+    """`get_paths_for_agent`, the time it took in the worker and the hits and misses of the worker's path cache"""
+    start = time.perf_counter()
+    hits, misses = path_save.hits, path_save.misses
+    res = get_paths_for_agent(vals)
+    return res, (time.perf_counter() - start, path_save.hits - hits, path_save.misses - misses)
+
+
 def get_paths(_condition: dict, _state: tuple):
     """
     Get the path_save for a given state
@@ -624,33 +1047,82 @@ def get_paths(_condition: dict, _state: tuple):
       list of tuples per agent with all paths for this agent as lists of tuples of coords [([(..)])]
       False if one agent was not able to reach its goal
     """
+    with _stats.timer('get_paths'):
+        return _get_paths(_condition, _state)
+
+
+def _get_paths(_condition: dict, _state: tuple):
     (agent_pos, jobs, alloc_jobs, idle_goals, _map) = condition2comp(_condition)
-    (agent_job, _agent_idle, blocked) = state2comp(_state)
-    _agent_idle = np.array(_agent_idle)
-    _paths = []
+    (agent_job, agent_idle, blocked) = state2comp(_state)
+    _agent_idle = np.array(agent_idle)
     blocks = get_blocks_dict(blocked)
+    map_fingerprint = fingerprint(_map)
+    # only agents whose jobs, idle goal or blocks changed need to be planned
+    keys = []
+    _paths = [None] * len(agent_pos)
     valss = []
     for i_a in range(len(agent_pos)):
-        valss.append({'_agent_idle': _agent_idle,
-                      '_map': _map,
-                      'agent_job': agent_job,
-                      'agent_pos': agent_pos,
-                      'alloc_jobs': alloc_jobs,
-                      'blocks': blocks,
-                      'i_a': i_a,
-                      'idle_goals': idle_goals,
-                      'jobs': jobs})
-    global pool
-    res = list(pool.map(get_paths_for_agent, valss))
-    for r in res:
-        if not r:
-            return False
+        keys.append(agent_paths_key(map_fingerprint, agent_pos, jobs, alloc_jobs, idle_goals, blocks,
+                                    i_a, agent_job[i_a], agent_idle[i_a]))
+        if keys[i_a] in _agent_paths:
+            _stats.count('agent_paths_hits')
+            _paths[i_a] = _agent_paths[keys[i_a]]
+            continue
+        _stats.count('agent_paths_misses')
+        vals = {'_agent_idle': _agent_idle,
+                'agent_job': agent_job,
+                'agent_pos': agent_pos,
+                'alloc_jobs': alloc_jobs,
+                'blocks': blocks,
+                'i_a': i_a,
+                'idle_goals': idle_goals,
+                'jobs': jobs}
+        # if the paths for all but the last job are known, only the last one is planned
+        for n_known in [len(agent_job[i_a]), len(agent_job[i_a]) - 1]:
+            if 0 < n_known < len(agent_job[i_a]) + len(agent_idle[i_a]):
+                prefix = _agent_paths.get(agent_paths_key(map_fingerprint, agent_pos, jobs, alloc_jobs, idle_goals,
+                                                          blocks, i_a, agent_job[i_a][:n_known], ()))
+                if prefix is False:
+                    _paths[i_a] = False  # the last job(s) will not help
+                    break
+                elif prefix is not None:
+                    vals['prefix'] = (n_known, prefix)
+                    break
+        if _paths[i_a] is None:
+            valss.append(vals)
+
+    if _engine is not None and valss:  # the workers have the map
+        start = time.perf_counter()
+        res, measured = zip(*_engine.map(get_paths_for_agent_timed, valss))
+        work_times, hits, misses = zip(*measured)
+        _stats.pool(time.perf_counter() - start, work_times, _engine.processes)
+        _stats.count('path_cache_hits', sum(hits))
+        _stats.count('path_cache_misses', sum(misses))
+    elif _engine is not None:
+        res = []
+    else:
+        for vals in valss:
+            vals['_map'] = _map
+        res = list(map(get_paths_for_agent, valss))
+    if len(_agent_paths) + len(res) > MAX_AGENT_PATHS:
+        _agent_paths.clear()
+    for vals, r in zip(valss, res):
+        i_a = vals['i_a']
+        if r:
+            path_save.update(r[1])
+            if agent_idle[i_a]:  # the paths for the jobs only can be a prefix later
+                _agent_paths[agent_paths_key(map_fingerprint, agent_pos, jobs, alloc_jobs, idle_goals, blocks,
+                                             i_a, agent_job[i_a], ())] = r[0][:-1]
+            _paths[i_a] = r[0]
+        else:
+            _paths[i_a] = False
+        _agent_paths[keys[i_a]] = _paths[i_a]
 
+    for paths_for_agent in _paths:
+        if paths_for_agent is False:
+            return False
         # TODO: check at runtime if debugging
-        # debug_time_jump_in_paths([r[0]])
-
-        _paths.append(r[0])
-        path_save.update(r[1])
+        # debug_time_jump_in_paths([paths_for_agent])
     longest = max(map(lambda p: len(reduce(lambda a, b: a + b, p, [])), _paths))
     if _config['finished_agents_block']:
         (left_agent_pos, left_idle_goals, left_jobs
@@ -664,6 +1136,33 @@ def get_paths(_condition: dict, _state: tuple):
     return _paths
 
 
+def agent_paths_key(map_fingerprint: str, agent_pos: list, jobs: list, alloc_jobs: list, idle_goals: list,
+                    blocks: dict, i_a: int, assigned_jobs: tuple, idle_assignment: tuple) -> tuple:
+    """
+    Key of everything the paths of one agent depend on (see `get_paths_for_agent`)
+
+    Args:
+      map_fingerprint: fingerprint of the map
+      agent_pos: poses of all agents
+      jobs: all jobs
+      alloc_jobs: preallocated jobs
+      idle_goals: all idle goals
+      blocks: blocks per agent
+      i_a: the agent
+      assigned_jobs: jobs assigned to this agent
+      idle_assignment: idle goal assigned to this agent
+
+    Returns:
+      the key as hashable tuple
+    """
+    return (map_fingerprint,
+            tuple(agent_pos[i_a][0:2]),
+            tuple(map(lambda ij: tuple(jobs[ij][0]) + tuple(jobs[ij][1]) + ((i_a, ij) in alloc_jobs,),
+                      assigned_jobs)),
+            tuple(idle_goals[idle_assignment[0]][0]) if len(idle_assignment) else (),
+            tuple(blocks[i_a]) if i_a in blocks.keys() else ())
+
+
 def fill_up_paths(longest: int, _paths: list, agent_pos: list, blocks: list) -> list:
     if longest > 0:
         res_paths = []
@@ -720,10 +1219,87 @@ def get_nearest(points, coord):
 
 def find_collision(_paths: list, all_collisions=False) -> tuple:
     """
-    Find collisions in a set of paths. Will return vortex or edge
+    Find collisions in a set of paths. Will return vortex or edge.
+    Vortexes and edges are packed into integer keys and repeated keys are found with numpy at once
+    (few poses are checked in the loop of `find_collision_loop`).
+    Like walking through the paths agent by agent, pose by pose (vortex before edge),
+    the collision is with the agent that was there first.
 
     Args:
       _paths: set of path_save
+      all_collisions: return all collisions, not only the first one
+
+    Returns:
+      first found vortex or edge (or all of them)
+    """
+    if sum(map(lambda agent_paths: sum(map(len, agent_paths)), _paths)) < MIN_POSES_VECTORIZED:
+        return find_collision_loop(_paths, all_collisions)  # faster without the numpy overhead
+    poses = []  # all poses, agent by agent
+    agents = []
+    edge_ok = []  # whether there is a following pose of the same agent
+    stopped = False
+    for agent, agent_paths in enumerate(_paths):
+        if all(map(lambda x: len(x) == 0, agent_paths)):
+            stopped = True  # no paths -> only the agents before are checked, like in `find_collision_loop`
+            break
+        n = len(poses)
+        for p in agent_paths:
+            poses.extend(p)
+        agents.append(np.full(len(poses) - n, agent))
+        edge_ok.append(np.arange(n + 1, len(poses) + 1) < len(poses))
+    if not poses:
+        return [] if all_collisions and not stopped else ()
+    agents = np.concatenate(agents)
+    edge_ok = np.concatenate(edge_ok)
+
+    xyt = np.fromiter(chain.from_iterable(poses), dtype=np.int64, count=3 * len(poses)).reshape(len(poses), 3)
+    xyt -= np.min(xyt, axis=0)
+    n_y = np.max(xyt[:, 1]) + 1
+    n_xy = (np.max(xyt[:, 0]) + 1) * n_y
+    xy = xyt[:, 0] * n_y + xyt[:, 1]  # packed in the order of (x, y) tuples
+    vertex_keys = xyt[:, 2] * n_xy + xy
+
+    i_edges = np.flatnonzero(edge_ok)
+    xy_next = xy[i_edges + 1]
+    edge_keys = (xyt[i_edges, 2] * n_xy + np.maximum(xy[i_edges], xy_next)) * n_xy + np.minimum(xy[i_edges], xy_next)
+
+    # (pose index, 0 for vertex or 1 for edge, index of the first pose with this key)
+    found = []
+    for kind, keys, i_keys in [(VERTEX, vertex_keys, np.arange(len(poses))), (EDGE, edge_keys, i_edges)]:
+        if not len(keys):
+            continue
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        repeated = np.flatnonzero(first[inverse] != np.arange(len(keys)))
+        found.append(np.stack([i_keys[repeated],
+                               np.full(len(repeated), kind),
+                               i_keys[first[inverse[repeated]]]], axis=1))
+    found = np.concatenate(found)
+    found = found[np.lexsort((found[:, 1], found[:, 0]))]
+    if not all_collisions:
+        found = found[:1]
+
+    collisions = []
+    for i, kind, i_first in found.tolist():
+        pose = poses[i]
+        if kind == VERTEX:
+            collisions.append((VERTEX, pose[:2] + (pose[2],), (int(agents[i]), int(agents[i_first]))))
+        else:
+            a, b = pose[:2], poses[i + 1][:2]
+            edge = (a, b) if a > b else (b, a)
+            collisions.append((EDGE, edge + (pose[2],), (int(agents[i]), int(agents[i_first]))))
+    if (not all_collisions or stopped) and not collisions:
+        return ()
+    return collisions
+
+
+def find_collision_loop(_paths: list, all_collisions=False) -> tuple:
+    """
+    Find collisions in a set of paths, pose by pose. Will return vortex or edge.
+    `find_collision` uses this for few poses, where it is faster than numpy.
+
+    Args:
+      _paths: set of path_save
+      all_collisions: return all collisions, not only the first one
 
     Returns:
       first found vortex or edge
@@ -734,7 +1310,7 @@ def find_collision(_paths: list, all_collisions=False) -> tuple:
     collisions = []
     for agent_paths in _paths:
         if all(map(lambda x: len(x) == 0, agent_paths)):
-            return ()  # no paths -> no collision
+            return collisions if collisions else ()  # no paths -> no collision with the agents after
         elif len(agent_paths) > 1:
             path = reduce(lambda a, b: a + b, agent_paths)
         else:
@@ -911,36 +1487,86 @@ def comp2state(agent_job: tuple,
       blocked: tuple: 
 
     Returns:
-      the state tuple
+      the state (unpacks like a tuple)
+    """
+    return State(agent_job, _agent_idle, blocked)
+
+
+def block_sort_key(blocked_i):
+    """Order of blocks and conflicts in a state (blocks first)"""
+    return is_conflict_not_block(blocked_i), blocked_i
+
+
+class State(object):
+    """
+    Search state of agent -> job and agent -> idle goal assignments and blocks.
+    The blocks are sorted, so states with the same blocks are equal, and the hash is computed only once.
+    It can be used like the tuple (agent_job, agent_idle, blocked).
     """
-    return agent_job, _agent_idle, blocked
+    __slots__ = ('agent_job', 'agent_idle', 'blocked', '_hash')
+
+    def __init__(self, agent_job: tuple, agent_idle: tuple, blocked: tuple):
+        self.agent_job = agent_job
+        self.agent_idle = agent_idle
+        self.blocked = tuple(sorted(blocked, key=block_sort_key))
+        self._hash = hash((agent_job, agent_idle, self.blocked))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, State) or self._hash != other._hash:
+            return False
+        return (self.agent_job == other.agent_job and
+                self.agent_idle == other.agent_idle and
+                self.blocked == other.blocked)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter((self.agent_job, self.agent_idle, self.blocked))
+
+    def __getitem__(self, i):
+        return (self.agent_job, self.agent_idle, self.blocked)[i]
+
+    def __getstate__(self):
+        return self.agent_job, self.agent_idle, self.blocked
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return "State(%r, %r, %r)" % (self.agent_job, self.agent_idle, self.blocked)
 
 
 def generate_config():
     return {
-        'filename_pathsave': 'path_save.pkl',  # filename to save path cache
+        'filename_pathsave': 'path_save.paths',  # filename of the path store to persist path cache
         'finished_agents_block': False,  # weather finished agents stand around and block others
         'number_nearest': 0,  # 0 means all, otherwise only n nearest possible agents are checked
         'all_collisions': False,  # whether to insert all collisions as block (suboptimal)
         'heuristic_colission': False,  # whether to use heuristic collisions resolution (suboptimal)
+        'path_cache_max_entries': MAX_ENTRIES,  # maximum number of paths in path_save
+        'path_cache_max_bytes': MAX_BYTES,  # memory budget of path_save
+        'time_limit': 0,  # seconds to return the best solution found so far (0 means until the optimum)
+        'suboptimality': 1,  # weight of the heuristic, a solution is found faster with more than 1
     }
 
 
 def save_paths(filename):
-    try:
-        with open(filename, 'wb') as f:
-            pickle.dump(path_save, f, pickle.HIGHEST_PROTOCOL)
-    except Exception as e:
-        logging.error("Error saving paths: " + str(e))
+    if filename:
+        path_save.save(filename)
 
 
 def load_paths(filename):
-    global path_save
-    try:
-        with open(filename, 'rb') as f:
-            path_save = pickle.load(f)
-    except FileNotFoundError:
-        logging.warning("File %s does not exist", filename)
+    if filename:
+        path_save.attach(filename)
 
 
 def debug_time_jump_in_paths(paths):
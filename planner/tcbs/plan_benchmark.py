@@ -0,0 +1,422 @@
+import datetime
+import multiprocessing
+import pickle
+from itertools import product
+
+import numpy as np
+
+from planner.astar.astar_grid48con import distance_manhattan
+from planner.common import path_save
+from planner.tcbs import base, plan
+from planner.tcbs.plan import PlannerEngine, comp2condition, comp2state, evaluate, generate_config, get_children, \
+    get_paths
+
+
+class CopyingEngine(PlannerEngine):
+    """Like the planner used to work: the map is pickled with every task"""
+
+    def set_grid(self, grid: np.array):
+        self.grid = grid
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(processes=self.processes)
+
+    def map(self, fun, valss: list) -> list:
+        for vals in valss:
+            vals['_map'] = self.grid
+        return super(CopyingEngine, self).map(fun, valss)
+
+
+def count_bytes(engine_class):
+    """An engine class that sums up the bytes of all tasks sent to the workers"""
+
+    class CountingEngine(engine_class):
+        task_bytes = 0
+
+        def map(self, fun, valss: list) -> list:
+            res = super(CountingEngine, self).map(fun, valss)
+            self.task_bytes += sum(map(lambda vals: len(pickle.dumps(vals)), valss))
+            return res
+
+    return CountingEngine
+
+
+def free_coords(grid):
+    """All free (x, y) coordinates of a map (indexed [y, x, t] like in `planner.common.path`)"""
+    ys, xs = np.where(grid[:, :, 0] == 0)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def get_problem(size, n_agents=4, seed=0):
+    rand = np.random.RandomState(seed)
+    grid = np.zeros([size, size, size * 4])
+    grid[rand.randint(0, size, size), rand.randint(0, size, size), :] = -1
+    free = free_coords(grid)
+    coords = [free[i] for i in rand.choice(len(free), 3 * n_agents, replace=False)]
+    agent_pos = coords[:n_agents]
+    jobs = [(coords[n_agents + 2 * i], coords[n_agents + 2 * i + 1], 0) for i in range(n_agents)]
+    return agent_pos, jobs, grid
+
+
+def compare_transport(sizes=(10, 25, 50), calls=10, processes=4):
+    """Bytes sent to the workers and duration per `get_paths` call with the map in every task
+    against the map in shared memory
+
+    Returns:
+      bytes per call and durations per call as arrays [sizes, (copying, shared)]
+    """
+    plan._config = generate_config()
+    task_bytes = np.zeros([len(sizes), 2])
+    ts = np.zeros([len(sizes), 2])
+    for i_size, size in enumerate(sizes):
+        agent_pos, jobs, grid = get_problem(size)
+        condition = comp2condition(agent_pos, jobs, [], [], grid)
+        state = comp2state(tuple((i,) for i in range(len(agent_pos))), tuple(() for _ in agent_pos), ())
+        for i_e, engine_class in enumerate([CopyingEngine, PlannerEngine]):
+            with count_bytes(engine_class)(processes=processes) as engine:
+                plan._engine = engine
+                engine.set_grid(grid)
+                paths = get_paths(condition, state)  # warm up the paths in the workers
+                startt = datetime.datetime.now()
+                for _ in range(calls):
+                    assert get_paths(condition, state) == paths, "Paths should not depend on the transport"
+                ts[i_size, i_e] = (datetime.datetime.now() - startt).total_seconds() / calls
+                task_bytes[i_size, i_e] = engine.task_bytes / (calls + 1)
+        plan._engine = None
+        print("size %4d (grid %8.1fMB): copying %10.0fB %8.4fs | shared %10.0fB %8.4fs per get_paths" % (
+            size, grid.nbytes / 1E6, task_bytes[i_size, 0], ts[i_size, 0], task_bytes[i_size, 1], ts[i_size, 1]))
+    return task_bytes, ts
+
+
+def astar_base_list(start, condition, heuristic, get_children, cost, goal_test, evaluate=None, stats=None):
+    """The original `base.astar_base` with list based open and closed sets and separate cost and heuristic calls
+    (evaluate and stats are not used), to compare against"""
+    _, start = cost(condition, start)  # it may have collisions
+
+    closed = []
+    open = [start]
+    g_score = {}
+    g_score[start] = 0
+    f_score = {}
+    f_score[start] = heuristic(condition, start)
+
+    f_score_open = np.array([])
+    f_score_open = np.append(f_score_open, f_score[start])
+
+    while len(open) > 0:
+        # the node in openSet having the lowest fScore[] value
+        current = argmin_f_open(open, f_score_open)
+
+        if goal_test(condition, current):
+            return current
+
+        i_rm = open.index(current)
+        open.remove(current)
+        f_score_open = np.delete(f_score_open, i_rm)
+
+        closed.append(current)
+        children = get_children(condition, current)
+        for neighbor in children:
+
+            if neighbor in closed:
+                continue  # Ignore the neighbor which is already evaluated.
+            # The distance from start to a neighbor
+            c, neighbor = cost(condition, neighbor)
+
+            if c >= base.MAX_COST:
+                closed.append(neighbor)
+                continue  # This is not part of a plan
+
+            tentative_g_score = c
+
+            append = True
+            if neighbor not in open:  # Discover a new node
+                open.append(neighbor)
+            elif tentative_g_score >= g_score[neighbor]:
+                continue  # This is not a better path.
+            else:
+                append = False
+            g_score[neighbor] = tentative_g_score
+            the_f_score = tentative_g_score + heuristic(condition, neighbor)
+            f_score[neighbor] = the_f_score
+            if append:
+                f_score_open = np.append(f_score_open, the_f_score)
+
+    raise RuntimeError("Can not find a solution")
+
+
+def argmin_f_open(open_list, f_score_open):
+    assert len(open_list) == len(f_score_open), "Lengths must be equal"
+    return open_list[np.argmin(f_score_open)]
+
+
+class NoMemo(dict):
+    """Forgets everything, to plan without the per agent memo"""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def count_expansions(fun):
+    """Wrap get_children to count the expanded states"""
+
+    def counted(*args):
+        counted.n += 1
+        return fun(*args)
+
+    counted.n = 0
+    return counted
+
+
+def compare_agent_paths_memo(n_agents=(2, 3, 4), size=10, processes=4):
+    """Expanded states per second of plan() without and with the per agent path memo
+
+    Returns:
+      expansions per second as array [n_agents, (no memo, memo)]
+    """
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    rate = np.zeros([len(n_agents), 2])
+    for i_n, n in enumerate(n_agents):
+        agent_pos, jobs, grid = get_problem(size, n_agents=n)
+        for i_m, memo in enumerate([NoMemo(), {}]):
+            plan._agent_paths = memo
+            plan.get_children = count_expansions(get_children)
+            with PlannerEngine(processes=processes) as engine:
+                startt = datetime.datetime.now()
+                plan.plan(agent_pos, jobs, [], [], grid, config, engine=engine)
+                rate[i_n, i_m] = plan.get_children.n / (datetime.datetime.now() - startt).total_seconds()
+        plan._agent_paths = {}
+        plan.get_children = get_children
+        print("%2d agents: no memo %8.1f/s | memo %8.1f/s expansions" % (n, rate[i_n, 0], rate[i_n, 1]))
+    return rate
+
+
+def compare_search(n_agents=(2, 3, 4), size=8, processes=4):
+    """Duration of plan() with the list based TCBS search against the heap and hashed sets
+
+    Returns:
+      durations and expanded states as arrays [n_agents, (list, heap)]
+    """
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    ts = np.zeros([len(n_agents), 2])
+    expansions = np.zeros([len(n_agents), 2])
+    for i_n, n in enumerate(n_agents):
+        agent_pos, jobs, grid = get_problem(size, n_agents=n)
+        for i_s, search in enumerate([astar_base_list, base.astar_base]):
+            plan.astar_base = search
+            plan.get_children = count_expansions(get_children)
+            with PlannerEngine(processes=processes) as engine:
+                startt = datetime.datetime.now()
+                plan.plan(agent_pos, jobs, [], [], grid, config, engine=engine)
+                ts[i_n, i_s] = (datetime.datetime.now() - startt).total_seconds()
+            expansions[i_n, i_s] = plan.get_children.n
+        plan.astar_base = base.astar_base
+        plan.get_children = get_children
+        print("%2d agents: list %8.4fs (%6d states) | heap %8.4fs (%6d states)" % (
+            n, ts[i_n, 0], expansions[i_n, 0], ts[i_n, 1], expansions[i_n, 1]))
+    return ts, expansions
+
+
+def compare_evaluate(n_agents=(2, 3, 4), size=10, processes=4):
+    """Duration of plan() with cost and heuristic evaluated separately against the fused evaluate
+    (without the per agent memo, which would hide the second get_paths call)
+
+    Returns:
+      durations as array [n_agents, (separate, fused)]
+    """
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    ts = np.zeros([len(n_agents), 2])
+    for i_n, n in enumerate(n_agents):
+        agent_pos, jobs, grid = get_problem(size, n_agents=n)
+        plan._agent_paths = NoMemo()
+        for i_e, fun in enumerate([None, evaluate]):
+            plan.evaluate = fun  # astar_base calls cost and heuristic without it
+            with PlannerEngine(processes=processes) as engine:
+                startt = datetime.datetime.now()
+                plan.plan(agent_pos, jobs, [], [], grid, config, engine=engine)
+                ts[i_n, i_e] = (datetime.datetime.now() - startt).total_seconds()
+        plan._agent_paths = {}
+        plan.evaluate = evaluate
+        print("%2d agents: separate %8.4fs | fused %8.4fs" % (n, ts[i_n, 0], ts[i_n, 1]))
+    return ts
+
+
+def lanes(n_agents, length):
+    """Paths without collisions: every agent in its own row"""
+    return [([(i, t % 50, t) for t in range(length)],) for i in range(n_agents)]
+
+
+def compare_find_collision(sizes=((4, 50), (20, 200), (40, 400)), repeat=20):
+    """Duration of find_collision against the pose by pose loop on paths without collisions
+
+    Returns:
+      durations as array [sizes, all_collisions, (loop, vectorized)]
+    """
+    ts = np.zeros([len(sizes), 2, 2])
+    for i_size, (n_agents, length) in enumerate(sizes):
+        _paths = lanes(n_agents, length)
+        for i_all, all_collisions in enumerate([False, True]):
+            for i_f, fun in enumerate([plan.find_collision_loop, plan.find_collision]):
+                startt = datetime.datetime.now()
+                for _ in range(repeat):
+                    fun(_paths, all_collisions)
+                ts[i_size, i_all, i_f] = (datetime.datetime.now() - startt).total_seconds() / repeat
+            print("%2d agents, %4d steps, all_collisions %5s: loop %8.5fs | vectorized %8.5fs" % (
+                n_agents, length, all_collisions, ts[i_size, i_all, 0], ts[i_size, i_all, 1]))
+    return ts
+
+
+def get_jobs(size, n_jobs, seed=0):
+    rand = np.random.RandomState(seed)
+    grid = np.zeros([size, size, size * 4])
+    grid[rand.randint(0, size, size), rand.randint(0, size, size), :] = -1
+    free = free_coords(grid)
+    coords = [free[i] for i in rand.choice(len(free), 2 * n_jobs + 4, replace=False)]
+    agent_pos = coords[:4]
+    jobs = [(coords[4 + 2 * i], coords[5 + 2 * i], 0) for i in range(n_jobs)]
+    return agent_pos, jobs, grid
+
+
+def path_distance(start, goal, grid):
+    _path, _ = plan.path(start, goal, grid, [], {})
+    return plan.path_duration(_path) if _path else distance_manhattan(start, goal)
+
+
+def pairwise_distances(agents, tasks, grid):
+    """The distance matrices from one planned path per pair (like before distance fields)"""
+    dist_at = np.zeros([len(agents), len(tasks)])
+    for ia, it in product(range(len(agents)), range(len(tasks))):
+        dist_at[ia, it] = path_distance(agents[ia], tasks[it][0], grid)
+    dist_t = np.zeros([len(tasks)])
+    for it in range(len(tasks)):
+        dist_t[it] = path_distance(tasks[it][0], tasks[it][1], grid)
+    dist_tt = np.zeros([len(tasks), len(tasks)])
+    for it1, it2 in product(range(len(tasks)), range(len(tasks))):
+        dist_tt[it1, it2] = path_distance(tasks[it1][1], tasks[it2][0], grid)
+    return {'at': dist_at, 't': dist_t, 'tt': dist_tt}
+
+
+def compare_pre_calc(n_jobs=(10, 25, 50), size=30, processes=4):
+    """Duration of the distance matrices from a path per pair against a distance field per goal
+
+    Returns:
+      durations as array [n_jobs, (paths, fields)]
+    """
+    ts = np.zeros([len(n_jobs), 2])
+    for i_n, n in enumerate(n_jobs):
+        agent_pos, jobs, grid = get_jobs(size, n)
+        path_save.clear()
+        startt = datetime.datetime.now()
+        by_paths = pairwise_distances(agent_pos, jobs, grid)
+        ts[i_n, 0] = (datetime.datetime.now() - startt).total_seconds()
+        with PlannerEngine(processes=processes) as engine:
+            engine.set_grid(grid)
+            plan._engine = engine
+            path_save.clear()
+            startt = datetime.datetime.now()
+            by_fields = plan.pre_calc_distances(agent_pos, jobs, [], grid)
+            ts[i_n, 1] = (datetime.datetime.now() - startt).total_seconds()
+        plan._engine = None
+        plan._distances = None
+        for key in ['at', 't', 'tt']:
+            assert np.array_equal(by_paths[key], by_fields[key]), "Distances differ"
+        print("%3d jobs: paths %8.4fs | fields %8.4fs" % (n, ts[i_n, 0], ts[i_n, 1]))
+    return ts
+
+
+def compare_heuristic(n_jobs=(10, 25, 50), size=30, repeat=10):
+    """Duration of the heuristic per state: job by job against the precalculated distances
+
+    Returns:
+      durations per state as array [n_jobs, (job by job, distances)]
+    """
+    plan._config = generate_config()
+    ts = np.zeros([len(n_jobs), 2])
+    for i_n, n in enumerate(n_jobs):
+        agent_pos, jobs, grid = get_jobs(size, n)
+        idle_goals = [(job[1], (size, size / 4)) for job in jobs[:2]]
+        condition = comp2condition(agent_pos, jobs, [], idle_goals, grid)
+        start = comp2state(tuple(() for _ in agent_pos), tuple(() for _ in agent_pos), ())
+        states = [start] + get_children(condition, start)
+        plan.pre_calc_distances(agent_pos, jobs, idle_goals, grid)
+        pathss = list(map(lambda state: get_paths(condition, state), states))
+        for i_h, fun in enumerate([plan.heuristic_of_paths_loop, plan.heuristic_of_paths]):
+            startt = datetime.datetime.now()
+            for _ in range(repeat):
+                hs = list(map(lambda i_s: fun(condition, states[i_s], pathss[i_s]), range(len(states))))
+            ts[i_n, i_h] = (datetime.datetime.now() - startt).total_seconds() / repeat / len(states)
+            if i_h == 0:
+                hs_loop = hs
+        assert np.allclose(hs_loop, hs), "Heuristics differ"
+        plan._distances = None
+        print("%3d jobs: job by job %8.6fs | distances %8.6fs per state" % (n, ts[i_n, 0], ts[i_n, 1]))
+    return ts
+
+
+def compare_anytime(n_agents=(3, 4), time_limits=(.1, .25, .5), suboptimality=2, size=10, processes=4):
+    """Exact search against the anytime mode with time limits: duration and the summed length of all paths
+
+    Returns:
+      durations and path lengths as array [n_agents, (exact, time limits ...), (duration, length)]
+    """
+    res = np.zeros([len(n_agents), len(time_limits) + 1, 2])
+    for i_n, n in enumerate(n_agents):
+        agent_pos, jobs, grid = get_problem(size, n_agents=n)
+        with PlannerEngine(processes=processes) as engine:
+            for i_t, time_limit in enumerate((0,) + tuple(time_limits)):
+                config = generate_config()
+                config['filename_pathsave'] = ''
+                config['time_limit'] = time_limit
+                config['suboptimality'] = suboptimality if time_limit else 1
+                path_save.clear()
+                startt = datetime.datetime.now()
+                try:
+                    _, _, paths, bound = plan.plan_anytime(agent_pos, jobs, [], [], grid, config, engine=engine)
+                    res[i_n, i_t, 1] = sum(map(lambda _path: len(_path) - 1, (p for ps in paths for p in ps)))
+                except RuntimeError:  # no solution in time
+                    res[i_n, i_t, 1], bound = np.nan, np.nan
+                res[i_n, i_t, 0] = (datetime.datetime.now() - startt).total_seconds()
+                print("%2d agents, time limit %5.2fs: %8.4fs | length %4.0f | bound %6.3f" % (
+                    n, time_limit, res[i_n, i_t, 0], res[i_n, i_t, 1], bound))
+    return res
+
+
+def compare_warm_start(n_agents=(2, 3, 4), size=10, processes=4, seed=0):
+    """Replanning after a new job: from scratch against starting from the last plan
+
+    Returns:
+      durations and expanded states as array [n_agents, (scratch, warm start), (duration, expansions)]
+    """
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    rand = np.random.RandomState(seed)
+    res = np.zeros([len(n_agents), 2, 2])
+    for i_n, n in enumerate(n_agents):
+        agent_pos, jobs, grid = get_problem(size, n_agents=n, seed=seed)
+        free = list(set(free_coords(grid)) - set(agent_pos) - set(map(lambda job: job[1], jobs)))
+        new_job = tuple(free[i] for i in rand.choice(len(free), 2, replace=False)) + (0,)
+        with PlannerEngine(processes=processes) as engine:
+            agent_job, agent_idle, _ = plan.plan(agent_pos, jobs, [], [], grid, config, engine=engine)
+            for i_w, warm_start in enumerate([None, (agent_job, agent_idle)]):
+                plan.get_children = count_expansions(get_children)
+                startt = datetime.datetime.now()
+                plan.plan(agent_pos, jobs + [new_job], [], [], grid, config, engine=engine, seed=warm_start)
+                res[i_n, i_w] = (datetime.datetime.now() - startt).total_seconds(), plan.get_children.n
+        plan.get_children = get_children
+        print("%2d agents: scratch %8.4fs (%5d expansions) | warm start %8.4fs (%5d expansions)" % (
+            n, res[i_n, 0, 0], res[i_n, 0, 1], res[i_n, 1, 0], res[i_n, 1, 1]))
+    return res
+
+
+if __name__ == "__main__":
+    compare_transport()
+    compare_agent_paths_memo()
+    compare_search()
+    compare_evaluate()
+    compare_find_collision()
+    compare_pre_calc()
+    compare_heuristic()
+    compare_anytime()
+    compare_warm_start()
@@ -0,0 +1,113 @@
+import json
+import time
+
+COUNTERS = (
+    'expansions',  # states taken from the open set and expanded
+    'generated',  # children of expanded states
+    'pruned',  # children that are not part of a plan (MAX_COST)
+    'pruned_bound',  # children that can not improve the best solution (anytime search)
+    'duplicates',  # children that were closed already or are open with a cost as good
+    'open_max',  # largest size of the open set
+    'closed',  # size of the closed set at the end
+    'path_cache_hits',  # paths of single jobs found in the path cache (of the planner and its workers)
+    'path_cache_misses',
+    'agent_paths_hits',  # paths of all jobs of an agent that were planned before
+    'agent_paths_misses',
+    'pool_tasks',  # agents planned by the workers
+)
+TIMERS = (
+    'total',  # the whole planning
+    'pre_calc',  # distances for the heuristic
+    'search',  # the A* search (includes get_paths and find_collision)
+    'get_paths',
+    'find_collision',
+    'pool_map',  # wall time of the maps to the workers
+    'pool_work',  # time the workers planned (summed over the workers)
+    'pool_ipc',  # estimated overhead of the maps: their wall time without the work done in parallel
+)
+GAUGES = ('open_max', 'closed')  # the other counters only go up
+
+
+class Timer(object):
+    """Context manager that adds the time it was in to a timer of the stats"""
+
+    def __init__(self, stats, name: str):
+        self.stats = stats
+        self.name = name
+        self.start = 0.
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.stats.timers[self.name] += time.perf_counter() - self.start
+
+
+class PlannerStats(object):
+    """
+    Counters and timers of one planning (see `COUNTERS` and `TIMERS`), filled by `plan`.
+    Can be written as JSON line or in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.timers = dict.fromkeys(TIMERS, 0.)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def maximum(self, name: str, value: int):
+        self.counters[name] = max(self.counters[name], value)
+
+    def timer(self, name: str) -> Timer:
+        """Time a block: `with stats.timer('get_paths'): ...`"""
+        return Timer(self, name)
+
+    def pool(self, map_time: float, work_times: list, processes: int):
+        """Account a map to the workers: its wall time and the time each task took in a worker"""
+        self.counters['pool_tasks'] += len(work_times)
+        self.timers['pool_map'] += map_time
+        self.timers['pool_work'] += sum(work_times)
+        if work_times:
+            parallel = sum(work_times) / min(processes, len(work_times))
+            self.timers['pool_ipc'] += max(map_time - parallel, 0.)
+
+    def hit_rate(self, name: str) -> float:
+        """Share of hits of the path_cache or agent_paths"""
+        n = self.counters[name + '_hits'] + self.counters[name + '_misses']
+        return self.counters[name + '_hits'] / n if n else 0.
+
+    def as_dict(self) -> dict:
+        res = dict(self.counters)
+        res.update({name + '_seconds': t for name, t in self.timers.items()})
+        res['path_cache_hit_rate'] = self.hit_rate('path_cache')
+        res['agent_paths_hit_rate'] = self.hit_rate('agent_paths')
+        return res
+
+    def to_jsonl(self, fname: str, **labels):
+        """Append the stats as one JSON line (with the time and these labels)"""
+        entry = {'time': time.time()}
+        entry.update(labels)
+        entry.update(self.as_dict())
+        with open(fname, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def to_prometheus(self, prefix: str = 'tcbs', **labels) -> str:
+        """The stats in the Prometheus text exposition format (with these labels)"""
+        label_str = ('{' + ','.join(map(lambda kv: '%s="%s"' % kv, sorted(labels.items()))) + '}'
+                     if labels else '')
+        lines = []
+        for name, value in self.counters.items():
+            if name in GAUGES:
+                metric = '%s_%s' % (prefix, name)
+                lines.append('# TYPE %s gauge' % metric)
+            else:
+                metric = '%s_%s_total' % (prefix, name)
+                lines.append('# TYPE %s counter' % metric)
+            lines.append('%s%s %d' % (metric, label_str, value))
+        for name, t in self.timers.items():
+            metric = '%s_%s_seconds_total' % (prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s%s %.6f' % (metric, label_str, t))
+        return '\n'.join(lines) + '\n'
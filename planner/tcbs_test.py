@@ -1,13 +1,19 @@
 import datetime
+import json
 import logging
 import os
 import random
+import time
 from functools import reduce
+from itertools import product
 
 import numpy as np
 
-from planner.tcbs import plan
-from planner.tcbs.plan import plan as plan_cbsext, generate_config
+from planner.common import VERTEX, EDGE
+from planner.tcbs import base, plan
+from planner.tcbs.plan import plan as plan_cbsext, generate_config, PlannerEngine
+from planner.tcbs.plan_benchmark import NoMemo, astar_base_list
+from planner.tcbs.stats import PlannerStats, COUNTERS, TIMERS
 from tools import is_travis
 
 rand = None
@@ -160,6 +166,316 @@ def test_basic():
     assert res_agent_idle == agent_idle, "wrong agent -> idle_goal assignment"
 
 
+def test_engine():
+    agent_idle, agent_job, agent_pos, grid, idle_goals, jobs = get_data_labyrinthian()
+    config = generate_config()
+    config['filename_pathsave'] = ''
+
+    with PlannerEngine(processes=2) as engine:
+        res_agent_job, res_agent_idle, _ = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config, engine=engine)
+        pool = engine.pool
+        assert pool is not None, "Engine should keep its workers after plan()"
+        res_agent_job2, res_agent_idle2, _ = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config,
+                                                         engine=engine)
+        assert engine.pool is pool, "Engine should reuse its workers for the same grid"
+
+        grid2 = grid.copy()
+        grid2[0, 0, :] = -1
+        engine.set_grid(grid2)
+        assert engine.pool is not pool, "Engine should restart its workers for a new grid"
+        pool = engine.pool
+        grid2[0, 1, :] = -1  # changed in place
+        engine.set_grid(grid2)
+        assert engine.pool is not pool, "Engine should restart its workers for a changed grid"
+    assert engine.pool is None, "Engine should be closed"
+
+    assert res_agent_job == res_agent_job2 == agent_job, "wrong agent -> job assignment"
+    assert res_agent_idle == res_agent_idle2 == agent_idle, "wrong agent -> idle_goal assignment"
+
+
+def test_agent_paths_memo():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    for seed in range(1, 4):
+        agent_pos, grid, idle_goals, jobs = get_data_random(seed, 8, 10, 3, 3, 2)
+        res_memo = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config)
+        assert len(plan._agent_paths) > 0, "Paths per agent should be memorized"
+        plan._agent_paths = NoMemo()
+        try:
+            res_no_memo = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config)
+        finally:
+            plan._agent_paths = {}
+        assert res_memo == res_no_memo, "Memo should not change the result for seed %d" % seed
+
+
+def test_state():
+    blocks = (((VERTEX, (1, 2, 3)), 0), (EDGE, ((1, 1), (1, 2), 4), (0, 1)), ((EDGE, ((1, 1), (1, 2), 4)), 1))
+    state = plan.comp2state(((0,), ()), ((), (1,)), blocks)
+    state_reversed = plan.comp2state(((0,), ()), ((), (1,)), tuple(reversed(blocks)))
+    assert state == state_reversed, "Order of blocks should not matter"
+    assert hash(state) == hash(state_reversed)
+    assert len({state, state_reversed}) == 1
+    assert state != plan.comp2state(((0,), ()), ((), (0,)), blocks)
+    agent_job, agent_idle, blocked = state
+    assert agent_job == ((0,), ()) and agent_idle == ((), (1,)), "Should unpack like a tuple"
+    assert set(blocked) == set(blocks)
+    assert plan.is_conflict_not_block(blocked[-1]), "Conflicts should be last"
+
+
+def test_astar_heap_same_as_list():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    for seed in range(1, 4):
+        agent_pos, grid, idle_goals, jobs = get_data_random(seed, 8, 10, 3, 3, 2)
+        res_heap = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config)
+        plan.astar_base = astar_base_list
+        try:
+            res_list = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config)
+        finally:
+            plan.astar_base = base.astar_base
+        assert res_heap == res_list, "Heap based search should find the same plan for seed %d" % seed
+
+
+def test_anytime():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    agent_pos, grid, idle_goals, jobs = get_data_random(1, 10, 10, 3, 5, 2)
+    res_agent_job, res_agent_idle, res_paths, bound = plan.plan_anytime(agent_pos, jobs, [], idle_goals, grid, config)
+    assert bound == 1, "Exact search should give the optimum"
+    assert (res_agent_job, res_agent_idle, res_paths) == plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config)
+
+    config['time_limit'] = .5
+    config['suboptimality'] = 2
+    start_time = datetime.datetime.now()
+    res_agent_job, _, res_paths, bound = plan.plan_anytime(agent_pos, jobs, [], idle_goals, grid, config)
+    assert (datetime.datetime.now() - start_time).total_seconds() < 1.5, "Should stop at the time limit"
+    assert bound >= 1, "The bound is relative to the lowest estimate"
+    assert sorted(reduce(lambda a, b: a + b, res_agent_job)) == list(range(len(jobs))), "All jobs assigned"
+    assert not has_vortex_collision(res_paths), "There are collisions in vortexes!"
+
+
+def test_anytime_bound_timeout():
+    # s -> goal (cost 10) or x (f = 4, expanded after the goal was found) -> y (f = 9) or z (not evaluated)
+    children = {'s': ['goal', 'x'], 'x': ['y', 'z']}
+    g_h = {'s': (0, 1), 'goal': (10, 0), 'x': (1, 3), 'y': (9, 0), 'z': (5, 0)}
+    deadline = time.time() + .2
+
+    def evaluate(condition, state):
+        if state == 'y':
+            time.sleep(max(deadline - time.time(), 0) + .01)  # times out while expanding x
+        return g_h[state] + ((), state)
+
+    best, bound = base.astar_anytime('s', None, lambda c, s: g_h[s][1], lambda c, s: children.get(s, []),
+                                     lambda c, s: (g_h[s][0], s), lambda c, s: s == 'goal', evaluate,
+                                     weight=5, deadline=deadline)
+    assert best == 'goal', "The solution found before the deadline"
+    assert bound == 10 / 4, "The children of x that were not evaluated can cost as little as x"
+
+
+def test_anytime_no_solution_at_deadline():
+    # s -> a (h = 2) -> goal_a (cost 10) or s -> b (h = 1) -> c -> goal_c (cost 20), greedy goes by h
+    children = {'s': ['a', 'b'], 'a': ['goal_a'], 'b': ['c'], 'c': ['goal_c']}
+    g_h = {'s': (0, 3), 'a': (1, 2), 'b': (1, 1), 'c': (2, 1), 'goal_a': (10, 0), 'goal_c': (20, 0)}
+    best, bound = base.astar_anytime('s', None, lambda c, s: g_h[s][1], lambda c, s: children.get(s, []),
+                                     lambda c, s: (g_h[s][0], s), lambda c, s: s.startswith('goal'),
+                                     deadline=time.time() - 1)
+    assert best == 'goal_c', "The first solution of the greedy descent"
+    assert bound == np.Inf, "A solution after the deadline has no bound"
+
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    config['time_limit'] = 1E-9
+    agent_pos, grid, idle_goals, jobs = get_data_random(1, 10, 10, 3, 5, 2)
+    res_agent_job, _, res_paths, bound = plan.plan_anytime(agent_pos, jobs, [], idle_goals, grid, config)
+    assert bound == np.Inf, "No solution in the time limit"
+    assert sorted(reduce(lambda a, b: a + b, res_agent_job)) == list(range(len(jobs))), "All jobs assigned"
+    assert not has_vortex_collision(res_paths), "There are collisions in vortexes!"
+
+
+def test_warm_start():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    agent_pos, grid, idle_goals, jobs = get_data_random(2, 10, 10, 3, 4, 2)
+    agent_job, agent_idle, _ = plan_cbsext(agent_pos, jobs[:3], [], idle_goals, grid, config)
+
+    res_agent_job, res_agent_idle, res_paths = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config,
+                                                           seed=(agent_job, agent_idle))
+    assert sorted(reduce(lambda a, b: a + b, res_agent_job)) == list(range(len(jobs))), "All jobs assigned"
+    for i_a in range(len(agent_pos)):
+        assert res_agent_job[i_a][:len(agent_job[i_a])] == agent_job[i_a], "Previous jobs should be kept"
+    assert not has_vortex_collision(res_paths), "There are collisions in vortexes!"
+
+    # preallocated jobs come first, seeded jobs that do not exist any more are dropped
+    state = plan.seed_state((((0, 5), (1,), (2,)), ((), (), ())), ((), (), (0,)), 3, 0)
+    assert state.agent_job == ((), (1,), (0, 2)), "Wrong start state " + str(state)
+
+
+def test_warm_start_time_limit():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    config['time_limit'] = 2
+    agent_pos, grid, idle_goals, jobs = get_data_random(2, 10, 10, 3, 4, 2)
+    agent_job, agent_idle, _ = plan_cbsext(agent_pos, jobs[:3], [], idle_goals, grid, config)
+    deadlines = []
+    search = plan.search
+
+    def search_no_repair(start, condition, deadline=None):
+        deadlines.append(deadline)
+        if len(deadlines) == 1:
+            raise RuntimeError("Can not repair")
+        return search(start, condition, deadline)
+
+    plan.search = search_no_repair
+    try:
+        res_agent_job, _, _, bound = plan.plan_anytime(agent_pos, jobs, [], idle_goals, grid, config,
+                                                       seed=(agent_job, agent_idle))
+    finally:
+        plan.search = search
+    assert len(deadlines) == 2 and deadlines[0] < deadlines[1], "Time should be left to plan from scratch"
+    assert bound < np.Inf, "Should find a solution from scratch in the time left"
+    assert sorted(reduce(lambda a, b: a + b, res_agent_job)) == list(range(len(jobs))), "All jobs assigned"
+
+
+def test_stats(tmpdir):
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    agent_pos, grid, idle_goals, jobs = get_data_random(1, 10, 10, 3, 4, 2)
+    stats = PlannerStats()
+    with PlannerEngine(processes=2) as engine:
+        res = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config, engine=engine, stats=stats)
+    assert res == plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config), "Stats should not change the plan"
+    n = stats.counters
+    assert n['expansions'] > 0 and n['generated'] >= n['expansions'], "Wrong search counters " + str(n)
+    assert n['generated'] >= n['pruned'] + n['duplicates'], "Only generated states can be pruned or duplicates"
+    assert n['open_max'] > 0 and n['closed'] >= n['expansions'], "Wrong set sizes " + str(n)
+    assert n['pool_tasks'] == n['agent_paths_misses'] > 0, "Agents not memoized are planned in the pool"
+    t = stats.timers
+    assert t['total'] >= t['search'] >= t['get_paths'] > 0, "Wrong timers " + str(t)
+    assert t['search'] >= t['find_collision'] > 0, "Collisions are checked in the search"
+    assert t['pool_map'] >= t['pool_ipc'] >= 0, "IPC is a part of the maps"
+    assert 0 <= stats.hit_rate('agent_paths') <= 1, "Hit rate is a share"
+    assert n['path_cache_hits'] + n['path_cache_misses'] > 0, "The workers look up paths"
+
+    fname = os.path.join(str(tmpdir), "stats.jsonl")
+    stats.to_jsonl(fname, module="cbsext")
+    stats.to_jsonl(fname, module="cbsext")
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2, "One line per planning"
+    entry = json.loads(lines[0])
+    assert entry['module'] == "cbsext" and entry['expansions'] == n['expansions'], "Wrong entry " + lines[0]
+    text = stats.to_prometheus(module="cbsext")
+    assert 'tcbs_expansions_total{module="cbsext"} %d' % n['expansions'] in text, "Wrong prometheus text"
+    assert '# TYPE tcbs_open_max gauge' in text, "The size of the open set is a gauge"
+    assert len(text.splitlines()) == 2 * (len(COUNTERS) + len(TIMERS)), "Type and value per metric"
+
+
+def test_evaluate():
+    agent_idle, agent_job, agent_pos, grid, idle_goals, jobs = get_data_labyrinthian()
+    plan._config = generate_config()
+    condition = plan.comp2condition(agent_pos, jobs, [], idle_goals, grid)
+    state = plan.comp2state(agent_job, tuple(() for _ in agent_pos), ())
+    for child in plan.get_children(condition, state) + [state]:
+        c, h, collisions, child_evaluated = plan.evaluate(condition, child)
+        c_separate, child_separate = plan.cost(condition, child)
+        assert c == c_separate, "Evaluate should give the same cost"
+        assert child_evaluated == child_separate, "Evaluate should give the same state"
+        assert h == plan.heuristic(condition, child_separate), "Evaluate should give the same heuristic"
+        assert set(filter(lambda x: x != (), collisions)) <= set(child_evaluated.blocked)
+
+
+def test_pre_calc_distances():
+    agent_pos, grid, idle_goals, jobs = get_data_random(5, 10, 20, 3, 4, 2)
+    plan._engine = None
+    distances = plan.pre_calc_distances(agent_pos, jobs, idle_goals, grid)
+    try:
+        for ia, it in product(range(len(agent_pos)), range(len(jobs))):
+            p, _ = plan.path(agent_pos[ia], jobs[it][0], grid, [], {})
+            if p:
+                assert distances['at'][ia, it] == plan.path_duration(p), "Should be the length of the path"
+        for it in range(len(jobs)):
+            p, _ = plan.path(jobs[it][0], jobs[it][1], grid, [], {})
+            if p:
+                assert distances['t'][it] == plan.path_duration(p), "Should be the length of the path"
+        for it1, it2 in product(range(len(jobs)), range(len(jobs))):
+            p, _ = plan.path(jobs[it1][1], jobs[it2][0], grid, [], {})
+            if p:
+                assert distances['tt'][it1, it2] == plan.path_duration(p), "Should be the length of the path"
+    finally:
+        plan._distances = None
+
+    with PlannerEngine(processes=2) as engine:
+        plan._engine = engine
+        engine.set_grid(grid)
+        try:
+            distances_engine = plan.pre_calc_distances(agent_pos, jobs, idle_goals, grid)
+        finally:
+            plan._engine = None
+            plan._distances = None
+    for key in ['at', 't', 'tt']:
+        assert np.array_equal(distances[key], distances_engine[key]), "Workers should give the same distances"
+
+
+def test_pre_calc_distances_costmap():
+    grid = np.full([5, 5, 20], 3.)  # costs, indexed [y, x, t]
+    grid[0:4, 2, :] = -1
+    agent_pos = [(0, 0)]
+    jobs = [((0, 0), (4, 0), 0), ((4, 0), (0, 4), 0)]
+    plan._engine = None
+    try:
+        distances = plan.pre_calc_distances(agent_pos, jobs, [], grid)
+        assert list(distances['t']) == [12, 8], "Should be the steps around the wall, not the costs"
+        assert distances['at'][0, 1] == 12 and distances['tt'][0, 1] == 0, "Should be steps"
+        assert plan.distance_no_calc((0, 0), (4, 0), grid) == 12, "Should be steps"
+    finally:
+        plan._distances = None
+
+
+def test_heuristic_of_distances():
+    agent_pos, grid, idle_goals, jobs = get_data_random(3, 10, 20, 3, 4, 3)
+    plan._config = generate_config()
+    plan._engine = None
+    condition = plan.comp2condition(agent_pos, jobs, [], idle_goals, grid)
+    states = [plan.comp2state(tuple(() for _ in agent_pos), tuple(() for _ in agent_pos), ())]
+    for _ in range(2):
+        states += reduce(lambda a, b: a + b, map(lambda state: plan.get_children(condition, state), states))
+    try:
+        plan.pre_calc_distances(agent_pos, jobs, idle_goals, grid)
+        for state in states:
+            paths = plan.get_paths(condition, state)
+            if paths is False:
+                continue
+            h = plan.heuristic_of_paths(condition, state, paths)
+            h_loop = plan.heuristic_of_paths_loop(condition, state, paths)
+            assert abs(h - h_loop) < 1E-9, "Should be the same heuristic as job by job for " + str(state)
+    finally:
+        plan._distances = None
+
+
+def test_number_nearest():
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    agent_pos, grid, idle_goals, jobs = get_data_random(7, 10, 10, 3, 5, 0)
+    stats = PlannerStats()
+    plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config, stats=stats)
+    assert stats.timers['pre_calc'] == 0, "The distances are only precalculated for the nearest jobs"
+
+    config['number_nearest'] = 2
+    stats = PlannerStats()
+    res_agent_job, _, res_paths = plan_cbsext(agent_pos, jobs, [], idle_goals, grid, config, stats=stats)
+    assert stats.timers['pre_calc'] > 0, "The distances are precalculated for the nearest jobs"
+    assert sorted(reduce(lambda a, b: a + b, res_agent_job)) == list(range(len(jobs))), "All jobs assigned"
+    assert not has_vortex_collision(res_paths), "There are collisions in vortexes!"
+
+    state = plan.comp2state(tuple(() for _ in agent_pos), tuple(() for _ in agent_pos), ())
+    children = plan.assign_nearest_jobs(state[1], list(state[0]), agent_pos, (), jobs, jobs, 2)
+    assert len(children) == 2 * len(agent_pos), "Two jobs for each agent"
+    for i_a in range(len(agent_pos)):
+        nearest = set(map(lambda child: child[0][i_a][0], children[2 * i_a:2 * i_a + 2]))
+        dists = sorted(plan._distances['at'][i_a])
+        assert all(map(lambda i_j: plan._distances['at'][i_a][i_j] <= dists[1], nearest)), "Not the nearest"
+
+
 def test_rand():
     for i in range(5):
         print("\nTEST", i)
@@ -226,6 +542,71 @@ def test_collision():
     assert not has_edge_collision(res_paths), "There are collisions in edges!"
 
 
+def random_walks(n_agents, length, size, seed):
+    """Paths per agent (split into a few paths each) of random steps on a small grid"""
+    rand = np.random.RandomState(seed)
+    moves = [(0, 0), (0, 1), (1, 0), (0, -1), (-1, 0)]
+    _paths = []
+    for _ in range(n_agents):
+        pose = tuple(rand.randint(0, size, 2).tolist())
+        path = []
+        for t in range(length):
+            path.append(pose + (t,))
+            move = moves[rand.randint(len(moves))]
+            pose = (min(max(pose[0] + move[0], 0), size - 1), min(max(pose[1] + move[1], 0), size - 1))
+        cuts = sorted(rand.randint(1, length, 2).tolist())
+        _paths.append((path[:cuts[0]], path[cuts[0]:cuts[1]], path[cuts[1]:]))
+    return _paths
+
+
+def test_find_collision():
+    for seed in range(20):
+        _paths = random_walks(1 + seed % 6, 30 + 20 * seed, 5 + seed % 4, seed)
+        for all_collisions in [False, True]:
+            assert (plan.find_collision(_paths, all_collisions) ==
+                    plan.find_collision_loop(_paths, all_collisions)), "Collisions differ for seed %d" % seed
+    no_collisions = [([(i, t % 10, t) for t in range(100)],) for i in range(5)]
+    assert plan.find_collision(no_collisions, False) == ()
+    assert plan.find_collision(no_collisions, True) == []
+    assert plan.find_collision([([(0, 0, 0)],), ([],)], True) == (), "No collisions without paths"
+    assert plan.find_collision([], False) == ()
+    assert plan.find_collision([([(0, 0, 0), (1, 0, 1)],), ([(1, 0, 0), (0, 0, 1)],)], False) == [
+        (EDGE, ((1, 0), (0, 0), 0), (1, 0))], "Should find the swap"
+
+
+def test_find_collision_unassigned_agent():
+    n_found = 0
+    for seed in range(10):
+        _paths = random_walks(5, 100, 5, seed)
+        _paths.insert(3, ((),))  # an agent without jobs
+        assert sum(map(lambda agent_paths: sum(map(len, agent_paths)), _paths)) >= plan.MIN_POSES_VECTORIZED
+        for all_collisions in [False, True]:
+            assert (plan.find_collision(_paths, all_collisions) ==
+                    plan.find_collision_loop(_paths, all_collisions)), "Collisions differ for seed %d" % seed
+        n_found += bool(plan.find_collision(_paths, False))
+    assert n_found > 5, "Collisions of the agents before the one without paths should be found"
+
+    config = generate_config()
+    config['filename_pathsave'] = ''
+    grid = np.zeros([3, 140, 300])
+    _, _, res_paths = plan_cbsext([(0, 1), (139, 1), (70, 1)], [((1, 1), (130, 1), 0), ((138, 1), (2, 1), 0)], [],
+                                  [], grid, config)
+    assert plan.find_collision_loop(res_paths) == (), "Planned paths should not collide"
+
+
+def test_find_collision_all_before_unassigned_agent():
+    n_found = 0
+    for seed in range(10):
+        _paths = random_walks(5, 100, 5, seed)
+        collisions = plan.find_collision(_paths[:3], True)
+        _paths.insert(3, ((),))  # an agent without jobs
+        for find in [plan.find_collision, plan.find_collision_loop]:
+            assert find(_paths, True) == (collisions if collisions else ()), \
+                "All collisions of the agents before the one without paths should be found for seed %d" % seed
+        n_found += bool(collisions)
+    assert n_found > 5, "The agents before the one without paths should collide"
+
+
 def test_consecutive_jobs():
     grid = np.zeros([10, 10, 50])
     agent_pos = [(1, 1)]
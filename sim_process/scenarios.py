@@ -0,0 +1,259 @@
+#!/usr/bin/python
+"""
+Headless batch runner of production process scenarios.
+
+Every scenario (module, number of AGVs, flow length, products, seed) runs in its own process on the
+simulated clock of `EventSim`. The results are written to a columnar file (.csv or .npz), e.g.:
+
+    python -m sim_process.scenarios --modules Random Nearest Cbsext --n_agv 2 4 --seeds 0 1 2 -o results.csv
+"""
+
+import argparse
+import datetime
+import logging
+import multiprocessing
+import queue
+from itertools import product
+
+import numpy as np
+
+from simple_simulation.event_simulation import EventSim
+from simple_simulation.mod_cbsextension import Cbsext
+from simple_simulation.mod_nearest import Nearest
+from simple_simulation.mod_random import Random
+
+MODULES = {'Random': Random, 'Nearest': Nearest, 'Cbsext': Cbsext}
+
+x_res = 10
+y_res = 10
+STATIONS = [(0, 0), (9, 9), (4, 0), (4, 9), (0, 9), (0, 4), (9, 4)]
+FLOW = [[0, 2],  # station, processing time [s]
+        [1, 3],
+        [2, 1],
+        [4, 2],
+        [3, 3],
+        [5, 3],
+        [6, 2]]
+IDLE_GOALS = [((0, 0), (15, 3)),
+              ((4, 0), (15, 3)),
+              ((9, 0), (15, 3)),
+              ((9, 4), (15, 3)),
+              ((9, 9), (15, 3)),
+              ((4, 9), (15, 3)),
+              ((0, 9), (15, 3)),
+              ((0, 5), (15, 3))]
+
+COLUMNS = ['module', 'n_agv', 'flow_lenght', 'products', 'seed', 'status', 'makespan', 'throughput',
+           'latency_p50', 'latency_p90', 'latency_p99', 'latency_max', 'utilisation', 'events', 'wall_time']
+
+
+def get_scenarios(modules=('Random', 'Nearest', 'Cbsext'), n_agvs=(2,), flow_lenghts=(4,), products=(3,),
+                  seeds=(0,)) -> list:
+    """All combinations of the parameters as scenarios"""
+    return list(map(lambda s: dict(zip(['module', 'n_agv', 'flow_lenght', 'products', 'seed'], s)),
+                    product(modules, n_agvs, flow_lenghts, products, seeds)))
+
+
+def job_id(p: int, step: int, flow_lenght: int) -> int:
+    """Id of the transport of product p from this step of the flow to the next"""
+    return p * flow_lenght + step
+
+
+def is_finished(sim: EventSim, _id: int) -> bool:
+    route = sim.routes.get(_id)  # the job may not have arrived at the simulation yet
+    return route is not None and route.is_finished()
+
+
+def run_process(sim: EventSim, flow: list, process_times: np.array, max_time: float) -> (float, str):
+    """
+    Run products through the stations of the flow. A station processes one product at a time and is blocked
+    until the product is picked up, then an AGV transports the product to the next station.
+    Like `sim_process.process_test.run` but jumping from event to event on the clock of the simulation.
+
+    Args:
+      sim: the (started) simulation
+      flow: [station, processing time] per step
+      process_times: processing time per product and step [s]
+      max_time: stop at this simulated time [s]
+
+    Returns:
+      the makespan [s] (nan if not all products finished), the status
+    """
+    products_todo = len(process_times)
+    state = np.zeros(products_todo)  # step of the flow, x.5 while transported to the next
+    t_done = np.zeros(products_todo)  # when the processing at the current station is done
+    blocked = np.zeros(len(flow), dtype=int) - 1  # product at each station
+    makespan = 0.
+    while np.any(state < len(flow)):
+        changed = True
+        while changed:  # all that happens now
+            changed = False
+            for p in range(products_todo):
+                s = int(state[p])
+                if state[p] % 1 == .5:  # in transport
+                    if is_finished(sim, job_id(p, s, len(flow))):
+                        state[p] += .5
+                        changed = True
+                elif state[p] == len(flow) - 1:  # at the last station
+                    state[p] = len(flow)
+                    makespan = sim.clock
+                    changed = True
+                elif state[p] < len(flow) - 1:
+                    if blocked[s] == p and t_done[p] <= sim.clock:  # processed, to be picked up
+                        sim.new_job(STATIONS[flow[s][0]], STATIONS[flow[s + 1][0]], job_id(p, s, len(flow)))
+                        blocked[s] = -1
+                        state[p] += .5
+                        changed = True
+                    elif blocked[s] == -1:  # the station is free
+                        blocked[s] = p
+                        t_done[p] = sim.clock + process_times[p, s]
+                        changed = True
+        if not np.any(state < len(flow)):
+            break
+        next_times = list(filter(lambda t: t > sim.clock, t_done[blocked[blocked >= 0]]))
+        if sim.queue:
+            next_times.append(sim.queue[0][0])
+        if not next_times:
+            return np.nan, 'stalled'
+        if min(next_times) > max_time:
+            return np.nan, 'max_time'
+        sim.run(until=min(next_times))
+    return makespan, 'ok'
+
+
+def run_scenario(scenario: dict, max_time: float = 3600., time_limit: float = 0) -> dict:
+    """
+    Run one scenario and measure it
+
+    Args:
+      scenario: module, n_agv, flow_lenght, products and seed
+      max_time: simulated seconds until the scenario is stopped
+      time_limit: seconds per planning of Cbsext (0: no limit)
+
+    Returns:
+      the scenario with throughput [products/h], makespan [s], latencies of the module per event [s],
+      utilisation (share of time the AGVs drove for jobs) and the number of events
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    flow = FLOW[:scenario['flow_lenght']]
+    rand = np.random.RandomState(scenario['seed'])
+    process_times = np.array(flow)[:, 1] * rand.uniform(.5, 1.5, [scenario['products'], len(flow)])
+    grid = np.zeros([x_res, y_res, 51])
+    if scenario['module'] == 'Cbsext':
+        mod = Cbsext(grid, time_limit=time_limit, fname='')  # scenarios run in parallel, no shared path store file
+    else:
+        mod = MODULES[scenario['module']](grid)
+    sim = EventSim(mod)
+    sim.start_sim(x_res, y_res, scenario['n_agv'])
+    for i_ig, (goal, stats) in enumerate(IDLE_GOALS):
+        sim.new_idle_goal(goal, stats, -1 - i_ig)
+
+    start_time = datetime.datetime.now()
+    try:
+        makespan, status = run_process(sim, flow, process_times, max_time)
+    except Exception as e:
+        logging.error("Scenario " + str(scenario) + " failed: " + str(e))
+        makespan, status = np.nan, 'error: ' + str(e).replace(',', ';').replace('\n', ' ')
+    finally:
+        if isinstance(mod, Cbsext):
+            mod.close()
+    sim.stop_sim()
+    latencies = sim.latencies if sim.latencies else [np.nan]
+    res = dict(scenario)
+    res.update({
+        'status': status,
+        'makespan': makespan,
+        'throughput': scenario['products'] / makespan * 3600 if makespan else np.nan,
+        'latency_p50': np.percentile(latencies, 50),
+        'latency_p90': np.percentile(latencies, 90),
+        'latency_p99': np.percentile(latencies, 99),
+        'latency_max': np.max(latencies),
+        'utilisation': sim.stats()['utilisation'],
+        'events': sim.n_events,
+        'wall_time': (datetime.datetime.now() - start_time).total_seconds()
+    })
+    return res
+
+
+def scenario_worker(i: int, scenario: dict, max_time: float, time_limit: float, results: multiprocessing.Queue):
+    results.put((i, run_scenario(scenario, max_time, time_limit)))
+
+
+def failed(scenario: dict, status: str) -> dict:
+    res = dict(scenario)
+    res.update({c: np.nan for c in COLUMNS if c not in scenario})
+    res['status'] = status
+    return res
+
+
+def run_scenarios(scenarios: list, processes: int = multiprocessing.cpu_count(), max_time: float = 3600.,
+                  time_limit: float = 0) -> list:
+    """
+    Run every scenario in its own process, at most `processes` at once.
+    These are no daemons (like the workers of `multiprocessing.Pool`), Cbsext starts its own planner workers.
+
+    Returns:
+      the results in the order of the scenarios
+    """
+    results_queue = multiprocessing.Queue()
+    results = [None] * len(scenarios)
+    todo = list(enumerate(scenarios))
+    running = {}
+    while todo or running:
+        while todo and len(running) < processes:
+            i, scenario = todo.pop(0)
+            running[i] = multiprocessing.Process(target=scenario_worker, name="scenario_%d" % i,
+                                                 args=(i, scenario, max_time, time_limit, results_queue))
+            running[i].start()
+        try:
+            i, res = results_queue.get(timeout=1)
+            results[i] = res
+            running.pop(i).join()
+        except queue.Empty:
+            for i, p in list(running.items()):
+                if not p.is_alive() and results_queue.empty():  # died without a result
+                    results[i] = failed(scenarios[i], 'crashed: exit code %s' % str(p.exitcode))
+                    running.pop(i)
+    return results
+
+
+def write_results(results: list, fname: str):
+    """Write the results in columns, as csv or npz (one array per column)"""
+    columns = {c: np.array(list(map(lambda r: r[c], results))) for c in COLUMNS}
+    if fname.endswith('.npz'):
+        np.savez(fname, **columns)
+    else:
+        with open(fname, 'w') as f:
+            f.write(','.join(COLUMNS) + '\n')
+            for r in results:
+                f.write(','.join(map(lambda c: ('%.6g' % r[c]) if isinstance(r[c], float) else str(r[c]),
+                                     COLUMNS)) + '\n')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run production process scenarios on the simulated clock")
+    parser.add_argument("--modules", nargs='+', default=['Random', 'Nearest', 'Cbsext'], choices=list(MODULES))
+    parser.add_argument("--n_agv", nargs='+', type=int, default=[2])
+    parser.add_argument("--flow_lenght", nargs='+', type=int, default=[4])
+    parser.add_argument("--products", nargs='+', type=int, default=[3])
+    parser.add_argument("--seeds", nargs='+', type=int, default=[0])
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--max_time", type=float, default=3600., help="simulated seconds per scenario")
+    parser.add_argument("--time_limit", type=float, default=0, help="seconds per planning of Cbsext (0: no limit)")
+    parser.add_argument("-o", "--output", default="scenarios.csv", help=".csv or .npz")
+    args = parser.parse_args(args)
+    assert max(args.flow_lenght) <= len(FLOW), "Can only select max lenght of flow %d" % len(FLOW)
+
+    scenarios = get_scenarios(args.modules, args.n_agv, args.flow_lenght, args.products, args.seeds)
+    logging.info("Running %d scenarios" % len(scenarios))
+    results = run_scenarios(scenarios, args.processes, args.max_time, args.time_limit)
+    write_results(results, args.output)
+    for r in results:
+        print("%-8s %3d AGVs flow %d %3d products seed %2d: %-8s makespan %8.1fs utilisation %.2f" % (
+            r['module'], r['n_agv'], r['flow_lenght'], r['products'], r['seed'], r['status'][:8], r['makespan'],
+            r['utilisation']))
+    return results
+
+
+if __name__ == "__main__":
+    main()
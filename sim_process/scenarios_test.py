@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+
+from sim_process.scenarios import COLUMNS, main, run_scenario
+
+
+def test_scenarios_cli(tmpdir):
+    fname = os.path.join(str(tmpdir), "results.csv")
+    results = main(["--modules", "Random", "Nearest", "--n_agv", "2", "3", "--flow_lenght", "3",
+                    "--products", "3", "--seeds", "0", "1", "--processes", "2", "-o", fname])
+    assert len(results) == 8, "One result per scenario"
+    assert all(map(lambda r: r['status'] == 'ok', results)), "All scenarios should finish"
+    assert list(map(lambda r: (r['module'], r['n_agv'], r['seed']), results[:3])) == \
+        [('Random', 2, 0), ('Random', 2, 1), ('Random', 3, 0)], "Results in the order of the scenarios"
+    for r in results:
+        assert 0 < r['utilisation'] <= 1, "Utilisation is a share of time"
+        assert r['latency_p50'] <= r['latency_p90'] <= r['latency_p99'] <= r['latency_max'], "Percentiles"
+        assert np.isclose(r['throughput'], 3 / r['makespan'] * 3600), "Products per hour"
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    assert lines[0].split(',') == COLUMNS, "Header"
+    assert len(lines) == 9, "A line per scenario"
+
+    fname = os.path.join(str(tmpdir), "results.npz")
+    main(["--modules", "Nearest", "--seeds", "0", "1", "--processes", "1", "-o", fname])
+    columns = np.load(fname)
+    assert set(columns.files) == set(COLUMNS), "One array per column"
+    assert columns['seed'].tolist() == [0, 1], "Wrong column"
+
+
+def test_scenario_cbsext():
+    res = run_scenario(dict(module='Cbsext', n_agv=2, flow_lenght=3, products=2, seed=0))
+    assert res['status'] == 'ok', "Should finish"
+    assert res['makespan'] > 0, "Transports take time"
+    same = run_scenario(dict(module='Cbsext', n_agv=2, flow_lenght=3, products=2, seed=0))
+    assert same['makespan'] == res['makespan'], "Simulated time does not depend on the wall clock"
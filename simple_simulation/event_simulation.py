@@ -0,0 +1,208 @@
+import datetime
+import logging
+import time
+from heapq import heappush, heappop
+from itertools import count
+from threading import Lock
+
+import numpy as np
+
+from simple_simulation.fleet_state import FleetState
+from simple_simulation.route import Route, RouteState, Car
+from simple_simulation.route_registry import RouteRegistry
+from simple_simulation.simulation import SimpSim
+from tools import ColoredLogger
+
+logging.setLoggerClass(ColoredLogger)
+
+# events
+ARRIVAL = 0  # a job or idle goal comes in
+START_REACHED = 1  # a car is expected at the start of its route
+GOAL_REACHED = 2  # a car is expected at the goal of its route (or idle goal)
+
+EPOCH = datetime.datetime(2000, 1, 1)
+
+
+class EventSim(object):
+    """
+    Discrete event simulation of multiple AGVs with the interface of `SimpSim`.
+    Instead of moving the cars every `sim_time` on the wall clock, a virtual clock jumps from event to event:
+    arrivals of jobs and the times when cars are expected at the start or goal of their routes.
+    The cars move along their paths exactly like in `SimpSim` (see `Route.new_step`).
+    The module is asked for cars at every event, it has to plan synchronously.
+    """
+
+    def __init__(self, _mod, drive_speed: float = SimpSim.drive_speed, speed_multiplier: float = 1,
+                 fleet_state: bool = False):
+        self.module = _mod
+        self.fleet_state = fleet_state  # move all cars in one vectorized step (see `FleetState`)
+        self.fleet = None
+        self.msb_select = False
+        self.lock = Lock()
+        self.speed = drive_speed * speed_multiplier  # path steps per second
+        self.routes = RouteRegistry()
+        self.cars = []
+        self.area = np.zeros([1])
+        self.running = False
+        self.clock = 0.  # seconds since the start
+        self.queue = []  # heap of (time, n, event, data)
+        self.order = count()
+        self.expected = {}  # route -> time of its next START_REACHED or GOAL_REACHED event
+        self.n_events = 0
+        self.finish_times = {}  # route id -> time the job was finished
+        self.latencies = []  # wall time the module took per event [s]
+        self.busy = {}  # car id -> time it was driving for jobs (not idle goals)
+
+    print_debug_info = SimpSim.print_debug_info
+
+    def now(self) -> datetime.datetime:
+        """Time of the simulation (the virtual clock)"""
+        return EPOCH + datetime.timedelta(seconds=self.clock)
+
+    def start_sim(self, width, height, number_agvs):
+        self.area = np.zeros([width, height])
+        Car.next_id = 0
+        self.cars = []
+        for i in range(number_agvs):
+            self.cars.append(Car(self))
+        self.fleet = FleetState(self.cars) if self.fleet_state else None
+        self.routes = RouteRegistry()
+        self.clock = 0.
+        self.queue = []
+        self.expected = {}
+        self.finish_times = {}
+        self.latencies = []
+        self.busy = {c.id: 0. for c in self.cars}
+        self.running = True
+
+    def stop_sim(self):
+        self.running = False
+        logging.info("Simulated %.1fs with %d events" % (self.clock, self.n_events))
+
+    def new_job(self, a, b, job_id, t: float = None):
+        """A job from a to b (at time t, Default: now)"""
+        self.schedule(self.clock if t is None else t, ARRIVAL, Route(tuple(a), tuple(b), job_id, self))
+
+    def new_idle_goal(self, goal, stats, id, t: float = None):
+        """An idle goal (at time t, Default: now)"""
+        self.schedule(self.clock if t is None else t, ARRIVAL, Route(-1, tuple(goal), id, self, stats))
+
+    def is_finished(self, _id):
+        route = self.routes.get(_id)
+        assert route is not None, "There should be a route with this id"
+        return route.is_finished()
+
+    def schedule(self, t: float, event: int, data):
+        assert t >= self.clock, "Events can not be in the past"
+        heappush(self.queue, (t, next(self.order), event, data))
+
+    def step(self) -> bool:
+        """
+        Process the next event
+
+        Returns:
+          whether there was an event
+        """
+        while self.queue:
+            t, _, event, data = heappop(self.queue)
+            if event != ARRIVAL and self.expected.get(data) != t:
+                continue  # outdated, the route was replanned
+            self.lock.acquire()
+            try:
+                self.advance(t)
+                self.n_events += 1
+                start = time.time()
+                if event == ARRIVAL:
+                    data.creation_time = self.now()  # the route was created when it was scheduled
+                    self.routes.append(data)
+                    self.module.new_job(self.cars, self.routes)
+                self.work_routes()
+                self.latencies.append(time.time() - start)
+                self.expect_all()
+            finally:
+                self.lock.release()
+            return True
+        return False
+
+    def run(self, until: float = None) -> float:
+        """
+        Process events until there are none left (or the next one is after until)
+
+        Returns:
+          the time of the simulation
+        """
+        while self.running and self.queue and (until is None or self.queue[0][0] <= until):
+            self.step()
+        if until is not None and until > self.clock:
+            self.lock.acquire()
+            self.advance(until)
+            self.lock.release()
+        return self.clock
+
+    def advance(self, t: float):
+        """Move all cars on running routes to where they are at time t"""
+        if t > self.clock:
+            running = self.routes.running()
+            for r in running:
+                if not r.is_idle_goal():
+                    self.busy[r.car.id] += t - self.clock
+            step_size = self.speed * (t - self.clock)
+            if self.fleet is not None:
+                self.fleet.step(self.routes, step_size)
+            else:
+                for r in running:
+                    r.new_step(step_size)
+            for r in running:
+                if r.is_finished():
+                    self.finish_times[r.id] = t
+        self.clock = t
+
+    def work_routes(self):
+        for r in self.routes:
+            if not (r.is_finished() or r.is_on_route()):  # for all but the finished or on_route ones
+                c = self.module.which_car(self.cars, r, self.routes)
+                if c:
+                    r.assign_car(c)
+
+    def expect_all(self):
+        """(Re)schedule the next event of all running routes, their cars may have new paths"""
+        self.expected = {}
+        for r in self.routes.running():
+            t = self.expect(r)
+            if t is not None:
+                self.expected[r] = t
+                self.schedule(t, START_REACHED if r.state == RouteState.TO_START else GOAL_REACHED, r)
+
+    def expect(self, r: Route) -> float:
+        """When the car of this route reaches the start or goal next (None if it is not on its paths)"""
+        car = r.car
+        if not car.paths:
+            return None
+        first = int(np.floor(car.i)) + 1 if car.i > 0 else 0  # `new_step` has processed all steps up to car.i
+        if r.state == RouteState.TO_START:
+            if tuple(car.pose) == tuple(r.start):
+                return self.clock + self.delay(first, car.i)
+            target = tuple(r.start)
+        else:
+            target = tuple(r.goal)
+        for i in range(first, len(car.paths)):
+            if tuple(car.paths[i][0:2]) == target:
+                return self.clock + self.delay(i, car.i)
+        return None
+
+    def delay(self, i: int, car_i: float) -> float:
+        """Time until the car is at step i of its paths (the first step is processed after one step)"""
+        return (i - car_i if i > car_i else 1) / self.speed
+
+    def stats(self) -> dict:
+        """Finished jobs, the time from their arrival to their goal and the share of time cars drove for jobs"""
+        durations = list(map(lambda r: self.finish_times[r.id] - (r.creation_time - EPOCH).total_seconds(),
+                             filter(lambda r: r.id in self.finish_times, self.routes.finished())))
+        return {
+            'time': self.clock,
+            'events': self.n_events,
+            'finished': len(durations),
+            'duration_mean': float(np.mean(durations)) if durations else 0.,
+            'duration_max': float(np.max(durations)) if durations else 0.,
+            'utilisation': sum(self.busy.values()) / len(self.busy) / self.clock if self.busy and self.clock else 0.
+        }
@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+
+from simple_simulation.event_simulation import EventSim
+from simple_simulation.mod_cbsextension import Cbsext
+from simple_simulation.mod_nearest import Nearest
+from simple_simulation.mod_random import Random
+
+
+IDLE_GOALS = [(0, 0), (9, 0), (0, 9), (9, 9)]
+
+
+def get_jobs(n, size, seed, n_cars):
+    """Jobs between distinct cells, not where cars or idle goals are (cars stay at the goal of their last job)"""
+    rand = np.random.RandomState(seed)
+    used = set(map(lambda i_c: (4, 3 + i_c), range(n_cars))) | set(IDLE_GOALS)  # see `Car`
+    cells = list(filter(lambda c: c not in used, np.ndindex(size, size)))
+    coords = list(map(lambda i: tuple(map(int, cells[i])), rand.choice(len(cells), 2 * n, replace=False)))
+    return list(zip(coords[::2], coords[1::2]))
+
+
+def test_event_simulation():
+    size = 10
+    grid = np.zeros([size, size, 51])
+    jobs = get_jobs(20, size, seed=1, n_cars=3)
+    for mod in [Random(grid), Nearest(grid), Cbsext(grid, fname='')]:
+        sim = EventSim(mod)
+        sim.start_sim(size, size, 3)
+        for i_ig, goal in enumerate(IDLE_GOALS):  # Cbsext needs at least as many routes as cars
+            sim.new_idle_goal(goal, (15, 3), 1000 + i_ig)
+        for i_j, (a, b) in enumerate(jobs):
+            sim.new_job(a, b, i_j, t=i_j * 10.)
+        start_time = datetime.datetime.now()
+        try:
+            sim.run(until=len(jobs) * 10. + 300)  # idle goals go on forever
+        finally:
+            if isinstance(mod, Cbsext):
+                mod.close()
+        duration = (datetime.datetime.now() - start_time).total_seconds()
+        sim.stop_sim()
+
+        stats = sim.stats()
+        assert stats['finished'] == len(jobs), "All jobs should be finished with " + str(mod)
+        assert all(map(lambda i_j: sim.is_finished(i_j), range(len(jobs)))), "All jobs should be finished"
+        assert duration < sim.clock, "Should be faster than real time"
+        assert stats['duration_mean'] > 0, "Jobs take time"
+
+
+def test_event_simulation_clock():
+    grid = np.zeros([10, 10, 51])
+    sim = EventSim(Nearest(grid))
+    sim.start_sim(10, 10, 1)
+    car = sim.cars[0]
+    start = tuple(car.pose)
+    goal = (start[0], start[1] + 4)
+    sim.new_job(start, goal, 0, t=5.)
+    assert sim.run(until=4.) == 4., "Should stop at until"
+    assert not sim.routes, "The job is not there yet"
+    sim.run()
+    assert sim.is_finished(0), "Job should be finished"
+    assert tuple(car.pose) == goal, "Car should be at the goal"
+    # one step to start the route at its start, four to the goal
+    assert sim.clock == 5. + 5 / sim.speed, "Wrong time at the goal"
+    assert (sim.routes.get(0).creation_time - sim.now()).total_seconds() == -5 / sim.speed, "Arrival on the clock"
@@ -0,0 +1,122 @@
+import numpy as np
+
+from simple_simulation.route import Route, RouteState, STEP_TOLERANCE
+
+NOWHERE = (-1, -1)  # the start of idle goals, no car can be there
+
+
+class FleetState(object):
+    """
+    Poses, path indices and paths of all cars in arrays, so that all cars are moved in one vectorized step
+    and the arrivals at starts and goals are found in bulk (instead of `Route.new_step` per route).
+    The cars keep their `pose` and `i`, they are written back after every step.
+    Paths that were set on a car (`Car.set_paths`) are loaded before the next step.
+    """
+
+    def __init__(self, cars: list):
+        self.cars = list(cars)
+        n = len(self.cars)
+        self.index = {c: k for k, c in enumerate(self.cars)}
+        self.poses = np.array(list(map(lambda c: c.pose, self.cars)), dtype=int).reshape(n, 2)
+        self.i = np.zeros(n)
+        self.paths = np.zeros([n, 1, 2], dtype=int)  # padded to the longest path
+        self.lengths = np.zeros(n, dtype=int)
+        self.loaded = [None] * n  # the path lists of the cars that are in the arrays
+        self.running = None  # the running routes and their arrays, see `load_routes`
+        self.version = None  # of the registry when the running routes were loaded
+
+    def load(self):
+        """Take the paths that were set on cars since the last step"""
+        for k, c in enumerate(self.cars):
+            if c.paths is not self.loaded[k]:
+                self.load_car(k, c)
+
+    def load_car(self, k: int, car):
+        path = np.array(list(map(lambda p: p[0:2], car.paths or [])), dtype=int).reshape(-1, 2)
+        if len(path) > self.paths.shape[1]:
+            paths = np.zeros([len(self.cars), len(path), 2], dtype=int)
+            paths[:, :self.paths.shape[1]] = self.paths
+            self.paths = paths
+        self.paths[k, :len(path)] = path
+        self.lengths[k] = len(path)
+        self.i[k] = car.i if car.paths else 0
+        self.poses[k] = car.pose[0:2]
+        self.loaded[k] = car.paths
+        self.version = None
+
+    def load_routes(self, registry):
+        """The running routes with a path and their cars, states, starts and goals as arrays"""
+        routes = list(filter(lambda r: r.car is not None and r.car.paths, registry.running()))
+        self.running = (routes,
+                        np.array(list(map(lambda r: self.index[r.car], routes)), dtype=int),
+                        np.array(list(map(lambda r: r.is_idle_goal(), routes)), dtype=bool),
+                        np.array(list(map(lambda r: r.state == RouteState.TO_START, routes)), dtype=bool),
+                        np.array(list(map(lambda r: NOWHERE if r.is_idle_goal() else r.start, routes)),
+                                 dtype=int).reshape(-1, 2),
+                        np.array(list(map(lambda r: r.goal, routes)), dtype=int).reshape(-1, 2))
+        self.version = registry.version
+
+    def step(self, registry, step_size: float) -> list:
+        """
+        Move the cars of all running routes by step_size path steps, like `Route.new_step` does for one.
+
+        Args:
+          registry: the `RouteRegistry` of the simulation
+          step_size: path steps to go
+
+        Returns:
+          the cars that moved
+        """
+        Route.lock.acquire()
+        try:
+            self.load()
+            if self.version != registry.version:
+                self.load_routes(registry)
+            routes, ks, is_idle, to_start, starts, goals = self.running
+            if not routes:
+                return []
+
+            # the steps processed by each car, see `Route.new_step`
+            i_prev = self.i[ks]
+            i = i_prev + step_size
+            self.i[ks] = np.where(np.abs(i - np.round(i)) < STEP_TOLERANCE, np.round(i), i)
+            lo = np.ceil(i_prev).astype(int)
+            hi = np.minimum(np.floor(self.i[ks]).astype(int), self.lengths[ks] - 1)
+            moved = hi >= lo
+            if not np.any(moved):  # no car got to its next step
+                for r, k in zip(routes, ks):
+                    r.car.i = float(self.i[k])
+                return []
+            n_steps = int(np.max(hi - lo)) + 1
+            steps = lo[:, np.newaxis] + np.arange(n_steps)
+            valid = steps <= hi[:, np.newaxis]
+            coords = self.paths[ks[:, np.newaxis], np.minimum(steps, self.lengths[ks, np.newaxis] - 1)]
+            prev = np.concatenate([self.poses[ks, np.newaxis], coords[:, :-1]], axis=1)  # pose before each step
+
+            at_start = (valid & ~is_idle[:, np.newaxis] &
+                        (np.all(coords == starts[:, np.newaxis], axis=2) |
+                         np.all(prev == starts[:, np.newaxis], axis=2)))
+            on_route = ~to_start[:, np.newaxis] | (np.cumsum(at_start, axis=1) > 0)
+            at_goal = valid & ~at_start & np.all(coords == goals[:, np.newaxis], axis=2) & on_route
+            reached_goal = np.any(at_goal, axis=1)
+            i_goal = np.where(reached_goal, np.argmax(at_goal, axis=1), n_steps)
+            reached_start = to_start & np.any(at_start & (np.arange(n_steps) < i_goal[:, np.newaxis]), axis=1)
+            self.poses[ks[moved]] = coords[moved, (hi - lo)[moved]]
+            self.poses[ks[reached_goal]] = goals[reached_goal]
+
+            for r, k in zip(routes, ks):
+                r.car.i = float(self.i[k])
+            cars = []
+            for i_r in np.flatnonzero(moved):
+                r = routes[i_r]
+                car = r.car
+                if reached_start[i_r]:
+                    r.at_start()
+                if reached_goal[i_r]:
+                    r.at_goal()
+                else:
+                    car.pose = tuple(self.poses[ks[i_r]].tolist())
+                cars.append(car)
+            return cars
+        finally:
+            Route.lock.release()
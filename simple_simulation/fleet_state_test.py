@@ -0,0 +1,60 @@
+import numpy as np
+
+from simple_simulation.event_simulation import EventSim
+from simple_simulation.event_simulation_test import IDLE_GOALS, get_jobs
+from simple_simulation.mod_nearest import Nearest
+from simple_simulation.route import Route
+
+
+def get_fleet(seed, n_cars, fleet_state):
+    """Cars on routes with random paths in a small area, so that starts and goals are passed often"""
+    rand = np.random.RandomState(seed)
+    sim = EventSim(Nearest(np.zeros([5, 5, 51])), fleet_state=fleet_state)
+    sim.start_sim(5, 5, n_cars)
+    for car in sim.cars:
+        path = [tuple(car.pose)] + list(map(lambda _: tuple(rand.randint(5, size=2).tolist()), range(30)))
+        goal = tuple(rand.randint(5, size=2).tolist())
+        if rand.rand() < .2:
+            route = Route(-1, goal, car.id, sim, (15, 3))
+        else:
+            route = Route(tuple(rand.randint(5, size=2).tolist()), goal, car.id, sim)
+        sim.routes.append(route)
+        route.assign_car(car)
+        car.set_paths([list(map(lambda p: p + (0,), path))])
+    return sim
+
+
+def test_fleet_state_like_new_step():
+    for seed in range(10):
+        sim_routes = get_fleet(seed, 20, fleet_state=False)
+        sim_fleet = get_fleet(seed, 20, fleet_state=True)
+        step_sizes = np.random.RandomState(seed).uniform(.3, 3, size=30)
+        for step_size in step_sizes:
+            for r in sim_routes.routes.running():
+                r.new_step(step_size)
+            sim_fleet.fleet.step(sim_fleet.routes, step_size)
+            for c_routes, c_fleet in zip(sim_routes.cars, sim_fleet.cars):
+                assert c_routes.pose == c_fleet.pose, "Cars should be at the same pose"
+                assert c_routes.i == c_fleet.i, "Cars should be at the same step"
+            assert list(map(lambda r: r.state, sim_routes.routes.finished() + list(sim_routes.routes))) == \
+                list(map(lambda r: r.state, sim_fleet.routes.finished() + list(sim_fleet.routes))), \
+                "Routes should be in the same state"
+        assert sim_fleet.routes.finished(), "Some routes should be finished"
+
+
+def test_event_simulation_fleet_state():
+    size = 10
+    grid = np.zeros([size, size, 51])
+    jobs = get_jobs(20, size, seed=2, n_cars=3)
+    stats = []
+    for fleet_state in [False, True]:
+        sim = EventSim(Nearest(grid), fleet_state=fleet_state)
+        sim.start_sim(size, size, 3)
+        for i_ig, goal in enumerate(IDLE_GOALS):
+            sim.new_idle_goal(goal, (15, 3), 1000 + i_ig)
+        for i_j, (a, b) in enumerate(jobs):
+            sim.new_job(a, b, i_j, t=i_j * 5.)
+        sim.run(until=len(jobs) * 5. + 300)
+        stats.append((sim.stats(), sim.finish_times))
+    assert stats[1][0]['finished'] == len(jobs), "All jobs should be finished"
+    assert stats[0] == stats[1], "Moving the fleet at once should not change the simulation"
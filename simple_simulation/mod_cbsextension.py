@@ -1,14 +1,12 @@
 import datetime
 import logging
-import time
-from multiprocessing import Pipe
-from multiprocessing import Process
 from threading import Lock
 
 import numpy as np
 
-from planner.tcbs.plan import plan, get_paths, comp2condition, comp2state, generate_config
+from planner.tcbs.plan import plan, get_paths, comp2condition, comp2state, generate_config, PlannerEngine
 from simple_simulation.mod import Module
+from simple_simulation.planning_service import PlanningService, staleness
 from simple_simulation.route import Route, Car
 from simple_simulation.simulation import list_hash
 
@@ -23,9 +21,12 @@ def get_car_i(cars: list, car: Car):
             return i_agent
 
 
-def plan_process(pipe, agent_pos, jobs, alloc_jobs, idle_goals, grid, fname):
+def plan_with_fallback(engine, agent_pos, jobs, alloc_jobs, idle_goals, grid, fname, time_limit=0, suboptimality=1,
+                       seed=None):
     config = generate_config()
     config['filename_pathsave'] = fname
+    config['time_limit'] = time_limit
+    config['suboptimality'] = suboptimality
     try:
         (agent_job,
          agent_idle,
@@ -34,21 +35,84 @@ def plan_process(pipe, agent_pos, jobs, alloc_jobs, idle_goals, grid, fname):
                        alloc_jobs,
                        idle_goals,
                        grid,
-                       config)
+                       config,
+                       engine=engine,
+                       seed=seed)
     except Exception as e:
         # Could not find a solution, returning just anything .. TODO: something better?
-        logging.warning("Could not find a solution, returning just anything \n", str(e))
-        agent_job = []
-        for a in agent_pos:
-            agent_job.append(tuple(a))
-        agent_job[0] = (0,)
-        agent_idle = ()
+        logging.warning("Could not find a solution, returning just anything \n" + str(e))
+        agent_job = [()] * len(agent_pos)
+        for i_a, i_j in alloc_jobs:  # cars on their route keep it
+            agent_job[i_a] = (i_j,)
+        if jobs and not agent_job[0] and 0 not in map(lambda aj: aj[1], alloc_jobs):
+            agent_job[0] = (0,)
+        agent_job = tuple(agent_job)
+        agent_idle = tuple(() for _ in agent_pos)
         paths = get_paths(comp2condition(agent_pos, jobs, alloc_jobs, idle_goals, grid),
-                          comp2state(tuple(agent_job), agent_idle, ()))
+                          comp2state(agent_job, agent_idle, ()))
+        if paths is False:
+            paths = [()] * len(agent_pos)
 
-    pipe.send((agent_job,
-               agent_idle,
-               paths))
+    return agent_job, agent_idle, paths
+
+
+def get_seed(agent_job, agent_idle, planned_jobs, planned_idle_goals, jobs, idle_goals):
+    """The allocations of the last plan with the indices of the routes planned now"""
+    def indices(assignment, planned, routes):
+        return tuple(map(lambda i: routes.index(planned[i]),
+                         filter(lambda i: i < len(planned) and planned[i] in routes, assignment)))
+
+    return (tuple(map(lambda aj: indices(aj, planned_jobs, jobs), agent_job)),
+            tuple(map(lambda ai: indices(ai, planned_idle_goals, idle_goals), agent_idle)))
+
+
+def continue_paths(car: Car, pose: tuple, paths: list, i: float, planned: list):
+    """
+    The planned paths of a car from where it is now. The plan starts at the pose of the snapshot, but the car
+    may have followed its old paths since. Where they are the same the car already did what the plan says,
+    from where they differ it goes back the way it came and then follows the plan.
+
+    Args:
+      car: the car
+      pose: where it was at the snapshot
+      paths: its (flattened) paths at the snapshot
+      i: the step on them at the snapshot
+      planned: its paths in the plan
+
+    Returns:
+      the paths (a single path) or None if it is not known how the car got to where it is
+    """
+    now = car.to_tuple()
+    if now == pose:
+        return planned
+    if not paths or car.paths is not paths:
+        return None
+    first = min(int(np.floor(i)), len(paths) - 1)
+    last = min(int(np.floor(car.i)), len(paths) - 1)
+    came = [pose] + list(map(lambda p: tuple(p[0:2]), paths[first + 1:last + 1]))
+    if now not in came:
+        return None
+    came = came[:len(came) - came[::-1].index(now)]  # the car may have stopped before (at the goal of its route)
+    poses = list(map(lambda p: tuple(p[0:2]), [p for path in planned for p in path]))
+    if not poses:
+        return [[now + (0,)]]  # nothing planned, it stays
+    if poses[0] != pose:
+        return None
+    n_same = 1
+    while n_same < min(len(came), len(poses)) and came[n_same] == poses[n_same]:
+        n_same += 1
+    poses = list(reversed(came[n_same - 1:])) + poses[n_same:]
+    return [list(map(lambda t_p: t_p[1] + (t_p[0],), enumerate(poses)))]
+
+
+def keeps_routes_on_the_way(cars: list, agent_job: tuple, planned_jobs: list) -> bool:
+    """Whether all cars that are on their route now do this job first in the plan (they may have started since)"""
+    for i_car, car in enumerate(cars):
+        route = car.get_route()
+        if route is not None and route.is_on_route():
+            if route not in planned_jobs or agent_job[i_car][:1] != (planned_jobs.index(route),):
+                return False
+    return True
 
 
 def get_routes_to_plan(routes):
@@ -67,20 +131,28 @@ def get_car_from_assignments(assignments, i_to_find, cars):
 
 
 class Cbsext(Module):
-    def __init__(self, grid):
+    def __init__(self, grid, time_limit=0, suboptimality=1, warm_start=False, asynchronous=False,
+                 fname="process_test.paths"):
         # params
         self.agent_job = ()
         self.agent_idle = ()
         self.paths = ()
         self.grid = grid
+        self.time_limit = time_limit  # seconds per planning, the best plan found until then is used
+        self.suboptimality = suboptimality
+        self.warm_start = warm_start  # replan from the last plan, only repairing what changed
+        self.planned_jobs = []  # routes of the jobs and idle goals in the last plan
+        self.planned_idle_goals = []
 
         # data
-        self.fname = "process_test.pkl"
-        # if os.path.exists(self.fname):
-        #     os.remove(self.fname)
+        self.fname = fname  # path store file of the planner ('' for none)
         self.plan_params_hash = False
-        self.process = False
+        self.engine = PlannerEngine()  # workers are kept for all plannings
         self.lock = Lock()
+        # planning in the background, the simulation uses the most recent plan
+        self.service = PlanningService(self.plan_snapshot, self.on_plan) if asynchronous else None
+        self.applied_version = 0
+        self.cars = None  # of the last update, plans finished in between are applied to them
 
     def which_car(self, cars: list, route_todo: Route, routes: list) -> Car:
         idle_goals, jobs, routes = self.split_routes(routes)
@@ -88,16 +160,13 @@ class Cbsext(Module):
         assert len(routes) > 0, "No routes to work with"
         self.lock.acquire()
         c = False
-        if route_todo in jobs:
-            i_j = jobs.index(route_todo)
+        if route_todo in self.planned_jobs:
+            i_j = self.planned_jobs.index(route_todo)
             c = get_car_from_assignments(self.agent_job, i_j, cars)
-            self.lock.release()
-        elif route_todo in idle_goals:
-            i_ig = idle_goals.index(route_todo)
+        elif route_todo in self.planned_idle_goals:
+            i_ig = self.planned_idle_goals.index(route_todo)
             c = get_car_from_assignments(self.agent_idle, i_ig, cars)
-            self.lock.release()
-        else:
-            self.lock.release()
+        self.lock.release()
         return c
 
     def split_routes(self, routes):
@@ -111,6 +180,9 @@ class Cbsext(Module):
 
     def update_plan(self, cars, routes):
         self.lock.acquire()
+        if self.service is not None:
+            self.cars = cars
+            self.apply_latest(cars)
         idle_goal_routes, jobs_routes, routes = self.split_routes(routes)
         if len(routes) < len(cars):  # to few jobs
             self.lock.release()
@@ -119,11 +191,18 @@ class Cbsext(Module):
             self.lock.release()
             return
 
-        if self.process:
-            while self.process.is_alive():
-                logging.warning("waiting (is already planning)")
-                time.sleep(.4)
+        snapshot = self.get_snapshot(cars, jobs_routes, idle_goal_routes)
+        self.plan_params_hash = list_hash(cars + routes)  # how we have planned last time TODO: idle_goals
+        if self.service is not None:
+            self.service.submit(snapshot)  # the plan is applied in one of the next updates
+        else:
+            planning_start = datetime.datetime.now()
+            self.apply(cars, snapshot, self.plan_snapshot(snapshot))
+            logging.info("Planning took %.4fs" % (datetime.datetime.now() - planning_start).total_seconds())
+        self.lock.release()
 
+    def get_snapshot(self, cars, jobs_routes, idle_goal_routes) -> dict:
+        """Everything to plan for the current state of the cars and routes"""
         job_goals_and_agents = []
 
         agent_pos = []
@@ -144,39 +223,78 @@ class Cbsext(Module):
                 job_goals_and_agents.append(r.goal)
                 if r.is_on_route():
                     alloc_jobs.append((get_car_i(cars, r.car), i_route))
+        planned_idle_goals = []
         for i_idle_goals in range(len(idle_goal_routes)):
             ig = idle_goal_routes[i_idle_goals]
             if ig.goal not in job_goals_and_agents:  # we only consider idle goals where no car goes or is anyway :)
                 idle_goals.append(ig.to_tuple())
+                planned_idle_goals.append(ig)
 
-        planning_start = datetime.datetime.now()
-        parent_conn, child_conn = Pipe()
-        self.process = Process(target=plan_process,
-                               args=(child_conn,
-                                     agent_pos,
-                                     jobs,
-                                     alloc_jobs,
-                                     idle_goals,
-                                     self.grid,
-                                     self.fname)
-                               )
-        self.process.name = "cbs_ext planner"
-        self.process.start()
-        # logging.debug("process started")
-        (self.agent_job,
-         self.agent_idle,
-         self.paths) = parent_conn.recv()
-        # logging.debug("process received")
-        self.process.join(timeout=1)
-        # logging.debug("process joined")
-        self.process.terminate()
-        # logging.debug("process terminated")
+        seed = None
+        if self.warm_start and self.agent_job:
+            seed = get_seed(self.agent_job, self.agent_idle, self.planned_jobs, self.planned_idle_goals,
+                            jobs_routes, planned_idle_goals)
+        return {'agent_pos': agent_pos,
+                'car_paths': list(map(lambda c: (c.paths, c.i if c.paths else 0.), cars)),
+                'jobs': jobs,
+                'alloc_jobs': alloc_jobs,
+                'idle_goals': idle_goals,
+                'seed': seed,
+                'planned_jobs': list(jobs_routes),
+                'planned_idle_goals': planned_idle_goals}
 
-        logging.info("Planning took %.4fs" % (datetime.datetime.now() - planning_start).total_seconds())
+    def plan_snapshot(self, snapshot: dict) -> tuple:
+        return plan_with_fallback(self.engine,
+                                  snapshot['agent_pos'],
+                                  snapshot['jobs'],
+                                  snapshot['alloc_jobs'],
+                                  snapshot['idle_goals'],
+                                  self.grid,
+                                  self.fname,
+                                  self.time_limit,
+                                  self.suboptimality,
+                                  snapshot['seed'])
 
-        # save the paths in cars
+    def apply(self, cars, snapshot: dict, res: tuple):
+        """Use this plan and save the paths in the cars"""
+        (self.agent_job,
+         self.agent_idle,
+         self.paths) = res
+        self.planned_jobs = snapshot['planned_jobs']
+        self.planned_idle_goals = snapshot['planned_idle_goals']
         for i_car in range(len(cars)):
             cars[i_car].set_paths(self.paths[i_car])
 
-        self.plan_params_hash = list_hash(cars + routes)  # how we have planned last time TODO: idle_goals
-        self.lock.release()
+    def apply_latest(self, cars):
+        """Use the most recent plan of the planning service if it is new, continued from where the cars are now"""
+        plan_result = self.service.latest()
+        if plan_result is None or plan_result.version <= self.applied_version:
+            return
+        agent_job, agent_idle, paths = plan_result.result
+        snapshot = plan_result.snapshot
+        paths = list(map(lambda i_c: continue_paths(cars[i_c], snapshot['agent_pos'][i_c],
+                                                    *snapshot['car_paths'][i_c], paths[i_c]),
+                         range(len(cars))))
+        if None in paths or not keeps_routes_on_the_way(cars, agent_job, snapshot['planned_jobs']):
+            if plan_result.version == self.service.version:
+                self.plan_params_hash = False  # can not continue the plan, plan again
+            return
+        self.apply(cars, snapshot, (agent_job, agent_idle, paths))
+        self.applied_version = plan_result.version
+        logging.info("Using plan %d, staleness %.4fs" % (plan_result.version, staleness(plan_result)))
+
+    def on_plan(self, plan_result):
+        """A plan was finished in the background: apply it now, not only at the next update"""
+        with self.lock:
+            if self.cars is None:
+                return
+            Route.lock.acquire()  # not while cars are moved
+            try:
+                self.apply_latest(self.cars)
+            finally:
+                Route.lock.release()
+
+    def close(self):
+        if self.service is not None:
+            self.service.close()
+        self.engine.close()
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+
+from simple_simulation.event_simulation_test import IDLE_GOALS, get_jobs
+from simple_simulation.mod_cbsextension import Cbsext, continue_paths
+from simple_simulation.route import Car
+from simple_simulation.simulation import SimpSim, set_speed_multiplier
+
+
+class MovedCar(Car):
+    def __init__(self, paths, i):
+        self.paths = paths
+        self.i = i
+        self.pose = paths[int(i)][0:2]
+
+
+def test_continue_paths():
+    old = [(0, 0, 0), (0, 1, 1), (0, 2, 2), (0, 3, 3)]
+    planned = [[(0, 0, 0), (0, 1, 1), (1, 1, 2)], [(2, 1, 3)]]
+    car = MovedCar(old, 0)
+    assert continue_paths(car, (0, 0), old, 0, planned) is planned, "Did not move, the plan is used as it is"
+    car = MovedCar(old, 1.5)
+    assert continue_paths(car, (0, 0), old, 0, planned) == [[(0, 1, 0), (1, 1, 1), (2, 1, 2)]], \
+        "Moved like planned, should continue from there"
+    car = MovedCar(old, 3)
+    assert continue_paths(car, (0, 0), old, 0, planned) == [
+        [(0, 3, 0), (0, 2, 1), (0, 1, 2), (1, 1, 3), (2, 1, 4)]], "Should go back to where it left the plan"
+    assert continue_paths(car, (0, 0), old, 0, [()]) == [[(0, 3, 0)]], "Nothing planned, it stays"
+    assert continue_paths(car, (0, 0), list(old), 0, planned) is None, "Other paths, the way it came is unknown"
+
+
+class SlowCbsext(Cbsext):
+    """Plans take longer than a step of the simulation, counts the plans applied after the cars moved"""
+
+    def __init__(self, grid):
+        super().__init__(grid, asynchronous=True, fname='')
+        self.n_moved = 0
+
+    def plan_snapshot(self, snapshot):
+        time.sleep(.2)
+        return super().plan_snapshot(snapshot)
+
+    def apply(self, cars, snapshot, res):
+        if snapshot['agent_pos'] != list(map(lambda c: c.to_tuple(), cars)):
+            self.n_moved += 1
+        super().apply(cars, snapshot, res)
+
+
+def test_cbsext_asynchronous():
+    size = 10
+    grid = np.zeros([size, size, 51])
+    jobs = get_jobs(4, size, seed=1, n_cars=3)
+    mod = SlowCbsext(grid)
+    sim_time = SimpSim.sim_time
+    SimpSim.sim_time = .05
+    sim = SimpSim(False, mod)
+    set_speed_multiplier(10)  # a step per iteration
+    sim.start_sim(size, size, 3)
+    try:
+        sim.new_idle_goal(IDLE_GOALS[0], (15, 3), 1000)
+        for i_j, (a, b) in enumerate(jobs):
+            sim.new_job(a, b, i_j)
+            time.sleep(.1)  # the cars are moving when the next jobs come in
+        start = time.time()
+        while not all(map(sim.is_finished, range(len(jobs)))):
+            assert time.time() - start < 30, "All jobs should be finished"
+            time.sleep(.1)
+    finally:
+        mod.close()
+        sim.stop_sim()
+        SimpSim.sim_time = sim_time
+        set_speed_multiplier(1)
+    assert mod.applied_version > 0, "Plans should be applied"
+    assert mod.n_moved > 0, "Plans should be applied although the cars moved while planning"
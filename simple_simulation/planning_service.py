@@ -0,0 +1,150 @@
+import logging
+import time
+from collections import namedtuple, deque
+from threading import Condition, Thread
+
+from tools import ColoredLogger
+
+logging.setLoggerClass(ColoredLogger)
+
+MAX_LATENCIES = 1000  # latencies of the most recent plans that are kept
+
+PlanResult = namedtuple('PlanResult', ['version', 'snapshot', 'result', 'submitted', 'started', 'finished'])
+PlanResult.__doc__ = """A completed plan: the result of planning the snapshot of this version and when
+it was submitted, started and finished (time.time())"""
+
+
+def latency(plan_result: PlanResult) -> float:
+    """Seconds from submitting the snapshot to the finished plan"""
+    return plan_result.finished - plan_result.submitted
+
+
+def staleness(plan_result: PlanResult, now: float = None) -> float:
+    """Age of the snapshot a plan was made for [s]"""
+    return (time.time() if now is None else now) - plan_result.submitted
+
+
+class PlanningService(object):
+    """
+    Plans in a background thread, so that the caller never waits for the planner.
+    Snapshots of the world are submitted, and only the latest one is planned: snapshots submitted while
+    planning replace each other (they are coalesced). The most recent completed plan can be read at any time.
+    """
+
+    def __init__(self, plan_fun, on_result=None, max_latencies: int = MAX_LATENCIES):
+        """
+        Args:
+          plan_fun: snapshot -> result, is called in the planning thread
+          on_result: PlanResult -> None, is called in the planning thread for every completed plan (Default: none)
+          max_latencies: number of the most recent latencies kept in `latencies`
+        """
+        self.plan_fun = plan_fun
+        self.on_result = on_result
+        self.condition = Condition()
+        self.version = 0  # of the last submitted snapshot
+        self.pending = None  # (version, snapshot, submitted) to plan next
+        self.result = None  # the last completed PlanResult
+        self.n_planned = 0
+        self.n_coalesced = 0  # snapshots that were replaced before they were planned
+        self.n_failed = 0
+        self.latencies = deque(maxlen=max_latencies)  # of the most recent plans
+        self.latency_sum = 0.  # of all plans
+        self.latency_max = 0.
+        self.running = True
+        self.thread = Thread(target=self.run, name="planning_service", daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot) -> int:
+        """
+        Plan this snapshot (instead of one that is still waiting)
+
+        Returns:
+          the version of this snapshot
+        """
+        with self.condition:
+            self.version += 1
+            if self.pending is not None:
+                self.n_coalesced += 1
+            self.pending = (self.version, snapshot, time.time())
+            self.condition.notify_all()
+            return self.version
+
+    def latest(self) -> PlanResult:
+        """The most recent completed plan (or None), without waiting"""
+        return self.result
+
+    def wait(self, version: int = None, timeout: float = None) -> PlanResult:
+        """
+        Wait for a plan of at least this version
+
+        Args:
+          version: the version to wait for (Default: the last submitted one)
+          timeout: maximum time to wait [s] (Default: no limit)
+
+        Returns:
+          the most recent completed plan (it may be older after the timeout)
+        """
+        with self.condition:
+            version = self.version if version is None else version
+            self.condition.wait_for(lambda: (self.result is not None and self.result.version >= version) or
+                                    not self.running, timeout)
+            return self.result
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None or not self.running)
+                if not self.running:
+                    return
+                version, snapshot, submitted = self.pending
+                self.pending = None
+            started = time.time()
+            try:
+                res = self.plan_fun(snapshot)
+            except Exception as e:
+                logging.error("Planning version %d failed: %s" % (version, str(e)))
+                with self.condition:
+                    self.n_failed += 1
+                    self.condition.notify_all()
+                continue
+            plan_result = PlanResult(version, snapshot, res, submitted, started, time.time())
+            with self.condition:
+                self.result = plan_result
+                self.n_planned += 1
+                self.latencies.append(latency(plan_result))
+                self.latency_sum += latency(plan_result)
+                self.latency_max = max(self.latency_max, latency(plan_result))
+                self.condition.notify_all()
+            logging.info("Plan %d: latency %.4fs (%.4fs waiting)" % (version, latency(plan_result),
+                                                                       started - submitted))
+            if self.on_result is not None:
+                try:
+                    self.on_result(plan_result)
+                except Exception as e:
+                    logging.error("Using plan %d failed: %s" % (version, str(e)))
+
+    def stats(self) -> dict:
+        """Planning metrics, the staleness is that of the most recent plan now"""
+        with self.condition:
+            return {
+                'submitted': self.version,
+                'planned': self.n_planned,
+                'coalesced': self.n_coalesced,
+                'failed': self.n_failed,
+                'latency_mean': self.latency_sum / self.n_planned if self.n_planned else 0.,
+                'latency_max': self.latency_max,
+                'staleness': staleness(self.result) if self.result is not None else 0.,
+                'versions_behind': self.version - self.result.version if self.result is not None else self.version
+            }
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
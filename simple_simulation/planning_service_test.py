@@ -0,0 +1,66 @@
+import time
+from threading import Event
+
+from simple_simulation.planning_service import PlanningService, latency, staleness
+
+
+def test_planning_service():
+    started = Event()
+    release = Event()
+    planned = []
+
+    def plan_fun(snapshot):
+        planned.append(snapshot)
+        started.set()
+        release.wait(5)
+        return snapshot * 2
+
+    with PlanningService(plan_fun) as service:
+        assert service.latest() is None, "Nothing planned yet"
+        service.submit(1)
+        assert started.wait(5), "Should start planning"
+        for snapshot in [2, 3, 4]:  # while planning 1
+            service.submit(snapshot)
+        release.set()
+        plan_result = service.wait(timeout=5)
+        assert plan_result.version == 4, "Should have planned the latest snapshot"
+        assert plan_result.result == 8, "Wrong result"
+        assert planned == [1, 4], "Snapshots submitted while planning should be coalesced"
+        assert latency(plan_result) >= 0, "Latency can not be negative"
+        assert staleness(plan_result) >= latency(plan_result), "The snapshot is older than its plan"
+
+        stats = service.stats()
+        assert stats['planned'] == 2 and stats['coalesced'] == 2, "Wrong stats " + str(stats)
+        assert stats['versions_behind'] == 0, "The latest snapshot is planned"
+
+
+def test_planning_service_non_blocking():
+    def slow_plan(snapshot):
+        time.sleep(.5)
+        return snapshot
+
+    def failing_plan(snapshot):
+        raise RuntimeError("Can not find a solution")
+
+    with PlanningService(slow_plan) as service:
+        start = time.time()
+        service.submit(1)
+        assert service.latest() is None, "Should not wait for the plan"
+        assert time.time() - start < .1, "Submitting should not block"
+        assert service.wait(timeout=5).result == 1, "Should get the plan eventually"
+
+    with PlanningService(failing_plan) as service:
+        service.submit(1)
+        assert service.wait(timeout=.5) is None, "No plan if planning fails"
+        assert service.stats()['failed'] == 1, "The failure should be counted"
+
+
+def test_planning_service_bounded_latencies():
+    with PlanningService(lambda snapshot: snapshot, max_latencies=2) as service:
+        for snapshot in range(5):
+            service.wait(service.submit(snapshot), timeout=5)
+        stats = service.stats()
+        assert stats['planned'] == 5, "Every snapshot should be planned"
+        assert len(service.latencies) == 2, "Only the most recent latencies are kept"
+        assert stats['latency_max'] >= max(service.latencies), "The maximum is over all plans"
+        assert stats['latency_mean'] <= stats['latency_max'], "Mean over all plans"
@@ -1,4 +1,3 @@
-import datetime
 import logging
 import time
 from enum import Enum
@@ -9,6 +8,8 @@ from numpy import linalg
 
 msb = None
 
+STEP_TOLERANCE = 1e-9  # a car this close to a step of its path is at the step (rounding errors of the step sizes)
+
 
 
 class Route(object):
@@ -17,14 +18,15 @@ class Route(object):
 
     def __init__(self, start, goal, _id, s, idle_goal_stats=False):
         self.sim = s
+        self.registry = None  # is told about changes of state and car (see `RouteRegistry`)
 
         self.id = _id
         if idle_goal_stats:
-            self.state = RouteState.IDLE_GOAL_QUEUED
+            self._state = RouteState.IDLE_GOAL_QUEUED
             self.idle_goal_stats = idle_goal_stats
             self.goal = goal
         else:
-            self.state = RouteState.QUEUED
+            self._state = RouteState.QUEUED
 
             assert start.__class__ is tuple, 'Start needs to be a numpy.tuple'
             assert len(start) == 2, 'Start should have 2 coords'
@@ -36,15 +38,35 @@ class Route(object):
             self.vector = tuple(np.array(goal) - np.array(start))
             self.distance = linalg.norm(self.vector)
 
-            self.creation_time = datetime.datetime.now()
+            self.creation_time = self.sim.now()
 
-        self.car = None
+        self._car = None
 
         if self.sim.msb_select:
             global msb
 
         logging.debug("Init:" + str(self))
 
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        if self.registry is not None and state != self._state:
+            self.registry.state_changed(self, self._state, state)
+        self._state = state
+
+    @property
+    def car(self):
+        return self._car
+
+    @car.setter
+    def car(self, car):
+        if self.registry is not None and car is not self._car:
+            self.registry.car_changed(self, self._car, car)
+        self._car = car
+
     def assign_car(self, _car):
         Route.lock.acquire()
         logging.debug("Assigning " + str(_car) + " to " + str(self))
@@ -78,6 +100,8 @@ class Route(object):
         assert self.car, "Should have a car " + str(self)
         i_prev = self.car.i
         self.car.i += step_size
+        if abs(self.car.i - round(self.car.i)) < STEP_TOLERANCE:
+            self.car.i = float(round(self.car.i))
         i_prev_round = int(np.ceil(i_prev))
         i_next_round = int(np.floor(self.car.i))
 
@@ -163,7 +187,7 @@ class Route(object):
         else:
             return tuple([(self.start[0], self.start[1]),
                           (self.goal[0], self.goal[1]),
-                          (datetime.datetime.now() - self.creation_time).total_seconds()])
+                          (self.sim.now() - self.creation_time).total_seconds()])
 
     def __str__(self):
         if self.is_idle_goal():
@@ -220,11 +244,7 @@ class Car(object):
 
     def get_route(self):
         """On which route is this car (if any)"""
-        for r in self.sim.routes:
-            if r.car == self:
-                # assert r.is_running(), "The route having this car should be running"
-                return r
-        return None
+        return self.sim.routes.get_by_car(self)
 
     def __str__(self):
         return "C%d: [%.2f %.2f]" % (self.id, self.pose[0], self.pose[1])
@@ -234,15 +254,16 @@ class Car(object):
 
 
 def free_car(_car: Car):
-    if _car.get_route():
-        assert _car.get_route().is_re_assignable(), "This can only have been on the way or on a idle goal"
-        if _car.get_route().is_idle_goal():
-            _car.get_route().state = RouteState.IDLE_GOAL_QUEUED  # back to queue
+    route = _car.get_route()
+    if route:
+        assert route.is_re_assignable(), "This can only have been on the way or on a idle goal"
+        if route.is_idle_goal():
+            route.state = RouteState.IDLE_GOAL_QUEUED  # back to queue
         else: # normal route
-            _car.get_route().state = RouteState.QUEUED  # Other route is now queued again
+            route.state = RouteState.QUEUED  # Other route is now queued again
 
-        if _car.get_route().car:  # also routes loose their car
-            _car.get_route().car = None
+        if route.car:  # also routes loose their car
+            route.car = None
 
 
 class RouteState(Enum):
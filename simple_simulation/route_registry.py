@@ -0,0 +1,76 @@
+from simple_simulation.route import RouteState
+
+RUNNING_STATES = (RouteState.TO_START, RouteState.ON_ROUTE, RouteState.IDLE_GOAL_RUNNING)
+
+
+class RouteRegistry(object):
+    """
+    The routes of a simulation, indexed by id, by car and by state.
+    Iterating gives the active routes in the order they were added. Finished routes are archived out of them,
+    so that a simulation step does not get slower with every job done. Lookups by id include the archive.
+    Routes report when their state or car changes (see `Route.state` and `Route.car`).
+    """
+
+    def __init__(self):
+        self.active = {}  # id -> route, in the order they were added
+        self.archive = {}  # id -> finished route
+        self.by_car = {}  # car -> the route it is on
+        self.by_state = {s: {} for s in RouteState}  # state -> {id -> route}
+        self.version = 0  # changes with every route, state or car that changes
+
+    def append(self, route):
+        assert route.id not in self.active and route.id not in self.archive, "Route ids must be unique"
+        route.registry = self
+        self.version += 1
+        self.by_state[route.state][route.id] = route
+        if route.is_finished():
+            self.archive[route.id] = route
+        else:
+            self.active[route.id] = route
+        if route.car is not None:
+            self.by_car[route.car] = route
+
+    def __iter__(self):
+        # a copy, routes may be archived while iterating
+        return iter(list(self.active.values()))
+
+    def __len__(self):
+        return len(self.active)
+
+    def get(self, _id):
+        """The route with this id (active or archived), None if there is none"""
+        return self.active.get(_id, self.archive.get(_id))
+
+    def get_by_car(self, car):
+        """The route this car is on (if any)"""
+        return self.by_car.get(car)
+
+    def in_state(self, *states) -> list:
+        """All routes in these states"""
+        return [r for s in states for r in self.by_state[s].values()]
+
+    def running(self) -> list:
+        """All routes that have a car driving"""
+        return self.in_state(*RUNNING_STATES)
+
+    def count(self, state) -> int:
+        return len(self.by_state[state])
+
+    def finished(self) -> list:
+        """All archived routes, in the order they were finished"""
+        return list(self.archive.values())
+
+    def state_changed(self, route, old, new):
+        self.version += 1
+        del self.by_state[old][route.id]
+        self.by_state[new][route.id] = route
+        if new == RouteState.FINISHED:
+            del self.active[route.id]
+            self.archive[route.id] = route
+
+    def car_changed(self, route, old, new):
+        self.version += 1
+        if old is not None and self.by_car.get(old) is route:
+            del self.by_car[old]
+        if new is not None:
+            self.by_car[new] = route
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from simple_simulation.event_simulation import EventSim
+from simple_simulation.mod_nearest import Nearest
+from simple_simulation.route import Route, RouteState, free_car
+from simple_simulation.route_registry import RouteRegistry
+
+
+def get_sim():
+    sim = EventSim(Nearest(np.zeros([10, 10, 51])))
+    sim.start_sim(10, 10, 2)
+    return sim
+
+
+def test_route_registry_indexes():
+    sim = get_sim()
+    routes = [Route((0, 0), (0, 5), 0, sim), Route((1, 0), (1, 5), 1, sim), Route(-1, (9, 9), 7, sim, (15, 3))]
+    for r in routes:
+        sim.routes.append(r)
+    assert list(sim.routes) == routes, "Active routes in the order they were added"
+    assert sim.routes.get(7) is routes[2], "Lookup by id"
+    assert sim.routes.get(3) is None, "No route with this id"
+    assert sim.routes.in_state(RouteState.QUEUED) == routes[:2], "Wrong bucket"
+    assert sim.routes.count(RouteState.IDLE_GOAL_QUEUED) == 1, "Wrong bucket"
+
+    car = sim.cars[0]
+    routes[0].assign_car(car)
+    assert car.get_route() is routes[0], "Lookup by car"
+    assert sim.routes.running() == [routes[0]], "Should be running"
+    routes[1].assign_car(car)  # reassigned
+    assert car.get_route() is routes[1], "The car changed its route"
+    assert routes[0].state == RouteState.QUEUED and routes[0].car is None, "The other route is queued again"
+    assert sim.routes.in_state(RouteState.TO_START) == [routes[1]], "Wrong bucket"
+
+    free_car(car)
+    assert car.get_route() is None, "The car is free"
+    assert sim.routes.count(RouteState.QUEUED) == 2, "Both are queued"
+
+
+def test_route_registry_archive():
+    sim = get_sim()
+    sim.new_job((4, 3), (4, 8), 0)  # the first car is at the start
+    sim.run()
+    assert sim.is_finished(0), "Job should be finished"
+    assert len(sim.routes) == 0, "Finished routes are archived"
+    assert sim.routes.finished() == [sim.routes.get(0)], "The archive has the finished route"
+    assert sim.cars[0].get_route() is None, "The car is free again"
+    assert sim.routes.count(RouteState.FINISHED) == 1, "Wrong bucket"
+
+    registry = RouteRegistry()
+    route = Route((0, 0), (0, 5), 0, sim)
+    registry.append(route)
+    with pytest.raises(AssertionError):  # ids must be unique
+        registry.append(Route((1, 0), (1, 5), 0, sim))
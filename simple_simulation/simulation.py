@@ -1,3 +1,4 @@
+import datetime
 import logging
 import time
 from threading import Lock
@@ -6,7 +7,9 @@ from apscheduler.events import *
 from apscheduler.schedulers.background import BackgroundScheduler
 from numpy import *
 
+from simple_simulation.fleet_state import FleetState
 from simple_simulation.route import Route, RouteState, Car, emit_car
+from simple_simulation.route_registry import RouteRegistry
 
 msb = None
 
@@ -34,7 +37,7 @@ def my_listener(event):
 
 class SimpSim():
     """simulation of multiple AGVs"""
-    routes = []
+    routes = RouteRegistry()
     cars = []
     drive_speed = 2.  # m/s
     speed_multiplier = 1
@@ -44,10 +47,12 @@ class SimpSim():
     i = 0
     start_time = time.time()
 
-    def __init__(self, msb_select: bool, _mod, parent=None):
+    def __init__(self, msb_select: bool, _mod, parent=None, fleet_state: bool = False):
         # QtCore.QThread.__init__(self, parent)
         logging.info("init Simulation")
         self.lock = Lock()
+        self.fleet_state = fleet_state  # move all cars in one vectorized step (see `FleetState`)
+        self.fleet = None
 
         self.msb_select = msb_select
         if msb_select:
@@ -80,6 +85,8 @@ class SimpSim():
             SimpSim.cars.append(c)
             if self.msb_select:
                 emit_car(msb, c)
+        if self.fleet_state:
+            self.fleet = FleetState(SimpSim.cars)
 
         SimpSim.running = True
         if SimpSim.scheduler.running:
@@ -96,8 +103,9 @@ class SimpSim():
     def stop_sim(self):
         SimpSim.running = False
         self.area = False
-        SimpSim.routes = []
+        SimpSim.routes = RouteRegistry()
         SimpSim.cars = []
+        self.fleet = None
         Car.next_id = 0
 
         if SimpSim.scheduler.running:
@@ -109,6 +117,10 @@ class SimpSim():
         logging.info('i*SimTime= ' + str(SimpSim.i * SimpSim.sim_time))
         logging.info('missing: ' + str(time.time() - self.start_time - SimpSim.i * SimpSim.sim_time) + 's')
 
+    def now(self):
+        """Time of the simulation (the wall clock)"""
+        return datetime.datetime.now()
+
     def new_job(self, a, b, job_id):
         self.lock.acquire()
         SimpSim.routes.append(Route(a, b, job_id, self))
@@ -123,9 +135,9 @@ class SimpSim():
 
     def is_finished(self, _id):
         self.lock.acquire()  # TODO: deadlock?
-        route = list(filter(lambda r: r.id == _id, self.routes))
-        assert len(route) == 1, "There should be exactly one route with this id"
-        is_finished = route[0].is_finished()
+        route = self.routes.get(_id)
+        assert route is not None, "There should be a route with this id"
+        is_finished = route.is_finished()
         self.lock.release()
         return is_finished
 
@@ -135,13 +147,14 @@ class SimpSim():
         try:
             if SimpSim.running:
                 self.work_routes()
-                for j in self.routes:
-                    if j.is_running():
-                        j.new_step(
-                            SimpSim.drive_speed *
-                            SimpSim.speed_multiplier *
-                            SimpSim.sim_time
-                        )
+                step_size = SimpSim.drive_speed * SimpSim.speed_multiplier * SimpSim.sim_time
+                if self.fleet is not None:
+                    for c in self.fleet.step(self.routes, step_size):
+                        if self.msb_select:
+                            emit_car(msb, c)
+                else:
+                    for j in self.routes.running():
+                        j.new_step(step_size)
                 if str(self.module.__class__) == "<class 'planner.mod_nearest.Cbsext'>":  # only catching collisions on Cbsext
                     poses = set()
                     for c in self.cars:
@@ -165,26 +178,13 @@ class SimpSim():
                     r.assign_car(c)
 
     def print_debug_info(self):
-        n_queued = 0
-        n_to_start = 0
-        n_on_route = 0
-        n_finished = 0
-        n_ig_queued = 0
-        n_ig_running = 0
-        for r in self.routes:
-            if r.state is RouteState.QUEUED:
-                n_queued += 1
-            elif r.state is RouteState.TO_START:
-                n_to_start += 1
-            elif r.state is RouteState.ON_ROUTE:
-                n_on_route += 1
-            elif r.state is RouteState.FINISHED:
-                n_finished += 1
-            elif r.state is RouteState.IDLE_GOAL_QUEUED:
-                n_ig_queued += 1
-            elif r.state is RouteState.IDLE_GOAL_RUNNING:
-                n_ig_running += 1
-        assert len(self.routes) == n_queued + n_to_start + n_on_route + \
+        n_queued = self.routes.count(RouteState.QUEUED)
+        n_to_start = self.routes.count(RouteState.TO_START)
+        n_on_route = self.routes.count(RouteState.ON_ROUTE)
+        n_finished = self.routes.count(RouteState.FINISHED)
+        n_ig_queued = self.routes.count(RouteState.IDLE_GOAL_QUEUED)
+        n_ig_running = self.routes.count(RouteState.IDLE_GOAL_RUNNING)
+        assert len(self.routes) + len(self.routes.archive) == n_queued + n_to_start + n_on_route + \
                                    n_finished + n_ig_queued + n_ig_running, "Not all routes have a state"
         logging.debug("q:" + str(n_queued) +
                       " | ts:" + str(n_to_start) +